@@ -0,0 +1,40 @@
+"""ix_participant_inbox под фактический порядок инбокса
+
+Revision ID: 20261017_dm_inbox_order
+Revises: 20261017_moi_unique
+Create Date: 2026-10-17
+
+GET /messages/conversations/ сортирует: закреплённые первыми
+(pinned_at IS NULL), затем last_message_at DESC NULLS LAST, затем
+conversation_id. Прежний индекс (user_id, request_status, last_message_at)
+этот порядок не покрывал — Postgres сортировал все диалоги юзера. Новый
+индекс повторяет ORDER BY, keyset-страница читается из него с LIMIT.
+
+Идемпотентна.
+"""
+from alembic import op
+
+
+revision = "20261017_dm_inbox_order"
+down_revision = "20261017_moi_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_participant_inbox")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_participant_inbox "
+        "ON conversation_participants "
+        "(user_id, request_status, (pinned_at IS NULL), last_message_at DESC NULLS LAST, conversation_id) "
+        "WHERE archived_at IS NULL"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_participant_inbox")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_participant_inbox "
+        "ON conversation_participants (user_id, request_status, last_message_at) "
+        "WHERE archived_at IS NULL"
+    )
@@ -0,0 +1,57 @@
+"""conversation_participants: unread_count + last_message_at для инбокса
+
+Revision ID: 20261017_dm_unread
+Revises: 20261017_offer_summary
+Create Date: 2026-10-17
+
+Денормализованные счётчики непрочитанного и время последнего сообщения
+на участнике (см. app/services/messaging.py). Бэкфилл — теми же условиями,
+что count_unread_in_conversation. ix_participant_inbox — под keyset-выдачу
+GET /messages/conversations/.
+
+Идемпотентна.
+"""
+from alembic import op
+
+
+revision = "20261017_dm_unread"
+down_revision = "20261017_offer_summary"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE conversation_participants "
+        "ADD COLUMN IF NOT EXISTS unread_count INTEGER NOT NULL DEFAULT 0"
+    )
+    op.execute(
+        "ALTER TABLE conversation_participants "
+        "ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP"
+    )
+    op.execute(
+        """
+        UPDATE conversation_participants p SET
+            last_message_at = c.last_message_at,
+            unread_count = (
+                SELECT count(*) FROM messages m
+                WHERE m.conversation_id = p.conversation_id
+                  AND m.sender_id <> p.user_id
+                  AND m.deleted_at IS NULL
+                  AND (p.last_read_at IS NULL OR m.created_at > p.last_read_at)
+            )
+        FROM conversations c
+        WHERE c.id = p.conversation_id
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_participant_inbox "
+        "ON conversation_participants (user_id, request_status, last_message_at) "
+        "WHERE archived_at IS NULL"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_participant_inbox")
+    op.execute("ALTER TABLE conversation_participants DROP COLUMN IF EXISTS last_message_at")
+    op.execute("ALTER TABLE conversation_participants DROP COLUMN IF EXISTS unread_count")
@@ -0,0 +1,43 @@
+"""discogs_releases_index.content_hash + discogs_dump_state (delta refresh)
+
+Revision ID: 20261017_dri_content_hash
+Revises: 20260528_store_stats_mv
+Create Date: 2026-10-17
+
+content_hash — 64-битный хэш полей строки дампа (см. _row_hash в
+ingest_discogs_dump). Delta-режим ingest'а сравнивает его с новым дампом и
+пишет только новые/изменённые релизы. У строк, залитых до этой миграции,
+хэш NULL — первый delta-прогон перепишет их один раз.
+
+discogs_dump_state — какая версия дампа сейчас в индексе. dump_version на
+неизменённых строках не трогаем (это был бы rewrite всех 19M строк).
+"""
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "20261017_dri_content_hash"
+down_revision = "20260528_store_stats_mv"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE discogs_releases_index ADD COLUMN IF NOT EXISTS content_hash BIGINT"
+    )
+    op.create_table(
+        "discogs_dump_state",
+        sa.Column("table_name", sa.Text, primary_key=True),
+        sa.Column("dump_version", sa.Date, nullable=False),
+        sa.Column("refreshed_at", sa.DateTime, nullable=False, server_default=sa.text("now()")),
+        sa.Column("rows_inserted", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("rows_updated", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("rows_deleted", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("rows_unchanged", sa.BigInteger, nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("discogs_dump_state")
+    op.execute("ALTER TABLE discogs_releases_index DROP COLUMN IF EXISTS content_hash")
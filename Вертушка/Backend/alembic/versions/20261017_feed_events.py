@@ -0,0 +1,48 @@
+"""feed_events — материализованная лента подписок
+
+Revision ID: 20261017_feed_events
+Revises: 20261017_dm_unread
+Create Date: 2026-10-17
+
+Строка на событие (см. app/services/feed.py). ix_feed_events_actor —
+под LATERAL-выборку страницы по каждой подписке с keyset-курсором
+(created_at, id); уникальность (kind, source_id) делает запись из хуков
+и догоняющий sync идемпотентными.
+
+Таблица создаётся пустой — наполнить:
+    python -m app.scripts.backfill_feed_events
+(дальше её держат хуки записи и часовой reconcile_feed_events).
+"""
+from alembic import op
+
+
+revision = "20261017_feed_events"
+down_revision = "20261017_dm_unread"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feed_events (
+            id              UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            kind            VARCHAR(32) NOT NULL,
+            source_id       UUID NOT NULL,
+            actor_id        UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            created_at      TIMESTAMP NOT NULL,
+            record_id       UUID REFERENCES records(id) ON DELETE SET NULL,
+            target_user_id  UUID REFERENCES users(id) ON DELETE CASCADE,
+            payload         JSONB NOT NULL DEFAULT '{}'::jsonb,
+            CONSTRAINT uq_feed_events_source UNIQUE (kind, source_id)
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_feed_events_actor "
+        "ON feed_events (actor_id, created_at DESC, id DESC)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS feed_events")
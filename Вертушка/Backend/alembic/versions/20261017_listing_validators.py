@@ -0,0 +1,47 @@
+"""store_listings.content_hash + store_page_validators
+
+Revision ID: 20261017_listing_validators
+Revises: 20261017_records_norm
+Create Date: 2026-10-17
+
+Полный обход магазина каждый раз перекачивал и перезаписывал все карточки,
+даже если ничего не поменялось. Теперь:
+  - store_page_validators — ETag / Last-Modified / хэш тела страницы листинга
+    по URL (см. app/services/scrapers/validators.py): не изменилась → только
+    бамп last_seen_at, без парсинга;
+  - store_listings.content_hash — хэш распарсенных полей: upsert переписывает
+    строку и двигает updated_at только если хэш другой.
+
+content_hash добавляется без default — мгновенно, без rewrite таблицы;
+NULL у старых строк значит «первый upsert перезапишет».
+"""
+from alembic import op
+
+
+revision = "20261017_listing_validators"
+down_revision = "20261017_records_norm"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE store_listings ADD COLUMN IF NOT EXISTS content_hash BIGINT")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS store_page_validators (
+            store_id      UUID NOT NULL REFERENCES stores(id) ON DELETE CASCADE,
+            url           TEXT NOT NULL,
+            external_id   VARCHAR(255),
+            etag          TEXT,
+            last_modified TEXT,
+            body_hash     BIGINT,
+            updated_at    TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (store_id, url)
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS store_page_validators")
+    op.execute("ALTER TABLE store_listings DROP COLUMN IF EXISTS content_hash")
@@ -0,0 +1,75 @@
+"""market_offer_index — денормализованный индекс in-stock офферов Маркета
+
+Revision ID: 20261017_market_offer_index
+Revises: 20261017_store_stats_tbl
+Create Date: 2026-10-17
+
+Строка на (дедуп-ключ, класс формата, магазин | NULL = глобально), см.
+app/services/market_index.py. Индексы под чтение market.py / offers.py:
+  - цена и свежесть по глобальным строкам и по строкам магазина (частичные);
+  - trigram по artist/title (pg_trgm уже включён в 20260512_add_store_offers);
+  - dedup_key — для точечной пересборки.
+
+Таблица создаётся пустой — наполнить:
+    python -m app.scripts.rebuild_market_offer_index
+(дальше её держат запись листингов и часовой reconcile).
+"""
+from alembic import op
+
+
+revision = "20261017_market_offer_index"
+down_revision = "20261017_store_stats_tbl"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS market_offer_index (
+            id                  BIGSERIAL PRIMARY KEY,
+            dedup_key           TEXT NOT NULL,
+            fmt                 VARCHAR(16) NOT NULL,
+            store_id            UUID REFERENCES stores(id) ON DELETE CASCADE,
+            record_id           UUID NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+            min_price_rub       NUMERIC(12, 2) NOT NULL,
+            stores_with_stock   INTEGER NOT NULL,
+            cheapest_store_slug VARCHAR(64) NOT NULL,
+            first_seen_at       TIMESTAMP NOT NULL,
+            artist              TEXT,
+            title               TEXT,
+            store_photo         TEXT,
+            format_raw          VARCHAR(255),
+            refreshed_at        TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_moi_dedup_key ON market_offer_index (dedup_key)")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_moi_global_price "
+        "ON market_offer_index (fmt, min_price_rub) WHERE store_id IS NULL"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_moi_global_recent "
+        "ON market_offer_index (fmt, first_seen_at DESC) WHERE store_id IS NULL"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_moi_store_price "
+        "ON market_offer_index (store_id, fmt, min_price_rub) WHERE store_id IS NOT NULL"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_moi_store_recent "
+        "ON market_offer_index (store_id, fmt, first_seen_at DESC) WHERE store_id IS NOT NULL"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_moi_artist_trgm "
+        "ON market_offer_index USING gin (artist gin_trgm_ops)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_moi_title_trgm "
+        "ON market_offer_index USING gin (title gin_trgm_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS market_offer_index")
@@ -0,0 +1,123 @@
+"""market_store_stats: matview → таблица с точечным пересчётом
+
+Revision ID: 20261017_store_stats_tbl
+Revises: 20261017_listing_validators
+Create Date: 2026-10-17
+
+REFRESH MATERIALIZED VIEW CONCURRENTLY каждые 15 минут пересчитывал
+агрегаты по всей store_listings, даже если обошли один магазин. Теперь это
+обычная таблица: строки магазина пересчитываются в транзакции обхода /
+stock-refresh / матчера (app/services/market_stats.py), раз в час —
+полный reconcile. slug/name/logo/rating больше не дублируются — market.py
+джойнит stores.
+"""
+from alembic import op
+
+
+revision = "20261017_store_stats_tbl"
+down_revision = "20261017_listing_validators"
+branch_labels = None
+depends_on = None
+
+
+FILL = """
+INSERT INTO market_store_stats (store_id, in_stock_count, avg_price_rub, new_today_count, refreshed_at)
+SELECT
+    s.id,
+    COUNT(sl.id) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+          AND sl.matched_record_id IS NOT NULL
+          AND sl.price_rub IS NOT NULL
+          AND r.merged_into_id IS NULL
+          AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+    ),
+    AVG(sl.price_rub) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+          AND sl.price_rub IS NOT NULL
+          AND sl.matched_record_id IS NOT NULL
+          AND r.merged_into_id IS NULL
+    ),
+    COUNT(sl.id) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.first_seen_at >= NOW() - INTERVAL '24 hours'
+          AND sl.matched_record_id IS NOT NULL
+          AND sl.price_rub IS NOT NULL
+          AND r.merged_into_id IS NULL
+          AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+    ),
+    NOW()
+FROM stores s
+LEFT JOIN store_listings sl ON sl.store_id = s.id
+LEFT JOIN records r ON r.id = sl.matched_record_id
+WHERE s.is_active = true
+GROUP BY s.id
+ON CONFLICT (store_id) DO NOTHING;
+"""
+
+# Для downgrade — matview из 20260528_store_stats_mv как есть
+CREATE_MV = """
+CREATE MATERIALIZED VIEW market_store_stats AS
+SELECT
+    s.id AS store_id,
+    s.slug,
+    s.name,
+    s.logo_url,
+    s.rating,
+    COUNT(sl.id) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+          AND sl.matched_record_id IS NOT NULL
+          AND sl.price_rub IS NOT NULL
+          AND r.merged_into_id IS NULL
+          AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+    ) AS in_stock_count,
+    AVG(sl.price_rub) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+          AND sl.price_rub IS NOT NULL
+          AND sl.matched_record_id IS NOT NULL
+          AND r.merged_into_id IS NULL
+    ) AS avg_price_rub,
+    COUNT(sl.id) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.first_seen_at >= NOW() - INTERVAL '24 hours'
+          AND sl.matched_record_id IS NOT NULL
+          AND sl.price_rub IS NOT NULL
+          AND r.merged_into_id IS NULL
+          AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+    ) AS new_today_count
+FROM stores s
+LEFT JOIN store_listings sl ON sl.store_id = s.id
+LEFT JOIN records r ON r.id = sl.matched_record_id
+WHERE s.is_active = true
+GROUP BY s.id;
+"""
+
+CREATE_IDX = (
+    "CREATE UNIQUE INDEX ix_market_store_stats_store_id "
+    "ON market_store_stats (store_id);"
+)
+
+
+def upgrade() -> None:
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS market_store_stats CASCADE")
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS market_store_stats (
+            store_id        UUID PRIMARY KEY REFERENCES stores(id) ON DELETE CASCADE,
+            in_stock_count  INTEGER NOT NULL DEFAULT 0,
+            avg_price_rub   NUMERIC(12, 2),
+            new_today_count INTEGER NOT NULL DEFAULT 0,
+            refreshed_at    TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """
+    )
+    op.execute(FILL)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS market_store_stats")
+    op.execute(CREATE_MV)
+    op.execute(CREATE_IDX)
@@ -0,0 +1,47 @@
+"""market_offer_index: уникальный ключ (dedup_key, fmt, магазин | глобально)
+
+Revision ID: 20261017_moi_unique
+Revises: 20261017_feed_events
+Create Date: 2026-10-17
+
+Точечная пересборка индекса идёт параллельно из обходов магазинов, матчера,
+stock-refresh и часового reconcile. DELETE + INSERT без уникального ключа
+под READ COMMITTED оставлял дубли глобальных строк и строк магазина —
+теперь запись идёт upsert'ом по ux_moi_key (см. app/services/market_index.py).
+store_id NULL (глобальная строка) в ключе — через coalesce в ''.
+
+Перед созданием индекса дубли схлопываются (остаётся строка с меньшим id).
+ix_moi_dedup_key больше не нужен — dedup_key ведущий в ux_moi_key.
+
+Идемпотентна.
+"""
+from alembic import op
+
+
+revision = "20261017_moi_unique"
+down_revision = "20261017_feed_events"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        DELETE FROM market_offer_index m
+        USING market_offer_index d
+        WHERE d.dedup_key = m.dedup_key
+          AND d.fmt = m.fmt
+          AND coalesce(d.store_id::text, '') = coalesce(m.store_id::text, '')
+          AND d.id < m.id
+        """
+    )
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_moi_key "
+        "ON market_offer_index (dedup_key, fmt, (coalesce(store_id::text, '')))"
+    )
+    op.execute("DROP INDEX IF EXISTS ix_moi_dedup_key")
+
+
+def downgrade() -> None:
+    op.execute("CREATE INDEX IF NOT EXISTS ix_moi_dedup_key ON market_offer_index (dedup_key)")
+    op.execute("DROP INDEX IF EXISTS ux_moi_key")
@@ -0,0 +1,47 @@
+"""record_offer_summary — агрегаты офферов на discogs_id для Hot Stock pill
+
+Revision ID: 20261017_offer_summary
+Revises: 20261017_market_offer_index
+Create Date: 2026-10-17
+
+Строка на discogs_id (см. app/services/offer_summary.py): exact- и
+alt-счётчики офферов. PK — под batch-чтение POST /records/offers/summary,
+индекс по мастеру — под точечную пересборку прессов мастера.
+
+Таблица создаётся пустой — наполнить:
+    python -m app.scripts.rebuild_record_offer_summary
+(дальше её держат запись листингов и часовой reconcile).
+"""
+from alembic import op
+
+
+revision = "20261017_offer_summary"
+down_revision = "20261017_market_offer_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS record_offer_summary (
+            discogs_id          VARCHAR(50) PRIMARY KEY,
+            discogs_master_id   VARCHAR(50),
+            in_stock_count      INTEGER NOT NULL DEFAULT 0,
+            preorder_count      INTEGER NOT NULL DEFAULT 0,
+            alt_version_count   INTEGER NOT NULL DEFAULT 0,
+            min_price_rub       NUMERIC(12, 2),
+            min_price_alt_rub   NUMERIC(12, 2),
+            stores_with_stock   INTEGER NOT NULL DEFAULT 0,
+            refreshed_at        TIMESTAMP NOT NULL DEFAULT now()
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_ros_master "
+        "ON record_offer_summary (discogs_master_id) WHERE discogs_master_id IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS record_offer_summary")
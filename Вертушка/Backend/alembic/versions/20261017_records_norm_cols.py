@@ -0,0 +1,48 @@
+"""records.catalog_norm / barcode_norm + btree-индексы
+
+Revision ID: 20261017_records_norm
+Revises: 20261017_dri_content_hash
+Create Date: 2026-10-17
+
+Матчер листингов искал catalog через
+upper(regexp_replace(catalog_number, ...)) = :cat — ни один индекс это не
+обслуживает, каждый вызов был seq scan по records. Теперь нормализованные
+значения хранятся в колонках (Record._sync_normalized поддерживает их на
+запись) и ищутся по btree.
+
+Колонки добавляются без default — мгновенно, без rewrite таблицы.
+Заполнение существующих строк — отдельным resumable скриптом:
+    python -m app.scripts.backfill_record_norms
+
+Индексы частичные (IS NOT NULL) и CONCURRENTLY — records горячая таблица,
+см. 20260526_dedup_idx.
+"""
+from alembic import op
+
+
+revision = "20261017_records_norm"
+down_revision = "20261017_dri_content_hash"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE records ADD COLUMN IF NOT EXISTS catalog_norm VARCHAR(100)")
+    op.execute("ALTER TABLE records ADD COLUMN IF NOT EXISTS barcode_norm VARCHAR(50)")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_records_catalog_norm "
+            "ON records (catalog_norm) WHERE catalog_norm IS NOT NULL"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_records_barcode_norm "
+            "ON records (barcode_norm) WHERE barcode_norm IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_records_barcode_norm")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_records_catalog_norm")
+    op.execute("ALTER TABLE records DROP COLUMN IF EXISTS barcode_norm")
+    op.execute("ALTER TABLE records DROP COLUMN IF EXISTS catalog_norm")
@@ -1,10 +1,11 @@
 """API ачивок (Phase 1)."""
 from __future__ import annotations
 
+import asyncio
 from typing import Iterable
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import Response
 from pydantic import BaseModel
 from sqlalchemy import func, select
@@ -28,7 +29,8 @@ from app.services.achievements.registry import (
     all_definitions,
     get_definition,
 )
-from app.services.achievements.share_card import render_for_format
+from app.services.achievements.share_card import SHARE_CARD_RENDER_VERSION, render_for_format
+from app.services.render_cache import get_or_render, png_response, render_key
 
 
 router = APIRouter()
@@ -330,6 +332,7 @@ async def get_achievement_stats(
 @router.get("/me/share-card/{code}")
 async def get_share_card(
     code: str,
+    request: Request,
     fmt: str = Query("stories", pattern="^(stories|feed|portrait)$"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
@@ -340,6 +343,8 @@ async def get_share_card(
     - `stories` — 1080×1920 (Instagram Stories, TikTok)
     - `feed`    — 1080×1080 (Instagram Feed)
     - `portrait` — 1080×1350 (Instagram Portrait)
+
+    PNG кэшируется на диске по хэшу входов (render_cache), повтор — файл/304.
     """
     defn = get_definition(code)
     if defn is None:
@@ -354,17 +359,29 @@ async def get_share_card(
     if not ua or not ua.is_unlocked:
         raise HTTPException(status_code=403, detail="Ачивка ещё не открыта")
 
-    png_bytes = render_for_format(
-        defn,
-        username=current_user.username,
-        unlocked_at=ua.unlocked_at,
-        fmt=fmt,
-    )
-    return Response(
-        content=png_bytes,
-        media_type="image/png",
-        headers={"Cache-Control": "private, max-age=3600"},
-    )
+    key = render_key("share_card", {
+        "v": SHARE_CARD_RENDER_VERSION,
+        "code": defn.code,
+        "tier": defn.tier.value,
+        "title": defn.title_ru,
+        "icon": defn.icon_slug,
+        "username": current_user.username,
+        "date": ua.unlocked_at.date() if ua.unlocked_at else None,
+        "fmt": fmt,
+    })
+
+    async def render() -> tuple[bytes, bool]:
+        png = await asyncio.to_thread(
+            render_for_format,
+            defn,
+            username=current_user.username,
+            unlocked_at=ua.unlocked_at,
+            fmt=fmt,
+        )
+        return png, True
+
+    rendered = await get_or_render("share_card", key, render)
+    return png_response(request, rendered, key, "private, max-age=3600")
 
 
 @router.get("/by-username/{username}", response_model=MyAchievementsResponse)
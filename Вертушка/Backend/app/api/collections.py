@@ -16,7 +16,9 @@ from app.api.auth import get_current_user
 from app.config import get_settings
 from app.services.exchange import get_usd_rub_rate
 from app.services.cover_storage import ensure_cover_cached
+from app.services.feed import discard_feed_events, record_feed_event
 from app.services.pricing import PricingParams, estimate_rub
+from app.services.public_profile_cache import invalidate_public_profile
 
 
 def _record_rub(record: Record, usd_rub: float, params: PricingParams) -> float:
@@ -111,6 +113,7 @@ async def recalculate_prices(
             item.estimated_price_rub = None
 
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
     return {
         "updated_records": updated_records,
@@ -341,8 +344,13 @@ async def delete_collection(
             detail="Коллекция не найдена"
         )
 
+    item_ids = (
+        await db.scalars(select(CollectionItem.id).where(CollectionItem.collection_id == collection.id))
+    ).all()
+    await discard_feed_events(db, "collection_add", item_ids)
     await db.delete(collection)
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
 
 @router.post("/{collection_id}/items", response_model=CollectionItemResponse, status_code=status.HTTP_201_CREATED)
@@ -435,6 +443,7 @@ async def add_record_to_collection(
 
     # Если в вишлисте - автоматически удаляем (атомарный перенос)
     if wishlist_item:
+        await discard_feed_events(db, "wishlist_add", [wishlist_item.id])
         await db.delete(wishlist_item)
 
     # Пересчитываем цену в рубли (lowest_price из Discogs)
@@ -455,7 +464,18 @@ async def add_record_to_collection(
         estimated_price_rub=estimated_price_rub
     )
     db.add(item)
+    await db.flush()
+    await record_feed_event(
+        db,
+        "collection_add",
+        source_id=item.id,
+        actor_id=current_user.id,
+        created_at=item.added_at,
+        record_id=record.id,
+        payload={"collection_id": str(collection_id)},
+    )
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(item)
 
     # Запускаем фоновое скачивание обложки (если ещё не скачана)
@@ -554,8 +574,10 @@ async def remove_record_from_collection(
             detail="Пластинка не найдена в коллекции"
         )
 
+    await discard_feed_events(db, "collection_add", [item.id])
     await db.delete(item)
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
 
 @router.delete("/{collection_id}/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -596,8 +618,10 @@ async def remove_item_from_collection(
             detail="Элемент не найден в коллекции"
         )
 
+    await discard_feed_events(db, "collection_add", [item.id])
     await db.delete(item)
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
 
 @router.get("/{collection_id}/stats", response_model=CollectionStats)
@@ -20,7 +20,6 @@ from __future__ import annotations
 import asyncio
 import logging
 import uuid
-from datetime import datetime, timedelta
 from typing import Iterable, Literal, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
@@ -51,9 +50,9 @@ NEW_TODAY_HOURS = 24
 # дедупа по master_id вместо record_id) бампаем суффикс — старые ключи
 # в Redis самотухнут по TTL, а свежие запросы сразу получают новую логику.
 CACHE_NS_STORES = "market_stores:v3"
-CACHE_NS_STORE_LISTINGS = "market_store_listings:v4"
-CACHE_NS_SEARCH = "market_search:v5"
-CACHE_TTL_STORES = 1800       # 30 мин — список магазинов меняется редко
+CACHE_NS_STORE_LISTINGS = "market_store_listings:v5"
+CACHE_NS_SEARCH = "market_search:v6"
+CACHE_TTL_STORES = 120        # 2 мин — market_store_stats обновляется на записи, чтение дешёвое
 CACHE_TTL_LISTINGS = 600      # 10 мин — карусели чаще обновляем
 CACHE_TTL_SEARCH = 300        # 5 мин — поиск свежее
 
@@ -81,15 +80,12 @@ _COVER_BRIDGE = (
     "WHEN r.cover_local_path IS NOT NULL "
     "THEN '/' || r.cover_local_path END"
 )
-_COVER_EXPR_LISTING = (
-    f"COALESCE({_COVER_BRIDGE}, r.cover_image_url, sl.raw_payload->>'image_url')"
-)
-# Для /market/search финальный SELECT идёт по agg-CTE (нет `sl` в scope) —
-# store-фото самого дешёвого листинга тащим через agg.chosen_store_photo,
-# чтобы записи только со store-фото (проходят фильтр) не отдавались с NULL
-# cover (баг серых квадратов в search).
-_COVER_EXPR_SEARCH_FINAL = (
-    f"COALESCE({_COVER_BRIDGE}, r.cover_image_url, agg.chosen_store_photo)"
+# Все три эндпоинта читают market_offer_index (alias `m`, см.
+# app/services/market_index.py): store-фото самого дешёвого листинга группы
+# лежит в m.store_photo — записи только со store-фото (проходят фильтр) не
+# отдаются с NULL cover (баг серых квадратов).
+_COVER_EXPR_INDEX = (
+    f"COALESCE({_COVER_BRIDGE}, r.cover_image_url, m.store_photo)"
 )
 
 
@@ -147,36 +143,21 @@ async def _preload_covers_background(record_ids: list[uuid.UUID]) -> None:
             logger.exception("market preload cover failed for record %s", row.id)
 
 
-def _format_clause(fmt: Optional[str]) -> tuple[str, dict]:
-    """Возвращает (SQL fragment, bind params) для фильтра формата."""
+_FMT_KEYS = ("vinyl", "cd", "cassette")
+
+
+def _fmt_key(fmt: Optional[str]) -> str:
+    """Query-param format → market_offer_index.fmt.
+
+    Классы формата (LP/2xLP/EP/... → vinyl, CD/SACD → cd, cassette) и двойной
+    гейт listing.format_raw ↔ record.format_type считаются при сборке индекса
+    (market_index._REBUILD): vinyl-листинг, ошибочно смэтченный на CD-запись,
+    не всплывает под фильтром «Винил» с подписью «CD».
+    """
     if not fmt:
-        return ("", {})
-    if fmt == "vinyl":
-        # LP / 2xLP / 3xLP / EP / Single / Box Set + raw 12"/7"/10".
-        # Двойной гейт: listing format_raw (что распарсил магазин) И, если у
-        # записи есть discogs format_type, он тоже должен быть vinyl. Иначе
-        # vinyl-листинг, ошибочно смэтченный на CD-запись, всплывал бы под
-        # фильтром «Винил» с подписью «CD» (баг рассинхрона listing↔record).
-        return (
-            " AND (sl.format_raw ILIKE ANY(:vinyl_fmts) OR sl.format_raw ~ :vinyl_re)"
-            " AND (r.format_type IS NULL OR r.format_type ILIKE '%vinyl%')",
-            {
-                "vinyl_fmts": ["LP", "2xLP", "3xLP", "EP", "Single", "Box Set"],
-                "vinyl_re": r'^(\d+x?LP|12"|10"|7")',
-            },
-        )
-    if fmt == "cd":
-        return (
-            " AND sl.format_raw ILIKE ANY(:cd_fmts)"
-            " AND (r.format_type IS NULL OR r.format_type ILIKE '%cd%')",
-            {"cd_fmts": ["CD", "2CD", "SACD"]},
-        )
-    if fmt == "cassette":
-        return (
-            " AND sl.format_raw ILIKE 'cassette%'"
-            " AND (r.format_type IS NULL OR r.format_type ILIKE '%cassette%')",
-            {},
-        )
+        return "all"
+    if fmt in _FMT_KEYS:
+        return fmt
     raise HTTPException(400, f"Unknown format filter: {fmt}")
 
 
@@ -208,17 +189,19 @@ async def list_market_stores(
     if cached is not None:
         return [MarketStoreInfo.model_validate(item) for item in cached]
 
-    # WS4.1 — читаем из matview market_store_stats (per-request агрегация
-    # оффлоадится туда; REFRESH каждые ~15м фоновым джобом). FILTER-условия и
-    # временные пороги (7d stale / 24h new) зашиты в саму matview, поэтому
-    # консистентны с каруселями/сеткой. min_in_stock фильтруем при чтении.
+    # WS4.1 — читаем из таблицы market_store_stats: строки магазина
+    # пересчитываются при записи листингов (обход, stock-refresh, матчер),
+    # раз в час — полный reconcile (app/services/market_stats.py). FILTER-
+    # условия и пороги 7d/24h там же, консистентны с каруселями/сеткой.
+    # min_in_stock фильтруем при чтении.
     sql = text(
         """
-        SELECT slug, name, logo_url, rating,
-               in_stock_count, avg_price_rub, new_today_count
-        FROM market_store_stats
-        WHERE in_stock_count >= :min_in_stock
-        ORDER BY rating DESC NULLS LAST, name ASC
+        SELECT s.slug, s.name, s.logo_url, s.rating,
+               m.in_stock_count, m.avg_price_rub, m.new_today_count
+        FROM market_store_stats m
+        JOIN stores s ON s.id = m.store_id AND s.is_active = true
+        WHERE m.in_stock_count >= :min_in_stock
+        ORDER BY s.rating DESC NULLS LAST, s.name ASC
         """
     )
     rows = (
@@ -268,49 +251,37 @@ async def get_store_listings(
     if cached is not None:
         return [MarketCarouselItem.model_validate(item) for item in cached]
 
-    cutoff = datetime.utcnow() - timedelta(days=STALE_AFTER_DAYS)
-    # Outer ORDER BY работает с колонками CTE — без `sl.` префикса.
     order_clause = (
-        "first_seen_at DESC" if sort == "newest"
-        else "price_rub ASC NULLS LAST"
+        "m.first_seen_at DESC" if sort == "newest"
+        else "m.min_price_rub ASC"
     )
 
-    # DISTINCT ON по дедуп-ключу: discogs_master_id если есть, иначе r.id.
-    # Discogs группирует пресс-версии (EU/US, цвета винила) под один master_id —
-    # без этого карусель показывала бы 3-4 идентичные карточки RHCP «Californication
-    # 2024». Внутри master выбираем самый дешёвый листинг.
-    # Опирается на функциональный индекс ix_records_dedup_key (см. миграцию
-    # 20260526_dedup_idx). Без него Postgres делает sort-by-all-rows → таймаут.
+    # Строки магазина в market_offer_index уже дедуплицированы по
+    # COALESCE(discogs_master_id, r.id) (Discogs группирует пресс-версии
+    # EU/US, цвета винила под один master — без этого карусель показывала бы
+    # 3-4 идентичные карточки RHCP «Californication 2024»); внутри master —
+    # самый дешёвый листинг магазина. Читаем по ix_moi_store_price/_recent.
     sql = text(
         f"""
-        WITH ranked AS (
-            SELECT DISTINCT ON (COALESCE(r.discogs_master_id, r.id::text))
-                sl.matched_record_id AS record_id,
-                sl.price_rub,
-                sl.first_seen_at,
-                s.slug AS store_slug,
-                r.discogs_id, r.artist, r.title, r.year,
-                COALESCE(r.format_type, sl.format_raw) AS format_type,
-                {_COVER_EXPR_LISTING} AS cover_image_url
-            FROM store_listings sl
-            JOIN stores s ON s.id = sl.store_id
-            JOIN records r ON r.id = sl.matched_record_id
-            WHERE s.slug = :slug
-              AND s.is_active = true
-              AND sl.status = 'in_stock'
-              AND sl.matched_record_id IS NOT NULL
-              AND sl.price_rub IS NOT NULL
-              AND sl.last_seen_at >= :cutoff
-              AND r.merged_into_id IS NULL
-              AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
-            ORDER BY COALESCE(r.discogs_master_id, r.id::text), sl.price_rub ASC NULLS LAST
-        )
-        SELECT * FROM ranked
+        SELECT
+            m.record_id,
+            m.min_price_rub AS price_rub,
+            m.first_seen_at,
+            m.cheapest_store_slug AS store_slug,
+            r.discogs_id, r.artist, r.title, r.year,
+            COALESCE(r.format_type, m.format_raw) AS format_type,
+            {_COVER_EXPR_INDEX} AS cover_image_url
+        FROM market_offer_index m
+        JOIN stores s ON s.id = m.store_id
+        JOIN records r ON r.id = m.record_id
+        WHERE s.slug = :slug
+          AND s.is_active = true
+          AND m.fmt = 'all'
         ORDER BY {order_clause}
         LIMIT :limit
         """
     )
-    rows = (await db.execute(sql, {"slug": slug, "cutoff": cutoff, "limit": limit})).mappings().all()
+    rows = (await db.execute(sql, {"slug": slug, "limit": limit})).mappings().all()
 
     items = [
         MarketCarouselItem(
@@ -357,59 +328,48 @@ async def get_store_all(
     offset: int = Query(0, ge=0),
     db: AsyncSession = Depends(get_db),
 ) -> list[MarketSearchItem]:
-    fmt_sql, fmt_params = _format_clause(format)
-    cutoff = datetime.utcnow() - timedelta(days=STALE_AFTER_DAYS)
+    fmt = _fmt_key(format)
 
-    # Outer ORDER BY ссылается на CTE-колонки — без `sl.` префикса.
     order_clause = (
-        "price_rub ASC NULLS LAST" if sort == "price_asc"
-        else "first_seen_at DESC"
+        "m.min_price_rub ASC" if sort == "price_asc"
+        else "m.first_seen_at DESC"
     )
 
     q_clause = ""
     q_params: dict = {}
     if q:
-        q_clause = " AND (r.artist ILIKE :q OR r.title ILIKE :q)"
+        q_clause = " AND (m.artist ILIKE :q OR m.title ILIKE :q)"
         q_params["q"] = f"%{q}%"
 
-    # /all — пагинированная витрина. Дедуп по master_id (см. /listings),
-    # filter NULL cover — дырки портят сетку 2-колонок.
+    # /all — пагинированная витрина. Строки магазина из market_offer_index:
+    # дедуп по master_id (см. /listings) и filter NULL cover (дырки портят
+    # сетку 2-колонок) применены при сборке индекса.
     sql = text(
         f"""
-        WITH ranked AS (
-            SELECT DISTINCT ON (COALESCE(r.discogs_master_id, r.id::text))
-                sl.matched_record_id AS record_id,
-                sl.price_rub,
-                sl.first_seen_at,
-                s.slug AS store_slug,
-                r.discogs_id, r.artist, r.title, r.year,
-                COALESCE(r.format_type, sl.format_raw) AS format_type,
-                {_COVER_EXPR_LISTING} AS cover_image_url
-            FROM store_listings sl
-            JOIN stores s ON s.id = sl.store_id
-            JOIN records r ON r.id = sl.matched_record_id
-            WHERE s.slug = :slug
-              AND s.is_active = true
-              AND sl.status = 'in_stock'
-              AND sl.matched_record_id IS NOT NULL
-              AND sl.price_rub IS NOT NULL
-              AND sl.last_seen_at >= :cutoff
-              AND r.merged_into_id IS NULL
-              AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
-              {fmt_sql}
-              {q_clause}
-            ORDER BY COALESCE(r.discogs_master_id, r.id::text), sl.price_rub ASC NULLS LAST
-        )
-        SELECT * FROM ranked
+        SELECT
+            m.record_id,
+            m.min_price_rub AS price_rub,
+            m.first_seen_at,
+            m.cheapest_store_slug AS store_slug,
+            r.discogs_id, r.artist, r.title, r.year,
+            COALESCE(r.format_type, m.format_raw) AS format_type,
+            {_COVER_EXPR_INDEX} AS cover_image_url
+        FROM market_offer_index m
+        JOIN stores s ON s.id = m.store_id
+        JOIN records r ON r.id = m.record_id
+        WHERE s.slug = :slug
+          AND s.is_active = true
+          AND m.fmt = :fmt
+          {q_clause}
         ORDER BY {order_clause}
         LIMIT :limit OFFSET :offset
         """
     )
 
     params = {
-        "slug": slug, "cutoff": cutoff,
+        "slug": slug, "fmt": fmt,
         "limit": limit, "offset": offset,
-        **fmt_params, **q_params,
+        **q_params,
     }
     rows = (await db.execute(sql, params)).mappings().all()
 
@@ -455,18 +415,17 @@ async def search_market(
     Если у юзера пустой `q` — возвращаем последние new-arrivals (sort=newest
     или sort=price_asc по дефолту самые дешёвые сверху).
     """
-    fmt_sql, fmt_params = _format_clause(format)
-    cutoff = datetime.utcnow() - timedelta(days=STALE_AFTER_DAYS)
+    fmt = _fmt_key(format)
 
     order_clause = (
-        "min_price ASC NULLS LAST" if sort == "price_asc"
-        else "first_seen_at DESC"
+        "m.min_price_rub ASC" if sort == "price_asc"
+        else "m.first_seen_at DESC"
     )
 
     q_clause = ""
     q_params: dict = {}
     if q and len(q.strip()) >= 2:
-        q_clause = " AND (r.artist ILIKE :q OR r.title ILIKE :q)"
+        q_clause = " AND (m.artist ILIKE :q OR m.title ILIKE :q)"
         q_params["q"] = f"%{q.strip()}%"
 
     cache_key = f"search:{q or ''}:{format or 'all'}:{sort}:{limit}"
@@ -474,47 +433,30 @@ async def search_market(
     if cached is not None:
         return [MarketSearchItem.model_validate(item) for item in cached]
 
-    # Дедуп: группируем по master_id (с fallback на r.id), чтобы разные
-    # пресс-версии одного альбома не выдавались как идентичные карточки.
-    # Внутри группы выбираем самый дешёвый record через ARRAY_AGG ORDER BY price → [1].
+    # Глобальные строки market_offer_index (store_id IS NULL): одна на
+    # master_id (с fallback на r.id), чтобы разные пресс-версии одного
+    # альбома не выдавались как идентичные карточки; в строке — самый
+    # дешёвый record группы, min-цена и число магазинов. ILIKE идёт по
+    # trigram-индексам на m.artist / m.title, сортировка — по
+    # ix_moi_global_price / ix_moi_global_recent.
     sql = text(
         f"""
-        WITH agg AS (
-            SELECT
-                COALESCE(r.discogs_master_id, r.id::text) AS dedup_key,
-                MIN(sl.price_rub) AS min_price,
-                COUNT(DISTINCT sl.store_id) AS stores_with_stock,
-                MAX(sl.first_seen_at) AS first_seen_at,
-                (ARRAY_AGG(s.slug ORDER BY sl.price_rub ASC NULLS LAST))[1] AS cheapest_store_slug,
-                (ARRAY_AGG(r.id ORDER BY sl.price_rub ASC NULLS LAST))[1] AS chosen_record_id,
-                (ARRAY_AGG(sl.raw_payload->>'image_url' ORDER BY sl.price_rub ASC NULLS LAST))[1] AS chosen_store_photo
-            FROM store_listings sl
-            JOIN stores s ON s.id = sl.store_id
-            JOIN records r ON r.id = sl.matched_record_id
-            WHERE s.is_active = true
-              AND sl.status = 'in_stock'
-              AND sl.matched_record_id IS NOT NULL
-              AND sl.price_rub IS NOT NULL
-              AND sl.last_seen_at >= :cutoff
-              AND r.merged_into_id IS NULL
-              AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
-              {fmt_sql}
-              {q_clause}
-            GROUP BY COALESCE(r.discogs_master_id, r.id::text)
-        )
         SELECT
-            agg.chosen_record_id AS record_id, agg.min_price, agg.stores_with_stock,
-            agg.first_seen_at, agg.cheapest_store_slug,
+            m.record_id, m.min_price_rub AS min_price, m.stores_with_stock,
+            m.first_seen_at, m.cheapest_store_slug,
             r.discogs_id, r.artist, r.title, r.year, r.format_type,
-            {_COVER_EXPR_SEARCH_FINAL} AS cover_image_url
-        FROM agg
-        JOIN records r ON r.id = agg.chosen_record_id
+            {_COVER_EXPR_INDEX} AS cover_image_url
+        FROM market_offer_index m
+        JOIN records r ON r.id = m.record_id
+        WHERE m.store_id IS NULL
+          AND m.fmt = :fmt
+          {q_clause}
         ORDER BY {order_clause}
         LIMIT :limit
         """
     )
 
-    params = {"cutoff": cutoff, "limit": limit, **fmt_params, **q_params}
+    params = {"fmt": fmt, "limit": limit, **q_params}
     rows = (await db.execute(sql, params)).mappings().all()
 
     items = [
@@ -23,9 +23,9 @@ from fastapi import (
 )
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy import select, and_, or_, func
+from sqlalchemy import case, select, and_, or_, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, selectinload
 
 from app.database import get_db
 from app.models.conversation import (
@@ -56,12 +56,13 @@ from app.schemas.message import (
     UnreadCount,
 )
 from app.services.messaging import (
+    blocked_partner_ids,
     check_can_send,
     compute_total_unread,
-    count_unread_in_conversation,
     get_or_create_conversation,
     is_user_blocked,
     mark_read as svc_mark_read,
+    on_message_deleted,
     partner_id_of,
     post_message,
     require_participant,
@@ -194,6 +195,8 @@ def _conv_to_read(
 @router.get("/conversations/", response_model=list[ConversationRead])
 async def list_conversations(
     folder: MessageFolder = Query("primary"),
+    after: UUID | None = Query(None, description="id последнего диалога предыдущей страницы"),
+    limit: int | None = Query(None, ge=1, le=PAGE_LIMIT_MAX),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
@@ -201,67 +204,79 @@ async def list_conversations(
 
     folder=primary — request_status='accepted' и не архивированные
     folder=requests — request_status='pending' и не архивированные
+
+    Сначала закреплённые (Telegram-style), внутри секции — по last_message_at
+    desc. Один запрос: участник + диалог + собеседник + его participant-строка;
+    unread — денормализованный счётчик участника. limit/after — keyset-пагинация
+    (без limit — весь список, как раньше).
     """
-    parts_q = await db.execute(
-        select(ConversationParticipant)
+    me = ConversationParticipant
+    partner_part = aliased(ConversationParticipant)
+    partner_id_expr = case(
+        (Conversation.user_a_id == current_user.id, Conversation.user_b_id),
+        else_=Conversation.user_a_id,
+    )
+    # Порядок 1:1 с ix_participant_inbox: закреплённые, затем по
+    # last_message_at (диалоги без сообщений — в конце), затем по id
+    unpinned = me.pinned_at.is_(None)
+
+    stmt = (
+        select(me, Conversation, User, partner_part)
+        .join(Conversation, Conversation.id == me.conversation_id)
+        .join(User, User.id == partner_id_expr)
+        .outerjoin(
+            partner_part,
+            and_(
+                partner_part.conversation_id == me.conversation_id,
+                partner_part.user_id != current_user.id,
+            ),
+        )
         .where(
-            ConversationParticipant.user_id == current_user.id,
-            ConversationParticipant.archived_at.is_(None),
-            ConversationParticipant.request_status
-            == ("pending" if folder == "requests" else "accepted"),
+            me.user_id == current_user.id,
+            me.archived_at.is_(None),
+            me.request_status == ("pending" if folder == "requests" else "accepted"),
         )
+        .order_by(unpinned, me.last_message_at.desc().nulls_last(), me.conversation_id)
     )
-    parts = parts_q.scalars().all()
-    if not parts:
+    if after is not None:
+        anchor = await db.scalar(
+            select(me).where(me.conversation_id == after, me.user_id == current_user.id)
+        )
+        if anchor is not None:
+            same_group = me.pinned_at.is_(None) if anchor.pinned_at is None else me.pinned_at.isnot(None)
+            if anchor.last_message_at is None:
+                after_in_group = and_(
+                    me.last_message_at.is_(None),
+                    me.conversation_id > anchor.conversation_id,
+                )
+            else:
+                after_in_group = or_(
+                    me.last_message_at < anchor.last_message_at,
+                    me.last_message_at.is_(None),
+                    and_(
+                        me.last_message_at == anchor.last_message_at,
+                        me.conversation_id > anchor.conversation_id,
+                    ),
+                )
+            cond = and_(same_group, after_in_group)
+            if anchor.pinned_at is not None:
+                # За закреплёнными идут все незакреплённые
+                cond = or_(me.pinned_at.is_(None), cond)
+            stmt = stmt.where(cond)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    rows = (await db.execute(stmt)).all()
+    if not rows:
         return []
 
-    conv_ids = [p.conversation_id for p in parts]
-    convs_q = await db.execute(
-        select(Conversation).where(Conversation.id.in_(conv_ids))
-    )
-    convs = {c.id: c for c in convs_q.scalars().all()}
-
-    partner_ids = [partner_id_of(convs[p.conversation_id], current_user.id) for p in parts]
-    partners_q = await db.execute(select(User).where(User.id.in_(partner_ids)))
-    partners = {u.id: u for u in partners_q.scalars().all()}
-
-    # Batch-загрузка participant-строк собеседников для read-receipts
-    partner_parts_q = await db.execute(
-        select(ConversationParticipant).where(
-            ConversationParticipant.conversation_id.in_(conv_ids),
-            ConversationParticipant.user_id != current_user.id,
-        )
+    blocked_ids = await blocked_partner_ids(
+        db, current_user.id, [partner.id for _, _, partner, _ in rows]
     )
-    partner_parts_by_conv = {pp.conversation_id: pp for pp in partner_parts_q.scalars().all()}
-
-    items: list[ConversationRead] = []
-    for p in parts:
-        conv = convs.get(p.conversation_id)
-        if not conv:
-            continue
-        partner = partners.get(partner_id_of(conv, current_user.id))
-        if not partner:
-            continue
-        unread = await count_unread_in_conversation(
-            db, conv.id, current_user.id, p.last_read_at
-        )
-        blocked = await is_user_blocked(db, current_user.id, partner.id)
-        items.append(
-            _conv_to_read(conv, partner, p, partner_parts_by_conv.get(conv.id), unread, blocked)
-        )
-
-    # Сначала закреплённые (Telegram-style), внутри секции — по last_message_at desc
-    from datetime import datetime as _dt
-    fallback = _dt.min
-
-    def sort_key(r: ConversationRead) -> tuple:
-        return (
-            0 if r.pinned else 1,
-            -(r.last_message_at.timestamp() if r.last_message_at else fallback.timestamp()),
-        )
-
-    items.sort(key=sort_key)
-    return items
+    return [
+        _conv_to_read(conv, partner, p, pp, p.unread_count, partner.id in blocked_ids)
+        for p, conv, partner, pp in rows
+    ]
 
 
 @router.post("/conversations/", response_model=ConversationRead, status_code=status.HTTP_200_OK)
@@ -280,9 +295,6 @@ async def create_or_get_conversation(
     await db.refresh(conv)
     await db.refresh(me_part)
 
-    unread = await count_unread_in_conversation(
-        db, conv.id, current_user.id, me_part.last_read_at
-    )
     blocked = await is_user_blocked(db, current_user.id, recipient.id)
     partner_part_q = await db.execute(
         select(ConversationParticipant).where(
@@ -291,7 +303,7 @@ async def create_or_get_conversation(
         )
     )
     partner_part = partner_part_q.scalar_one_or_none()
-    return _conv_to_read(conv, recipient, me_part, partner_part, unread, blocked)
+    return _conv_to_read(conv, recipient, me_part, partner_part, me_part.unread_count, blocked)
 
 
 @router.get("/conversations/{conversation_id}/", response_model=ConversationDetail)
@@ -330,9 +342,6 @@ async def get_conversation_detail(
     msgs_q = await db.execute(msgs_stmt)
     messages = list(reversed(msgs_q.scalars().all()))
 
-    unread = await count_unread_in_conversation(
-        db, conv.id, current_user.id, me_part.last_read_at
-    )
     blocked = await is_user_blocked(db, current_user.id, partner.id)
     partner_part_q = await db.execute(
         select(ConversationParticipant).where(
@@ -349,7 +358,7 @@ async def get_conversation_detail(
             pinned_message = None
     return ConversationDetail(
         conversation=_conv_to_read(
-            conv, partner, me_part, partner_part, unread, blocked, pinned_message,
+            conv, partner, me_part, partner_part, me_part.unread_count, blocked, pinned_message,
         ),
         messages=await _hydrate_message_previews(db, messages),
     )
@@ -630,9 +639,12 @@ async def delete_message(
             status_code=status.HTTP_403_FORBIDDEN, detail="Нельзя удалить чужое сообщение"
         )
 
+    first_delete = message.deleted_at is None
     message.body = None
     message.deleted_at = _dt.utcnow()
     conv_id = message.conversation_id
+    if first_delete:
+        await on_message_deleted(db, message)
     await db.commit()
 
     conv = await db.get(Conversation, conv_id)
@@ -1200,7 +1212,7 @@ async def get_presence(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
 
     last_seen = target.last_seen_at
-    ws_active = messages_ws_hub.has_active(str(user_id))
+    ws_active = await messages_ws_hub.has_active(str(user_id))
     online = ws_active or bool(
         last_seen and last_seen >= _dt.utcnow() - _td(seconds=ONLINE_THRESHOLD_SECONDS)
     )
@@ -74,7 +74,7 @@ def _serialize(n: Notification) -> NotificationResponse:
 
 @router.get("/", response_model=NotificationListResponse)
 async def list_personal(
-    cursor: str | None = Query(None, description="ISO timestamp последнего полученного item"),
+    cursor: str | None = Query(None, description="next_cursor предыдущей страницы"),
     limit: int = Query(20, ge=1, le=50),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
@@ -239,7 +239,7 @@ async def social_feed(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Лента подписок (вкладка «Подписки»). Генерируется on-the-fly, без записи в БД."""
+    """Лента подписок (вкладка «Подписки»). Читается из feed_events, см. app/services/feed.py."""
     raw_items, next_cursor = await get_social_feed(
         db,
         user_id=current_user.id,
@@ -35,7 +35,7 @@ from app.schemas.offer import (
     StoreInfo,
 )
 from app.services.affiliate import wrap_url
-from app.services.cache import cache
+from app.services.cache import TTL_OFFERS_SUMMARY, cache
 
 logger = logging.getLogger(__name__)
 
@@ -227,9 +227,10 @@ async def get_market_new_arrivals(
     """
     Возвращает последние N листингов со статусом in_stock из всех активных магазинов.
 
-    Дедуп по `matched_record_id`: на одну запись отдаём только самый дешёвый листинг
-    из всех магазинов. Сортировка — по дате появления листинга в БД (новинки в продаже
-    сверху). Это даёт «N разных пластинок» в карусели, а не «N дублей одной обложки».
+    Дедуп по мастер-релизу (`COALESCE(discogs_master_id, record_id)`): на одну
+    группу отдаём только самый дешёвый листинг из всех магазинов. Сортировка —
+    по дате появления листинга в БД (новинки в продаже сверху). Это даёт
+    «N разных пластинок» в карусели, а не «N дублей одной обложки».
 
     Кэш — Redis, TTL 15 минут. Инвалидируется при `parse_listing` через
     `invalidate_market_feed` (по аналогии с `invalidate_record_offers`).
@@ -239,53 +240,41 @@ async def get_market_new_arrivals(
     if cached is not None:
         return [MarketCarouselItem.model_validate(item) for item in cached]
 
-    cutoff = datetime.utcnow() - timedelta(days=STALE_AFTER_DAYS)
-
-    # Сначала находим минимальную цену на каждую matched запись — это
-    # дешевле, чем тянуть все листинги и группировать в Python.
-    # DISTINCT ON по matched_record_id + ORDER BY price даёт нам по
-    # одному (самому дешёвому) листингу на запись.
+    # Глобальные строки market_offer_index (app/services/market_index.py):
+    # одна на мастер-релиз, уже с самым дешёвым листингом группы — читаем по
+    # ix_moi_global_recent без группировки store_listings на запрос.
     sql = text(
         """
-        WITH ranked AS (
-            SELECT DISTINCT ON (sl.matched_record_id)
-                sl.matched_record_id AS record_id,
-                sl.price_rub,
-                sl.first_seen_at,
-                s.slug AS store_slug,
-                r.discogs_id,
-                r.artist,
-                r.title,
-                r.year,
-                -- Формат: приоритет у records.format_type (богаче, из Discogs),
-                -- fallback на sl.format_raw (что определил парсер магазина).
-                -- Без fallback почти все карточки приходили с NULL format_type
-                -- т.к. Discogs API search не возвращает формат в search-результате,
-                -- а matcher._save_discogs_result создаёт Record без format_type.
-                COALESCE(r.format_type, sl.format_raw) AS format_type,
-                -- Обложка: симметрично с format_type. Discogs search возвращает
-                -- cover_image не для всех релизов (особенно re-issues и нишевые
-                -- лейблы). Парсер магазина сохраняет og:image в raw_payload —
-                -- используем его как fallback, чтобы карточка не была пустой
-                -- (фиолетовый placeholder в AutoRail).
-                COALESCE(r.cover_image_url, sl.raw_payload->>'image_url') AS cover_image_url
-            FROM store_listings sl
-            JOIN stores s ON s.id = sl.store_id
-            JOIN records r ON r.id = sl.matched_record_id
-            WHERE sl.status = 'in_stock'
-              AND sl.matched_record_id IS NOT NULL
-              AND sl.price_rub IS NOT NULL
-              AND sl.last_seen_at >= :cutoff
-              AND s.is_active = true
-            ORDER BY sl.matched_record_id, sl.price_rub ASC NULLS LAST
-        )
-        SELECT *
-        FROM ranked
-        ORDER BY first_seen_at DESC
+        SELECT
+            m.record_id,
+            m.min_price_rub AS price_rub,
+            m.first_seen_at,
+            m.cheapest_store_slug AS store_slug,
+            r.discogs_id,
+            r.artist,
+            r.title,
+            r.year,
+            -- Формат: приоритет у records.format_type (богаче, из Discogs),
+            -- fallback на format_raw листинга (что определил парсер магазина).
+            -- Без fallback почти все карточки приходили с NULL format_type
+            -- т.к. Discogs API search не возвращает формат в search-результате,
+            -- а matcher._save_discogs_result создаёт Record без format_type.
+            COALESCE(r.format_type, m.format_raw) AS format_type,
+            -- Обложка: симметрично с format_type. Discogs search возвращает
+            -- cover_image не для всех релизов (особенно re-issues и нишевые
+            -- лейблы). Парсер магазина сохраняет og:image в raw_payload —
+            -- индекс держит его как store_photo, чтобы карточка не была пустой
+            -- (фиолетовый placeholder в AutoRail).
+            COALESCE(r.cover_image_url, m.store_photo) AS cover_image_url
+        FROM market_offer_index m
+        JOIN records r ON r.id = m.record_id
+        WHERE m.store_id IS NULL
+          AND m.fmt = 'all'
+        ORDER BY m.first_seen_at DESC
         LIMIT :limit
         """
     )
-    rows = (await db.execute(sql, {"cutoff": cutoff, "limit": limit})).mappings().all()
+    rows = (await db.execute(sql, {"limit": limit})).mappings().all()
 
     items = [
         MarketCarouselItem(
@@ -356,8 +345,8 @@ async def invalidate_record_offers(discogs_id: str) -> None:
 # ============================================================================
 
 
-OFFERS_SUMMARY_CACHE_NS = "offers_summary"
-OFFERS_SUMMARY_CACHE_TTL = 600  # 10 мин — summary держится дольше чем offers (короче TTL)
+OFFERS_SUMMARY_CACHE_NS = "offers_summary"  # per-discogs_id ключи, + L1 (см. cache._L1_NAMESPACES)
+OFFERS_SUMMARY_CACHE_TTL = TTL_OFFERS_SUMMARY
 
 
 @router.post(
@@ -380,83 +369,48 @@ async def get_records_offers_summary(
     if not body.discogs_ids:
         return {}
 
-    cutoff = datetime.utcnow() - timedelta(days=STALE_AFTER_DAYS)
-
-    # Один SQL — JOIN records → store_listings, agg по discogs_id, GROUP BY.
-    # Параллельно considering alt-versions через master_id self-join.
-    sql = text(
-        """
-        WITH target_records AS (
-            SELECT id, discogs_id, discogs_master_id
-            FROM records
-            WHERE discogs_id = ANY(:discogs_ids)
-        ),
-        exact_stats AS (
-            SELECT
-                tr.discogs_id,
-                COUNT(*) FILTER (
-                    WHERE sl.status = 'in_stock' AND sl.last_seen_at >= :cutoff
-                ) AS in_stock_count,
-                COUNT(*) FILTER (
-                    WHERE sl.status = 'preorder' AND sl.last_seen_at >= :cutoff
-                ) AS preorder_count,
-                MIN(sl.price_rub) FILTER (
-                    WHERE sl.status = 'in_stock' AND sl.last_seen_at >= :cutoff
-                      AND sl.price_rub IS NOT NULL
-                ) AS min_price_rub,
-                COUNT(DISTINCT sl.store_id) FILTER (
-                    WHERE sl.status = 'in_stock' AND sl.last_seen_at >= :cutoff
-                ) AS stores_with_stock
-            FROM target_records tr
-            LEFT JOIN store_listings sl ON sl.matched_record_id = tr.id
-            GROUP BY tr.discogs_id
-        ),
-        alt_stats AS (
-            -- Другой pressing того же master_id: r2.discogs_id != tr.discogs_id
-            -- но r2.discogs_master_id = tr.discogs_master_id (если есть master_id)
-            SELECT
-                tr.discogs_id,
-                COUNT(*) FILTER (
-                    WHERE sl.status = 'in_stock' AND sl.last_seen_at >= :cutoff
-                ) AS alt_version_count,
-                MIN(sl.price_rub) FILTER (
-                    WHERE sl.status = 'in_stock' AND sl.last_seen_at >= :cutoff
-                      AND sl.price_rub IS NOT NULL
-                ) AS min_price_alt_rub
-            FROM target_records tr
-            LEFT JOIN records r2
-                ON r2.discogs_master_id = tr.discogs_master_id
-               AND r2.discogs_master_id IS NOT NULL
-               AND r2.discogs_id != tr.discogs_id
-            LEFT JOIN store_listings sl ON sl.matched_record_id = r2.id
-            GROUP BY tr.discogs_id
-        )
-        SELECT
-            es.discogs_id,
-            COALESCE(es.in_stock_count, 0)      AS in_stock_count,
-            COALESCE(es.preorder_count, 0)      AS preorder_count,
-            COALESCE(als.alt_version_count, 0)  AS alt_version_count,
-            es.min_price_rub,
-            als.min_price_alt_rub,
-            FALSE AS has_last_one,
-            COALESCE(es.stores_with_stock, 0)   AS stores_with_stock
-        FROM exact_stats es
-        LEFT JOIN alt_stats als ON als.discogs_id = es.discogs_id
-        """
-    )
-    rows = (await db.execute(sql, {"discogs_ids": body.discogs_ids, "cutoff": cutoff})).mappings().all()
+    # Кэш — по ключу на discogs_id (сетки пересекаются: поиск, коллекция,
+    # вишлист), значение {} — «офферов нет», чтобы промахи не ходили в БД.
+    ids = list(dict.fromkeys(body.discogs_ids))
+    found = await cache.get_many(OFFERS_SUMMARY_CACHE_NS, ids)
+    missing = [did for did in ids if did not in found]
+
+    if missing:
+        # Агрегаты уже посчитаны в record_offer_summary
+        # (app/services/offer_summary.py) — один lookup по PK.
+        rows = (
+            await db.execute(
+                text(
+                    """
+                    SELECT discogs_id, in_stock_count, preorder_count, alt_version_count,
+                           min_price_rub, min_price_alt_rub, stores_with_stock
+                    FROM record_offer_summary
+                    WHERE discogs_id = ANY(cast(:discogs_ids as text[]))
+                    """
+                ),
+                {"discogs_ids": missing},
+            )
+        ).mappings().all()
+        fetched = {
+            row["discogs_id"]: RecordOffersSummary(
+                in_stock_count=row["in_stock_count"],
+                preorder_count=row["preorder_count"],
+                alt_version_count=row["alt_version_count"],
+                min_price_rub=row["min_price_rub"],
+                min_price_alt_rub=row["min_price_alt_rub"],
+                has_last_one=False,
+                stores_with_stock=row["stores_with_stock"],
+            ).model_dump(mode="json")
+            for row in rows
+        }
+        fetched.update({did: {} for did in missing if did not in fetched})
+        await cache.set_many(OFFERS_SUMMARY_CACHE_NS, fetched, ttl=OFFERS_SUMMARY_CACHE_TTL)
+        found.update(fetched)
 
     return {
-        row["discogs_id"]: RecordOffersSummary(
-            in_stock_count=row["in_stock_count"],
-            preorder_count=row["preorder_count"],
-            alt_version_count=row["alt_version_count"],
-            min_price_rub=row["min_price_rub"],
-            min_price_alt_rub=row["min_price_alt_rub"],
-            has_last_one=row["has_last_one"],
-            stores_with_stock=row["stores_with_stock"],
-        )
-        for row in rows
+        did: RecordOffersSummary.model_validate(item)
+        for did, item in found.items()
+        if item
     }
 
 
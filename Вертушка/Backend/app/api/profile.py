@@ -26,6 +26,7 @@ from app.schemas.profile import (
     PublicProfileRecord,
 )
 from app.services.exchange import get_usd_rub_rate
+from app.services.public_profile_cache import invalidate_public_profile, record_profile_view
 from app.services.valuation import get_monthly_delta
 
 logger = logging.getLogger(__name__)
@@ -348,6 +349,7 @@ async def update_profile_settings(
         setattr(profile, field, value)
 
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(profile)
 
     # Эмиссия события: профиль стал публичным (любой переход в is_active=True
@@ -412,6 +414,7 @@ async def update_highlights(
     profile.highlight_record_ids = data.record_ids
 
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(profile)
 
     return ProfileShareSettings(
@@ -465,18 +468,8 @@ async def get_public_profile(
             detail="Публичный профиль не активирован"
         )
 
-    profile.view_count += 1
-    await db.commit()
-
-    # Эмиссия события ачивок (K5/K6) — для владельца профиля
-    from app.services.achievements import emit_event
-    from app.services.achievements.events import PROFILE_VIEW
-    await emit_event(
-        db,
-        user.id,
-        PROFILE_VIEW,
-        {"view_count": profile.view_count},
-    )
+    # Буфер просмотров; PROFILE_VIEW (K5/K6) эмитится при сбросе в БД
+    await record_profile_view(db, user.id)
 
     return await get_public_profile_payload(user, profile, db)
 
@@ -43,6 +43,7 @@ from app.schemas.record import (
 from app.services.discogs import DiscogsService
 from app.services.rate_limiter import Priority
 from app.services.artist_name import clean_artist_name
+from app.services.scrapers.extractors import normalize_barcode
 from app.services.openai_vision import OpenAIVisionService, CoverRecognitionError
 from app.database import async_session_maker
 
@@ -685,9 +686,13 @@ async def scan_barcode(
     Поиск пластинки по штрихкоду.
     Требует авторизации.
     """
-    # Сначала проверяем локальную БД
+    # Сначала проверяем локальную БД (по нормализованному barcode, индекс)
+    barcode_norm = normalize_barcode(barcode)
     result = await db.execute(
-        select(Record).where(Record.barcode == barcode)
+        select(Record)
+        .where(Record.barcode_norm == barcode_norm if barcode_norm else Record.barcode == barcode)
+        .order_by(Record.created_at)
+        .limit(1)
     )
     local_record = result.scalar_one_or_none()
     
@@ -724,21 +729,34 @@ _COVER_MATCH_THRESHOLD = 0.75
 _COVER_RERANK_TOPN = 12
 
 
-async def _visual_rerank(image_base64: str, candidates: list) -> list:
-    """Переранжирует кандидатов по визуальной близости их обложек к фото юзера.
+# ANN-режим: сколько ближайших обложек отдавать из cover_index.
+_COVER_ANN_TOPK = 15
 
-    Для каждого кандидата качает обложку (cover_image_url, fallback thumb),
-    эмбеддит через CLIP, считает косинус с эмбеддингом фото, проставляет
-    match_score и сортирует по убыванию. Кандидаты без скачанной/валидной
-    обложки уходят в конец с match_score=None.
-    """
-    import base64 as _b64
 
-    from app.services.cover_matcher import CoverMatcher
+def _decode_image(image_base64: str) -> bytes | None:
+    import base64 as _b64
 
     try:
-        query_bytes = _b64.b64decode(image_base64)
+        return _b64.b64decode(image_base64)
     except Exception:
+        return None
+
+
+async def _visual_rerank(image_base64: str, candidates: list, *, releases: bool = True) -> list:
+    """Переранжирует кандидатов по визуальной близости их обложек к фото юзера.
+
+    Векторы обложек берутся из cover_index (по discogs_id релиза); качаются
+    и эмбеддятся только обложки, которых там ещё нет — их вектор сразу
+    сохраняется, второй раз та же обложка не качается. releases=False —
+    кандидаты-мастера (discogs_id = master_id), индекс для них не трогаем.
+    Проставляет match_score и сортирует по убыванию. Кандидаты без
+    скачанной/валидной обложки уходят в конец с match_score=None.
+    """
+    from app.services.cover_index import cover_index
+    from app.services.cover_matcher import CoverMatcher
+
+    query_bytes = _decode_image(image_base64)
+    if query_bytes is None:
         return candidates
 
     matcher = await CoverMatcher.get()
@@ -747,6 +765,9 @@ async def _visual_rerank(image_base64: str, candidates: list) -> list:
         return candidates
 
     subset = candidates[:_COVER_RERANK_TOPN]
+    stored: dict[str, object] = {}
+    if releases:
+        stored = await asyncio.to_thread(cover_index.get_many, [c.discogs_id for c in subset])
 
     def _cover_url(c) -> str | None:
         return getattr(c, "cover_image_url", None) or getattr(c, "thumb_image_url", None)
@@ -762,14 +783,19 @@ async def _visual_rerank(image_base64: str, candidates: list) -> list:
         except Exception:
             return None
 
-    images = await asyncio.gather(*[_fetch(_cover_url(c)) for c in subset])
-    vecs = await matcher.embed_many([img if img else b"" for img in images])
+    missing = [c for c in subset if c.discogs_id not in stored]
+    if missing:
+        images = await asyncio.gather(*[_fetch(_cover_url(c)) for c in missing])
+        vecs = await matcher.embed_many([img if img else b"" for img in images])
+        for cand, img, vec in zip(missing, images, vecs):
+            if img and vec is not None:
+                stored[cand.discogs_id] = vec
+                if releases:
+                    await asyncio.to_thread(cover_index.put, cand.discogs_id, vec)
 
-    for cand, img, vec in zip(subset, images, vecs):
-        if img and vec is not None:
-            cand.match_score = round(matcher.cosine(query_vec, vec), 4)
-        else:
-            cand.match_score = None
+    for cand in subset:
+        vec = stored.get(cand.discogs_id)
+        cand.match_score = round(matcher.cosine(query_vec, vec), 4) if vec is not None else None
 
     scored = [c for c in subset if c.match_score is not None]
     unscored = [c for c in subset if c.match_score is None]
@@ -779,6 +805,71 @@ async def _visual_rerank(image_base64: str, candidates: list) -> list:
     return scored + unscored + tail
 
 
+async def _scan_cover_visual(image_base64: str, db: AsyncSession) -> CoverScanResponse:
+    """mode=visual: ANN по CLIP-индексу закэшированных обложек, без OpenAI.
+
+    Эмбеддим только фото юзера, ближайшие обложки берём из cover_index,
+    метаданные — из records одним запросом.
+    """
+    from app.services.cover_index import cover_index
+    from app.services.cover_matcher import CoverMatcher
+
+    query_bytes = _decode_image(image_base64)
+    matcher = await CoverMatcher.get()
+    query_vec = await matcher.embed(query_bytes) if query_bytes else None
+    if query_vec is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Не удалось прочитать изображение"
+        )
+
+    hits = await cover_index.search(query_vec, k=_COVER_ANN_TOPK)
+    rows = (await db.execute(
+        select(Record).where(
+            Record.discogs_id.in_([discogs_id for discogs_id, _ in hits]),
+            Record.merged_into_id.is_(None),
+        )
+    )).scalars().all()
+    by_id = {r.discogs_id: r for r in rows}
+
+    results = []
+    for discogs_id, score in hits:
+        rec = by_id.get(discogs_id)
+        if rec is None:
+            continue
+        results.append(RecordSearchResult(
+            discogs_id=rec.discogs_id,
+            title=rec.title,
+            artist=rec.artist,
+            label=rec.label,
+            year=rec.year,
+            country=rec.country,
+            cover_image_url=rec.cover_image_url,
+            thumb_image_url=rec.thumb_image_url,
+            format_type=rec.format_type,
+            is_first_press=rec.is_first_press,
+            is_canon=rec.is_canon,
+            is_collectible=rec.is_collectible,
+            is_limited=rec.is_limited,
+            is_hot=rec.is_hot,
+            match_score=score,
+        ))
+    if not results:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Не удалось найти похожую обложку"
+        )
+
+    confidence = results[0].match_score
+    return CoverScanResponse(
+        recognized_artist=results[0].artist,
+        recognized_album=results[0].title,
+        results=results,
+        confidence=confidence,
+        low_confidence=confidence < _COVER_MATCH_THRESHOLD,
+    )
+
+
 @router.post("/scan/cover/", response_model=CoverScanResponse)
 async def scan_cover(
     request: CoverScanRequest,
@@ -788,6 +879,7 @@ async def scan_cover(
     """
     Распознавание обложки пластинки через AI Vision.
     Принимает base64-encoded JPEG, возвращает результаты поиска Discogs.
+    mode=visual — поиск похожих обложек по CLIP-индексу, без AI Vision.
     Требует авторизации.
     """
     if len(request.image_base64) > 10_000_000:
@@ -796,6 +888,9 @@ async def scan_cover(
             detail="Изображение слишком большое (макс. ~7.5 МБ)"
         )
 
+    if request.mode == "visual":
+        return await _scan_cover_visual(request.image_base64, db)
+
     vision = OpenAIVisionService()
     try:
         recognition = await vision.recognize_cover(request.image_base64)
@@ -842,6 +937,7 @@ async def scan_cover(
             return []
 
     results: list = []
+    from_masters = False
 
     # Стратегия 1: artist + album (самый точный запрос)
     if artist and album:
@@ -860,10 +956,12 @@ async def scan_cover(
         master_query = f"{artist} {album}".strip() if artist or album else ""
         if master_query:
             results = await _search_masters(master_query)
+            from_masters = True
 
     # Стратегия 5: masters только по artist
     if not results and artist:
         results = await _search_masters(artist)
+        from_masters = True
 
     if not results:
         raise HTTPException(
@@ -879,7 +977,7 @@ async def scan_cover(
     confidence: float | None = None
     low_confidence = False
     try:
-        results = await _visual_rerank(request.image_base64, results)
+        results = await _visual_rerank(request.image_base64, results, releases=not from_masters)
         if results and results[0].match_score is not None:
             confidence = results[0].match_score
             low_confidence = confidence < _COVER_MATCH_THRESHOLD
@@ -19,6 +19,8 @@ from app.models.follow_request import FollowRequest, FollowRequestStatus
 from app.models.profile_share import ProfileShare
 from app.models.collection import Collection, CollectionItem
 from app.models.wishlist import Wishlist, WishlistItem
+from app.services.feed import discard_feed_events, following_events, record_feed_event
+from app.services.public_profile_cache import invalidate_public_profile
 from app.api.auth import get_current_user, get_current_user_optional
 from app.schemas.user import (
     UserResponse, UserUpdate, UserPublicResponse, UserWithStats, UsernameCheckResponse,
@@ -368,6 +370,7 @@ async def update_current_user(
     db: AsyncSession = Depends(get_db)
 ):
     """Обновление профиля текущего пользователя"""
+    old_username = current_user.username
     if data.username is not None and data.username != current_user.username:
         # Проверяем уникальность
         result = await db.execute(
@@ -394,6 +397,9 @@ async def update_current_user(
 
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_public_profile(old_username)
+    if current_user.username != old_username:
+        await invalidate_public_profile(current_user.username)
 
     if avatar_was_set:
         from app.services.achievements import emit_event
@@ -413,6 +419,7 @@ async def delete_my_account(
     current_user.deleted_at = datetime.utcnow()
     current_user.scheduled_purge_at = datetime.utcnow() + timedelta(days=30)
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
     logger.info("account_deleted", extra={"user_id": str(current_user.id), "email": current_user.email})
 
@@ -567,6 +574,7 @@ async def upload_avatar(
 
     current_user.avatar_url = f"/uploads/avatars/{filename}"
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(current_user)
 
     from app.services.achievements import emit_event
@@ -590,6 +598,7 @@ async def delete_avatar(
 
     current_user.avatar_url = None
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(current_user)
 
     return current_user
@@ -663,30 +672,30 @@ async def get_feed(
     """
     Лента активности подписок.
     Показывает недавно добавленные пластинки в коллекции пользователей, на которых подписан.
+    Порядок и страница — из feed_events (collection_add), элементы догружаются по id.
     """
     offset = (page - 1) * per_page
-
-    following_result = await db.execute(
-        select(Follow.following_id).where(Follow.follower_id == current_user.id)
+    events = await following_events(
+        db,
+        user_id=current_user.id,
+        limit=per_page,
+        offset=offset,
+        kinds=("collection_add",),
     )
-    following_ids = [f[0] for f in following_result.all()]
-
-    if not following_ids:
+    item_ids = [e.source_id for e in events if e.alive]
+    if not item_ids:
         return []
 
     result = await db.execute(
         select(CollectionItem)
-        .join(Collection)
-        .where(Collection.user_id.in_(following_ids))
+        .where(CollectionItem.id.in_(item_ids))
         .options(
             selectinload(CollectionItem.record),
             selectinload(CollectionItem.collection).selectinload(Collection.user)
         )
-        .order_by(CollectionItem.added_at.desc())
-        .offset(offset)
-        .limit(per_page)
     )
-    items = result.scalars().all()
+    by_id = {item.id: item for item in result.scalars().all()}
+    items = [by_id[i] for i in item_ids if i in by_id]
 
     return [{
         "type": "collection_add",
@@ -877,6 +886,14 @@ async def follow_user(
     )
     db.add(follow)
     await db.flush()
+    await record_feed_event(
+        db,
+        "friend_new_following",
+        source_id=follow.id,
+        actor_id=current_user.id,
+        created_at=follow.created_at,
+        target_user_id=user_id,
+    )
 
     from app.services.notification_service import create_notification
     actor_name = current_user.display_name or current_user.username
@@ -937,6 +954,7 @@ async def unfollow_user(
             detail="Вы не подписаны на этого пользователя"
         )
     
+    await discard_feed_events(db, "friend_new_following", [follow.id])
     await db.delete(follow)
     await db.commit()
 
@@ -1125,15 +1143,26 @@ async def approve_follow_request(
             Follow.following_id == current_user.id,
         )
     )
+    new_follow: Follow | None = None
     if not existing.scalar_one_or_none():
-        db.add(Follow(
+        new_follow = Follow(
             follower_id=req.requester_id,
             following_id=current_user.id,
-        ))
+        )
+        db.add(new_follow)
 
     req.status = FollowRequestStatus.APPROVED
     req.resolved_at = datetime.utcnow()
     await db.flush()
+    if new_follow is not None:
+        await record_feed_event(
+            db,
+            "friend_new_following",
+            source_id=new_follow.id,
+            actor_id=req.requester_id,
+            created_at=new_follow.created_at,
+            target_user_id=current_user.id,
+        )
 
     from app.services.notification_service import create_notification
     approver_name = current_user.display_name or current_user.username
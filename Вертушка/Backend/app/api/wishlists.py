@@ -16,6 +16,8 @@ from app.models.wishlist import Wishlist, WishlistItem, WishlistFolder, wishlist
 from app.models.gift_booking import GiftBooking, GiftStatus
 from app.api.auth import get_current_user, get_current_user_optional
 from app.services.cover_storage import ensure_cover_cached
+from app.services.feed import discard_feed_events, record_feed_event
+from app.services.public_profile_cache import invalidate_public_profile
 from app.schemas.wishlist import (
     WishlistResponse,
     WishlistItemCreate,
@@ -178,7 +180,17 @@ async def add_to_wishlist(
         notes=data.notes
     )
     db.add(item)
+    await db.flush()
+    await record_feed_event(
+        db,
+        "wishlist_add",
+        source_id=item.id,
+        actor_id=current_user.id,
+        created_at=item.added_at,
+        record_id=record.id,
+    )
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(item)
 
     # Запускаем фоновое скачивание обложки (если ещё не скачана)
@@ -247,6 +259,7 @@ async def update_wishlist_item(
         item.notes = data.notes
     
     await db.commit()
+    await invalidate_public_profile(current_user.username)
     await db.refresh(item)
     
     return WishlistItemResponse(
@@ -319,8 +332,10 @@ async def remove_from_wishlist(
         booking.wishlist_item_id = None
         await db.flush()
 
+    await discard_feed_events(db, "wishlist_add", [item.id])
     await db.delete(item)
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
     if pending_email_payload:
         try:
@@ -534,6 +549,7 @@ async def update_wishlist_settings(
         wishlist.custom_message = custom_message
 
     await db.commit()
+    await invalidate_public_profile(current_user.username)
 
     return {"status": "ok"}
 
@@ -654,9 +670,21 @@ async def move_to_collection(
             record_id=item.record_id,
         )
         db.add(collection_item)
+        await discard_feed_events(db, "wishlist_add", [item.id])
         await db.delete(item)
+        await db.flush()
+        await record_feed_event(
+            db,
+            "collection_add",
+            source_id=collection_item.id,
+            actor_id=current_user.id,
+            created_at=collection_item.added_at,
+            record_id=collection_item.record_id,
+            payload={"collection_id": str(target_collection.id)},
+        )
         await db.commit()
         await db.refresh(collection_item)
+    await invalidate_public_profile(current_user.username)
 
     return CollectionItemResponse(
         id=collection_item.id,
@@ -32,6 +32,8 @@ class Settings(BaseSettings):
     discogs_api_secret: str = Field(default="", alias="DISCOGS_API_SECRET")
     discogs_token: str = Field(default="", alias="DISCOGS_TOKEN")
     discogs_user_agent: str = Field(default="VertushkaApp/1.0", alias="DISCOGS_USER_AGENT")
+    # Общий на все воркеры + scheduler token bucket в Redis (fallback — локальный)
+    discogs_limiter_distributed: bool = Field(default=True, alias="DISCOGS_LIMITER_DISTRIBUTED")
     
     # OpenAI API (распознавание обложки)
     openai_api_key: str = Field(default="", alias="OPENAI_API_KEY")
@@ -62,6 +64,12 @@ class Settings(BaseSettings):
 
     # Redis
     redis_url: str = Field(default="redis://localhost:6379/0", alias="REDIS_URL")
+    # In-process L1 перед Redis (горячие release/master/price_stats)
+    cache_l1_enabled: bool = Field(default=True, alias="CACHE_L1_ENABLED")
+    cache_l1_ttl_seconds: int = Field(default=300, alias="CACHE_L1_TTL_SECONDS")
+    cache_l1_max_mb_per_namespace: int = Field(default=16, alias="CACHE_L1_MAX_MB_PER_NAMESPACE")
+    # Fan-out DM WebSocket между воркерами: redis | local (см. messages_ws_hub)
+    ws_hub_backend: str = Field(default="redis", alias="WS_HUB_BACKEND")
 
     # Sentry
     sentry_dsn: str = Field(default="", alias="SENTRY_DSN")
@@ -73,6 +81,12 @@ class Settings(BaseSettings):
     # Хранение обложек
     covers_dir: str = Field(default="uploads/covers", alias="COVERS_DIR")
     covers_max_cache_mb: int = Field(default=5000, alias="COVERS_MAX_CACHE_MB")
+    # Дисковый кэш OG-картинок и share-card (uploads/renders, app/services/render_cache.py)
+    render_cache_max_mb: int = Field(default=500, alias="RENDER_CACHE_MAX_MB")
+    # Считать CLIP-вектор обложки сразу при скачивании (cover_index). Выключить,
+    # если процессу, качающему обложки, не хочется держать CLIP в памяти —
+    # тогда векторы досчитает build_cover_embedding_index.
+    cover_embed_on_download: bool = Field(default=True, alias="COVER_EMBED_ON_DOWNLOAD")
     internal_api_token: str = Field(default="", alias="INTERNAL_API_TOKEN")
 
     # Анти-фрод для бронирования подарков
@@ -23,6 +23,7 @@ from sqlalchemy import text
 from app.config import get_settings
 from app.database import init_db, close_db, async_session_maker
 from app.services.cache import cache
+from app.services import messages_ws_hub
 from app.services.rate_limiter import discogs_limiter
 
 # --- Request ID context var ---
@@ -94,11 +95,13 @@ async def lifespan(app: FastAPI):
         try:
             from apscheduler.schedulers.asyncio import AsyncIOScheduler
             from app.tasks.booking_tasks import send_booking_reminders, auto_release_expired_bookings, auto_cancel_unverified_bookings
-            from app.tasks.discogs_tasks import cleanup_search_cache, enrich_records_artist_data, update_prices_batch, enrich_market_covers, refresh_market_store_stats
+            from app.tasks.discogs_tasks import cleanup_search_cache, enrich_records_artist_data, update_prices_batch, enrich_market_covers, refresh_market_store_stats, reconcile_market_offer_index, reconcile_record_offer_summary, build_cover_embedding_index
             from app.tasks.valuation_tasks import record_daily_snapshots
             from app.tasks.achievements_tasks import daily_tick_achievements
-            from app.tasks.notification_tasks import emit_wishlist_in_stock_notifications
+            from app.tasks.notification_tasks import emit_wishlist_in_stock_notifications, reconcile_feed_events
+            from app.tasks.profile_tasks import flush_profile_views
             from app.services.cover_storage import CoverStorageService
+            from app.services.render_cache import cleanup_render_cache
 
             async def cleanup_covers():
                 async with async_session_maker() as db:
@@ -107,6 +110,9 @@ async def lifespan(app: FastAPI):
                     if deleted:
                         logger.info("LRU cleanup: deleted %d covers", deleted)
 
+            async def cleanup_renders():
+                await asyncio.to_thread(cleanup_render_cache, settings.render_cache_max_mb)
+
             scheduler = AsyncIOScheduler()
             scheduler.add_job(send_booking_reminders, 'cron', hour=10, minute=0, id='booking_reminders')
             scheduler.add_job(auto_release_expired_bookings, 'interval', hours=1, id='booking_auto_release')
@@ -116,10 +122,16 @@ async def lifespan(app: FastAPI):
             scheduler.add_job(update_prices_batch, 'cron', hour=4, minute=0, id='update_prices_batch')
             scheduler.add_job(record_daily_snapshots, 'cron', hour=5, minute=0, id='value_snapshots')
             scheduler.add_job(cleanup_covers, 'cron', hour=3, minute=0, id='covers_lru_cleanup')
+            scheduler.add_job(cleanup_renders, 'interval', hours=1, id='render_cache_lru_cleanup')
             scheduler.add_job(enrich_market_covers, 'interval', hours=2, id='enrich_market_covers')
-            scheduler.add_job(refresh_market_store_stats, 'interval', minutes=15, id='refresh_market_store_stats')
+            scheduler.add_job(build_cover_embedding_index, 'interval', hours=1, id='cover_embedding_index')
+            scheduler.add_job(refresh_market_store_stats, 'interval', hours=1, id='refresh_market_store_stats')
+            scheduler.add_job(reconcile_market_offer_index, 'interval', hours=1, id='reconcile_market_offer_index')
+            scheduler.add_job(reconcile_record_offer_summary, 'interval', hours=1, id='reconcile_record_offer_summary')
             scheduler.add_job(daily_tick_achievements, 'cron', hour=6, minute=0, id='achievements_daily_tick')
             scheduler.add_job(emit_wishlist_in_stock_notifications, 'interval', minutes=15, id='wishlist_in_stock_notifications')
+            scheduler.add_job(reconcile_feed_events, 'interval', hours=1, id='reconcile_feed_events')
+            scheduler.add_job(flush_profile_views, 'interval', minutes=1, id='flush_profile_views')
 
             # ---- Парсеры магазинов винила (под env SCRAPERS_ENABLED) ----
             if os.environ.get("SCRAPERS_ENABLED", "false").lower() == "true":
@@ -137,7 +149,7 @@ async def lifespan(app: FastAPI):
                 scheduler.add_job(daily_full_crawl_http, 'cron', hour=2, minute=0, id='scrape_full_http')
                 scheduler.add_job(weekly_full_crawl_browser, 'cron', day_of_week='sat', hour=2, minute=0, id='scrape_full_browser')
                 scheduler.add_job(daily_incremental_crawl, 'cron', hour=14, minute=0, id='scrape_incremental')
-                scheduler.add_job(stock_refresh_active, 'interval', hours=6, id='scrape_stock_refresh')
+                scheduler.add_job(stock_refresh_active, 'interval', hours=1, id='scrape_stock_refresh')
                 scheduler.add_job(hourly_match_unmatched, 'interval', minutes=60, id='scrape_match_unmatched')
                 scheduler.add_job(weekly_cleanup_stale, 'cron', day_of_week='sun', hour=4, minute=0, id='scrape_cleanup_stale')
                 scheduler.add_job(invalidate_offers_for_recently_updated, 'interval', minutes=15, id='scrape_invalidate_offers')
@@ -160,6 +172,7 @@ async def lifespan(app: FastAPI):
     if scheduler:
         scheduler.shutdown()
         print("✅ Планировщик задач остановлен")
+    await messages_ws_hub.close()
     await cache.close()
     print("✅ Redis отключён")
     print("👋 Остановка Вертушка API...")
@@ -282,5 +295,6 @@ async def health_check():
         "status": "healthy",
         "db": db_status,
         "redis": redis_health,
+        "discogs_limiter": discogs_limiter.stats(),
     }
 
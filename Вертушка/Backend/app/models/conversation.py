@@ -8,6 +8,7 @@ from sqlalchemy import (
     String,
     DateTime,
     Boolean,
+    Integer,
     ForeignKey,
     UniqueConstraint,
     Index,
@@ -130,8 +131,21 @@ class ConversationParticipant(Base):
         String(16), default="accepted", nullable=False, server_default="accepted"
     )
 
+    # Денормализация для инбокса (services.messaging поддерживает на отправке,
+    # чтении и удалении): непрочитанные входящие и время последнего сообщения
+    # треда — список диалогов и бейдж читаются без COUNT по messages.
+    unread_count: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False, server_default="0"
+    )
+    last_message_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
     __table_args__ = (
         UniqueConstraint("conversation_id", "user_id", name="uq_participant"),
+        Index(
+            "ix_participant_inbox",
+            "user_id", "request_status", "last_message_at",
+            postgresql_where="archived_at IS NULL",
+        ),
     )
 
     conversation = relationship("Conversation", back_populates="participants")
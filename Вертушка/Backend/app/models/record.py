@@ -5,7 +5,7 @@ import uuid
 from datetime import datetime
 from decimal import Decimal
 from sqlalchemy import String, DateTime, Integer, Text, Numeric, Boolean, ForeignKey
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 
 from app.database import Base
@@ -93,6 +93,13 @@ class Record(Base):
         String(100),
         nullable=True
     )
+    # Нормализованный catalog_number (normalize_catalog) — поддерживается
+    # валидатором ниже, индекс ix_records_catalog_norm. По нему матчим
+    # листинги магазинов вместо regexp_replace по всей таблице.
+    catalog_norm: Mapped[str | None] = mapped_column(
+        String(100),
+        nullable=True
+    )
     year: Mapped[int | None] = mapped_column(
         Integer,
         nullable=True,
@@ -127,6 +134,11 @@ class Record(Base):
         nullable=True,
         index=True
     )
+    # Нормализованный barcode (normalize_barcode), индекс ix_records_barcode_norm
+    barcode_norm: Mapped[str | None] = mapped_column(
+        String(50),
+        nullable=True
+    )
     
     # Цена и стоимость
     estimated_price_min: Mapped[Decimal | None] = mapped_column(
@@ -236,6 +248,18 @@ class Record(Base):
         cascade="all, delete-orphan"
     )
     
+    @validates("catalog_number", "barcode")
+    def _sync_normalized(self, key: str, value: str | None) -> str | None:
+        """Держим catalog_norm/barcode_norm в синхроне с исходными полями."""
+        # Локальный импорт: модели не тянут пакет app.services при загрузке
+        from app.services.scrapers.extractors import normalize_barcode, normalize_catalog
+
+        if key == "catalog_number":
+            self.catalog_norm = normalize_catalog(value)
+        else:
+            self.barcode_norm = normalize_barcode(value)
+        return value
+
     @property
     def artist_id(self) -> str | None:
         if self.discogs_data:
@@ -5,7 +5,7 @@ import uuid
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import String, DateTime, Text, Numeric, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import BigInteger, String, DateTime, Text, Numeric, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 
@@ -64,6 +64,9 @@ class StoreListing(Base):
     last_seen_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
 
     raw_payload: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    # Хэш распарсенных полей (scrapers.runner) — upsert без изменений не
+    # переписывает строку и не двигает updated_at
+    content_hash: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
 
     matched_record_id: Mapped[uuid.UUID | None] = mapped_column(
         UUID(as_uuid=True),
@@ -3,6 +3,7 @@
 """
 from datetime import datetime
 from decimal import Decimal
+from typing import Literal
 from uuid import UUID
 from pydantic import BaseModel, Field, ConfigDict, model_validator
 
@@ -250,6 +251,9 @@ class ReleaseSearchResponse(BaseModel):
 class CoverScanRequest(BaseModel):
     """Запрос на распознавание обложки"""
     image_base64: str = Field(..., description="Base64-encoded JPEG image")
+    # text — OpenAI угадывает artist/album → поиск Discogs → CLIP re-rank;
+    # visual — сразу ANN по CLIP-индексу всех закэшированных обложек.
+    mode: Literal["text", "visual"] = "text"
 
 
 class CoverScanResponse(BaseModel):
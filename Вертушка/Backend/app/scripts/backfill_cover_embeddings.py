@@ -0,0 +1,34 @@
+"""
+Первичное наполнение cover_index: CLIP-векторы всех локальных обложек.
+
+То же, что часовой build_cover_embedding_index в scheduler'е, но без лимита
+на прогон — для первого запуска на всём каталоге. Эмбеддит файлы с диска
+(uploads/covers/), HTTP не трогает. Повторный запуск пропускает уже
+посчитанные векторы.
+
+Usage:
+    docker exec vertushka_api python -m app.scripts.backfill_cover_embeddings
+        [--limit 0]   # сколько обложек эмбеддить за запуск (0=все)
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from app.tasks.discogs_tasks import build_cover_embedding_index
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+
+
+def _parse() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--limit", type=int, default=0, help="covers to embed (0=all)")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(build_cover_embedding_index(limit=_parse().limit))
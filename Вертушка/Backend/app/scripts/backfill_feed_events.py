@@ -0,0 +1,43 @@
+"""
+Бэкфилл feed_events (миграция 20261017_feed_events) из всех источников.
+
+То же, что часовой reconcile_feed_events, но без окна по времени: INSERT ...
+ON CONFLICT DO NOTHING по каждому типу события + чистка событий удалённых
+источников. Повторный запуск безопасен. Нужен один раз после миграции.
+
+У gift_completed из бэкфилла нет пластинки и получателя: пункт вишлиста
+удаляется при завершении брони, их знает только хук записи.
+
+Usage:
+    docker exec vertushka_api python -m app.scripts.backfill_feed_events
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from app.database import async_session_maker, close_db
+from app.services.feed import sync_feed_events
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger("backfill_feed_events")
+
+
+async def main() -> None:
+    started = time.monotonic()
+    async with async_session_maker() as db:
+        added, removed = await sync_feed_events(db)
+        await db.commit()
+    logger.info(
+        "feed_events backfilled: +%d, -%d stale in %.1fs",
+        added, removed, time.monotonic() - started,
+    )
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+"""
+Backfill records.catalog_norm / barcode_norm (миграция 20261017_records_norm).
+
+Идёт по records keyset'ом по id пачками, нормализует в Python теми же
+normalize_catalog / normalize_barcode, что и матчер, пишет одним
+UPDATE ... FROM unnest на пачку, коммит после каждой пачки.
+
+Resumable: берём только строки, где исходное поле есть, а norm-колонка
+пустая, так что повторный запуск продолжает с места падения. Последний
+обработанный id пишется в лог — его можно передать в --after, чтобы не
+пересканировать строки, которые не нормализуются (короткий barcode и т.п.).
+
+Usage:
+    docker exec vertushka_api python -m app.scripts.backfill_record_norms
+        [--batch-size 5000]
+        [--after <uuid>]   # продолжить после этого id
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.scrapers.extractors import normalize_barcode, normalize_catalog
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger("backfill_record_norms")
+
+
+_SELECT_SQL = text(
+    """
+    SELECT id, catalog_number, barcode
+    FROM records
+    WHERE (cast(:after as uuid) IS NULL OR id > cast(:after as uuid))
+      AND (
+        (catalog_number IS NOT NULL AND catalog_norm IS NULL)
+        OR (barcode IS NOT NULL AND barcode_norm IS NULL)
+      )
+    ORDER BY id
+    LIMIT :lim
+    """
+)
+
+_UPDATE_SQL = text(
+    """
+    UPDATE records r
+    SET catalog_norm = u.catalog_norm,
+        barcode_norm = u.barcode_norm
+    FROM unnest(
+        cast(:ids as uuid[]),
+        cast(:catalogs as varchar[]),
+        cast(:barcodes as varchar[])
+    ) AS u(id, catalog_norm, barcode_norm)
+    WHERE r.id = u.id
+    """
+)
+
+
+async def run(batch_size: int, after: str | None) -> None:
+    started = time.monotonic()
+    scanned = updated = 0
+    while True:
+        async with engine.begin() as conn:
+            rows = (await conn.execute(_SELECT_SQL, {"after": after, "lim": batch_size})).all()
+            if not rows:
+                break
+            ids, catalogs, barcodes = [], [], []
+            for row in rows:
+                catalog = normalize_catalog(row.catalog_number)
+                barcode = normalize_barcode(row.barcode)
+                if catalog is None and barcode is None:
+                    continue
+                ids.append(row.id)
+                catalogs.append(catalog)
+                barcodes.append(barcode)
+            if ids:
+                await conn.execute(
+                    _UPDATE_SQL, {"ids": ids, "catalogs": catalogs, "barcodes": barcodes},
+                )
+        scanned += len(rows)
+        updated += len(ids)
+        after = str(rows[-1].id)
+        logger.info(
+            "progress: scanned=%d updated=%d last_id=%s rate=%.0f rows/s",
+            scanned, updated, after, scanned / max(time.monotonic() - started, 1e-3),
+        )
+        if len(rows) < batch_size:
+            break
+
+    logger.info(
+        "done in %.1fs: scanned=%d updated=%d",
+        time.monotonic() - started, scanned, updated,
+    )
+
+
+def _parse() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--batch-size", type=int, default=5000, help="rows per UPDATE/commit")
+    p.add_argument("--after", default=None, help="resume after this record id")
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = _parse()
+    asyncio.run(run(args.batch_size, args.after))
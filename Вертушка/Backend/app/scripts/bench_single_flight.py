@@ -0,0 +1,122 @@
+"""Бенчмарк single-flight в DiscogsService: холодный мастер, N параллельных
+запросов, размазанных по нескольким процессам (имитация uvicorn-воркеров).
+
+Запуск (нужен живой Redis из REDIS_URL, Discogs не трогаем — loader фейковый):
+    cd Backend && python -m app.scripts.bench_single_flight
+    cd Backend && python -m app.scripts.bench_single_flight --poll   # старый polling
+
+Печатает:
+  - латентность ждущих (p50/p95/max) относительно старта;
+  - сколько раз реально вызван loader (= запросов в Discogs);
+  - дельту Redis-команд по INFO commandstats (GET/SET/PUBLISH/...).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import statistics
+import time
+import uuid
+
+import redis.asyncio as redis
+
+from app.config import get_settings
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("bench_single_flight")
+
+
+async def _worker(key: str, n_requests: int, loader_ms: int, start_at: float, poll: bool) -> tuple[list[float], int]:
+    from app.services.cache import cache, TTL_MASTER
+    from app.services.discogs import DiscogsService
+
+    await cache.connect()
+    if poll:
+        async def _no_pubsub(channel: str):
+            return None
+        cache.listen = _no_pubsub  # type: ignore[method-assign]
+
+    loader_calls = 0
+
+    async def loader():
+        nonlocal loader_calls
+        loader_calls += 1
+        await asyncio.sleep(loader_ms / 1000)
+        payload = {"master_id": key, "title": "bench"}
+        await cache.set("master", key, payload, TTL_MASTER)
+        return payload
+
+    service = DiscogsService()
+
+    async def one() -> float:
+        await service._single_flight("master", key, loader)
+        return time.time() - start_at
+
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+    latencies = await asyncio.gather(*(one() for _ in range(n_requests)))
+    await cache.close()
+    return list(latencies), loader_calls
+
+
+def _run_worker(key: str, n_requests: int, loader_ms: int, start_at: float, poll: bool, out) -> None:
+    out.put(asyncio.run(_worker(key, n_requests, loader_ms, start_at, poll)))
+
+
+async def _commandstats(client: redis.Redis) -> dict[str, int]:
+    info = await client.info("commandstats")
+    return {name.removeprefix("cmdstat_"): int(v["calls"]) for name, v in info.items()}
+
+
+def _pct(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def main(args: argparse.Namespace) -> None:
+    client = redis.from_url(get_settings().redis_url)
+    key = f"bench-{uuid.uuid4().hex[:8]}"
+    before = await _commandstats(client)
+
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    per_worker = [args.requests // args.workers] * args.workers
+    per_worker[0] += args.requests - sum(per_worker)
+    # Запас на старт интерпретатора в spawn-процессах
+    start_at = time.time() + 3.0
+    procs = [
+        ctx.Process(target=_run_worker, args=(key, n, args.loader_ms, start_at, args.poll, out))
+        for n in per_worker
+    ]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    after = await _commandstats(client)
+    await client.delete(f"vertushka:master:{key}")
+    await client.aclose()
+
+    latencies = [lat for lats, _ in results for lat in lats]
+    loader_calls = sum(calls for _, calls in results)
+    delta = {cmd: after.get(cmd, 0) - before.get(cmd, 0) for cmd in after}
+    delta = {cmd: n for cmd, n in delta.items() if n > 0 and cmd not in ("info",)}
+
+    print(f"mode={'poll' if args.poll else 'pubsub'} requests={args.requests} "
+          f"workers={args.workers} loader={args.loader_ms}ms")
+    print(f"latency p50={statistics.median(latencies) * 1000:.0f}ms "
+          f"p95={_pct(latencies, 0.95) * 1000:.0f}ms max={max(latencies) * 1000:.0f}ms")
+    print(f"loader calls (Discogs requests): {loader_calls}")
+    print(f"redis commands: total={sum(delta.values())} "
+          + " ".join(f"{cmd}={n}" for cmd, n in sorted(delta.items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--loader-ms", type=int, default=800, help="имитация латентности Discogs")
+    parser.add_argument("--poll", action="store_true", help="отключить pub/sub (fallback на polling)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,179 @@
+"""Нагрузочный тест DM WebSocket hub: тысячи сокетов, размазанных по
+нескольким процессам (имитация uvicorn-воркеров), события публикуются
+с любого воркера — как push_event из REST-хендлеров.
+
+Сокеты фейковые (send_text меряет задержку от публикации до отправки в
+сокет), поэтому нужен только живой Redis из REDIS_URL:
+    cd Backend && python -m app.scripts.bench_ws_hub
+    cd Backend && python -m app.scripts.bench_ws_hub --sockets 8000 --slow 50
+    cd Backend && python -m app.scripts.bench_ws_hub --backend local   # без fan-out
+
+Печатает:
+  - доставлено / ожидалось (сокет юзера на любом воркере должен получить
+    каждое его событие; --backend local покажет, сколько терялось раньше);
+  - гистограмму и p50/p95/p99/max задержки доставки;
+  - сколько медленных сокетов (--slow) отключено по переполнению очереди;
+  - долю has_active=True для юзеров, чьи сокеты на других воркерах.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import multiprocessing as mp
+import statistics
+import time
+import uuid
+
+import orjson
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("bench_ws_hub")
+
+_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")]
+
+
+class _FakeSocket:
+    """Минимум WebSocket, который трогает hub: send_text / close."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.latencies: list[float] = []
+        self.closed = False
+
+    async def send_text(self, text: str) -> None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.latencies.append(time.time() - orjson.loads(text)["sent_at"])
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = True
+
+
+def _target(seq: int, users: int) -> int:
+    return (seq * 7919) % users
+
+
+async def _worker(idx: int, args: argparse.Namespace, run_id: str, start_at: float) -> dict:
+    from app.services import messages_ws_hub as hub
+    from app.services.cache import cache
+
+    await cache.connect()
+    hub._backend = hub.LocalBackend() if args.backend == "local" else hub.RedisBackend()
+
+    # Сокет i — юзер i % users, воркер i % workers; первые --slow сокеты медленные
+    sockets: list[_FakeSocket] = []
+    local_users: set[int] = set()
+    for i in range(idx, args.sockets, args.workers):
+        ws = _FakeSocket(delay=args.slow_delay_ms / 1000 if i < args.slow else 0.0)
+        sockets.append(ws)
+        user = i % args.users
+        local_users.add(user)
+        await hub.register(f"{run_id}-{user}", ws)  # type: ignore[arg-type]
+
+    await asyncio.sleep(max(0.0, start_at - time.time()))
+
+    # Presence: юзеры, у которых нет сокета на этом воркере
+    foreign = [u for u in range(args.users) if u not in local_users][:200]
+    presence = await asyncio.gather(*(hub.has_active(f"{run_id}-{u}") for u in foreign))
+
+    # Своя доля публикаций, равномерно с общим темпом --rate
+    interval = args.workers / args.rate
+    published = 0
+    for seq in range(idx, args.messages, args.workers):
+        await hub.push_event(
+            f"{run_id}-{_target(seq, args.users)}",
+            {"type": "bench", "seq": seq, "sent_at": time.time()},
+        )
+        published += 1
+        await asyncio.sleep(interval)
+
+    await asyncio.sleep(args.drain)
+    await hub.close()
+    await cache.close()
+    return {
+        "latencies": [lat for ws in sockets for lat in ws.latencies],
+        "published": published,
+        "slow_closed": sum(1 for ws in sockets if ws.closed),
+        "presence_true": sum(presence),
+        "presence_checked": len(presence),
+    }
+
+
+def _run_worker(idx: int, args: argparse.Namespace, run_id: str, start_at: float, out) -> None:
+    out.put(asyncio.run(_worker(idx, args, run_id, start_at)))
+
+
+def _pct(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _histogram(latencies_ms: list[float]) -> list[str]:
+    counts = [0] * len(_BUCKETS_MS)
+    for lat in latencies_ms:
+        for i, edge in enumerate(_BUCKETS_MS):
+            if lat <= edge:
+                counts[i] += 1
+                break
+    widest = max(counts) or 1
+    lines, lower = [], 0.0
+    for edge, n in zip(_BUCKETS_MS, counts):
+        label = f">{lower:g}ms" if edge == float("inf") else f"<={edge:g}ms"
+        lines.append(f"  {label:>9} {n:>8}  {'#' * round(40 * n / widest)}")
+        lower = edge
+    return lines
+
+
+def main(args: argparse.Namespace) -> None:
+    run_id = f"bench-{uuid.uuid4().hex[:8]}"
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    # Запас на старт интерпретатора и регистрацию сокетов в spawn-процессах
+    start_at = time.time() + 3.0 + args.sockets / 5000
+    procs = [
+        ctx.Process(target=_run_worker, args=(i, args, run_id, start_at, out))
+        for i in range(args.workers)
+    ]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    sockets_per_user = [0] * args.users
+    for i in range(args.sockets):
+        sockets_per_user[i % args.users] += 1
+    expected = sum(sockets_per_user[_target(seq, args.users)] for seq in range(args.messages))
+
+    latencies = [lat * 1000 for r in results for lat in r["latencies"]]
+    delivered = len(latencies)
+    presence_true = sum(r["presence_true"] for r in results)
+    presence_checked = sum(r["presence_checked"] for r in results)
+
+    print(f"backend={args.backend} sockets={args.sockets} users={args.users} "
+          f"workers={args.workers} messages={sum(r['published'] for r in results)} rate={args.rate}/s "
+          f"slow={args.slow}x{args.slow_delay_ms}ms")
+    print(f"delivered {delivered}/{expected} ({100 * delivered / max(expected, 1):.1f}%)")
+    if latencies:
+        print(f"latency p50={statistics.median(latencies):.1f}ms p95={_pct(latencies, 0.95):.1f}ms "
+              f"p99={_pct(latencies, 0.99):.1f}ms max={max(latencies):.1f}ms")
+        print("\n".join(_histogram(latencies)))
+    print(f"slow sockets closed on queue overflow: {sum(r['slow_closed'] for r in results)}/{args.slow}")
+    print(f"has_active for users on other workers: {presence_true}/{presence_checked}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=4000)
+    parser.add_argument("--users", type=int, default=None, help="по умолчанию sockets/2 (по 2 устройства)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rate", type=float, default=1000, help="публикаций в секунду на все воркеры")
+    parser.add_argument("--slow", type=int, default=0, help="сколько сокетов не успевают читать")
+    parser.add_argument("--slow-delay-ms", type=int, default=500)
+    parser.add_argument("--drain", type=float, default=2.0, help="сек ожидания доставки после публикаций")
+    parser.add_argument("--backend", choices=("redis", "local"), default="redis")
+    ns = parser.parse_args()
+    ns.users = ns.users or max(1, ns.sockets // 2)
+    main(ns)
@@ -1,7 +1,12 @@
 """CLI: одноразовый ingest дампа Discogs Releases в локальный индекс.
 
 Что делает:
-  - Стримит XML.gz через lxml.iterparse (память константная, ~200 MB).
+  - Стримит XML.gz и режет поток на чанки по границам `</release>`; чанки
+    парсит пул процессов (lxml), результаты через ограниченную asyncio-очередь
+    уходят в несколько параллельных COPY-соединений. Чтение, парсинг и COPY
+    идут одновременно; очередь даёт backpressure — память константная.
+    `--workers 1` — старый последовательный режим (lxml.iterparse в одном
+    процессе).
   - Парсит releases: discogs_id, master_id, artist, title, year, country,
     format_type, label, barcode_norm, catalog_norm, cover_image_url.
   - Записывает батчами (5K строк) через asyncpg.copy_records_to_table — это
@@ -21,7 +26,7 @@
   # 3. Применить миграцию (создаст таблицу)
   ssh deploy@... 'docker exec vertushka_api alembic upgrade head'
 
-  # 4. Запустить ingest (в фоне, ~3-5 часов)
+  # 4. Запустить ingest (в фоне; на 8 ядрах < 1 часа, последовательно ~3-5 часов)
   ssh deploy@... 'docker exec -d vertushka_api python -m app.scripts.ingest_discogs_dump \
     --file /tmp/discogs_20260501_releases.xml.gz \
     --dump-date 2026-05-01 \
@@ -41,27 +46,59 @@
   --dump-date YYYY-MM-DD дата дампа (для dump_version)
   --batch-size N         кол-во записей в одном COPY-батче (default: 5000)
   --limit N              максимум обработанных записей (для тестов)
-  --resume-from ID       продолжить после данного discogs_id
+  --resume-from ID       продолжить после данного discogs_id (берите из
+                         последней строки `checkpoint: resume-from=...` в логе)
+  --workers N            процессов-парсеров (default: CPU-1; 1 = последовательно)
+  --copy-connections N   параллельных COPY-соединений (default: 4)
   --build-indexes-only   пропустить ingest, только создать индексы
   --skip-existing        не падать при ON CONFLICT (Update mode)
+  --delta                ежемесячный refresh: пишем только новые/изменённые
+                         релизы (по content_hash), удаляем пропавшие из дампа
+  --shadow               полный rebuild без даунтайма поиска: грузим в
+                         discogs_releases_index_shadow, строим там индексы,
+                         ANALYZE и атомарно меняем таблицы местами
+  --maintenance-work-mem для --shadow: maintenance_work_mem (default: 2GB)
+  --index-workers N      для --shadow: max_parallel_maintenance_workers (default: 4)
 
 Идемпотентность: повторный запуск с --skip-existing проходит без ошибок
 (использует upsert через staging table). Без флага падает на дубликатах PK.
+
+Delta-режим (--delta): перед стартом снимок (discogs_id, content_hash) всего
+индекса грузится в память (numpy, ~16 байт/строку → ~300 MB на 19M).
+Неизменённые строки отсекаются до записи — ни COPY, ни UPDATE, индексы не
+пухнут. Новые/изменённые идут через staging + ON CONFLICT DO UPDATE.
+Релизы, которых нет в новом дампе, удаляются в конце (только при полном
+прогоне без ошибок, --limit и --resume-from). Версия дампа пишется в
+discogs_dump_state.
+
+  docker exec -d vertushka_api python -m app.scripts.ingest_discogs_dump \
+    --file /tmp/discogs_20260601_releases.xml.gz --dump-date 2026-06-01 --delta
+
+Shadow-режим (--shadow): живая таблица не трогается до самого конца — поиск
+и matcher читают старые данные с полными индексами. Индексы на shadow
+строятся обычным (не CONCURRENTLY) CREATE INDEX: таблицу никто не читает,
+а так работают parallel workers. Swap — rename в одной транзакции под
+lock_timeout; после него matcher'ы во всех процессах перепроверяют
+_dump_available (generation-ключ в Redis).
 """
 from __future__ import annotations
 
 import argparse
 import asyncio
 import gzip
+import hashlib
 import json
 import logging
+import os
 import re
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, datetime
 from pathlib import Path
 from typing import Any, Iterable
 
+import numpy as np
 from lxml import etree
 
 from app.database import async_session_maker, engine, close_db
@@ -186,6 +223,20 @@ def _first_label_name(elem) -> str | None:
     return None
 
 
+_HASHED_FIELDS = (
+    "master_id", "artist", "title", "year", "country",
+    "format_type", "label", "barcode_norm", "catalog_norm", "cover_image_url",
+)
+
+
+def _row_hash(row: dict[str, Any]) -> int:
+    """64-битный (signed, влезает в BIGINT) хэш содержательных полей.
+    dump_version/created_at не входят — иначе каждый дамп «менял» бы всё."""
+    raw = "\x1f".join("" if row[f] is None else str(row[f]) for f in _HASHED_FIELDS)
+    digest = hashlib.blake2b(raw.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True) or 1  # 0 — маркер «нет хэша»
+
+
 def _parse_release(elem, dump_date: date) -> dict[str, Any] | None:
     """Парсит один <release>. Возвращает dict для COPY или None если skip.
 
@@ -206,7 +257,7 @@ def _parse_release(elem, dump_date: date) -> dict[str, Any] | None:
     if not artist or not title:
         return None
 
-    return {
+    row = {
         "discogs_id": discogs_id,
         "master_id": _xpath_int(elem, "master_id"),
         "artist": artist,
@@ -221,6 +272,8 @@ def _parse_release(elem, dump_date: date) -> dict[str, Any] | None:
         "dump_version": dump_date,
         "created_at": datetime.utcnow(),
     }
+    row["content_hash"] = _row_hash(row)
+    return row
 
 
 # ────────────────────────────────────────────────────────────────────────
@@ -231,8 +284,18 @@ def _parse_release(elem, dump_date: date) -> dict[str, Any] | None:
 _COLUMNS = (
     "discogs_id", "master_id", "artist", "title", "year", "country",
     "format_type", "label", "barcode_norm", "catalog_norm",
-    "cover_image_url", "dump_version", "created_at",
+    "cover_image_url", "dump_version", "created_at", "content_hash",
 )
+_UPDATABLE = tuple(c for c in _COLUMNS if c not in ("discogs_id", "created_at"))
+
+
+def _row_tuple(r: dict) -> tuple:
+    return (
+        r["discogs_id"], r["master_id"], r["artist"], r["title"],
+        r["year"], r["country"], r["format_type"], r["label"],
+        r["barcode_norm"], r["catalog_norm"], r["cover_image_url"],
+        r["dump_version"], r["created_at"], r["content_hash"],
+    )
 
 
 async def _copy_batch(records: list[dict], skip_existing: bool) -> int:
@@ -242,18 +305,15 @@ async def _copy_batch(records: list[dict], skip_existing: bool) -> int:
     медленнее, но не падает на дубликатах. Без флага — прямой COPY (быстрее),
     но падает с UniqueViolation на повторных запусках.
     """
-    if not records:
-        return 0
+    return await _copy_rows([_row_tuple(r) for r in records], skip_existing)
 
-    tuples = [
-        (
-            r["discogs_id"], r["master_id"], r["artist"], r["title"],
-            r["year"], r["country"], r["format_type"], r["label"],
-            r["barcode_norm"], r["catalog_norm"], r["cover_image_url"],
-            r["dump_version"], r["created_at"],
-        )
-        for r in records
-    ]
+
+async def _copy_rows(
+    tuples: list[tuple], skip_existing: bool, table: str = "discogs_releases_index",
+) -> int:
+    """То же, что _copy_batch, но строки уже в порядке _COLUMNS."""
+    if not tuples:
+        return 0
 
     async with engine.connect() as conn:
         raw_conn = await conn.get_raw_connection()
@@ -271,7 +331,7 @@ async def _copy_batch(records: list[dict], skip_existing: bool) -> int:
             )
             inserted = await asyncpg_conn.fetchval(
                 "WITH ins AS ("
-                " INSERT INTO discogs_releases_index "
+                f" INSERT INTO {table} "
                 f" ({', '.join(_COLUMNS)}) "
                 f" SELECT {', '.join(_COLUMNS)} FROM _stage "
                 " ON CONFLICT (discogs_id) DO NOTHING "
@@ -281,11 +341,135 @@ async def _copy_batch(records: list[dict], skip_existing: bool) -> int:
             return int(inserted or 0)
         else:
             await asyncpg_conn.copy_records_to_table(
-                "discogs_releases_index", records=tuples, columns=_COLUMNS,
+                table, records=tuples, columns=_COLUMNS,
             )
             return len(tuples)
 
 
+async def _upsert_rows(tuples: list[tuple]) -> int:
+    """Delta-запись: staging + ON CONFLICT DO UPDATE. WHERE по content_hash —
+    страховка, чтобы совпавшая строка не породила мёртвый tuple."""
+    if not tuples:
+        return 0
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        async with asyncpg_conn.transaction():
+            await asyncpg_conn.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS _delta_stage "
+                "(LIKE discogs_releases_index INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            )
+            await asyncpg_conn.copy_records_to_table(
+                "_delta_stage", records=tuples, columns=_COLUMNS,
+            )
+            written = await asyncpg_conn.fetchval(
+                "WITH up AS ("
+                " INSERT INTO discogs_releases_index "
+                f" ({', '.join(_COLUMNS)}) "
+                f" SELECT {', '.join(_COLUMNS)} FROM _delta_stage "
+                " ON CONFLICT (discogs_id) DO UPDATE SET "
+                + ", ".join(f"{c} = EXCLUDED.{c}" for c in _UPDATABLE)
+                + " WHERE discogs_releases_index.content_hash IS DISTINCT FROM EXCLUDED.content_hash"
+                " RETURNING 1"
+                ") SELECT COUNT(*) FROM up"
+            )
+    return int(written or 0)
+
+
+class _DeltaState:
+    """Снимок (discogs_id, content_hash) индекса в отсортированных numpy-массивах.
+
+    filter() отсекает неизменённые строки и отмечает увиденные id — по
+    неотмеченным в конце удаляем пропавшие из дампа релизы.
+    """
+
+    _LOAD_BATCH = 500_000
+
+    def __init__(self, ids: np.ndarray, hashes: np.ndarray) -> None:
+        self.ids = ids
+        self.hashes = hashes
+        self.seen = np.zeros(len(ids), dtype=bool)
+        self.counters = {"new": 0, "changed": 0, "unchanged": 0}
+
+    @classmethod
+    async def load(cls) -> "_DeltaState":
+        started = time.time()
+        id_parts: list[np.ndarray] = []
+        hash_parts: list[np.ndarray] = []
+        last_id = -1
+        async with engine.connect() as conn:
+            raw_conn = await conn.get_raw_connection()
+            asyncpg_conn = raw_conn.driver_connection
+            while True:
+                rows = await asyncpg_conn.fetch(
+                    "SELECT discogs_id, COALESCE(content_hash, 0) "
+                    "FROM discogs_releases_index WHERE discogs_id > $1 "
+                    "ORDER BY discogs_id LIMIT $2",
+                    last_id, cls._LOAD_BATCH,
+                )
+                if not rows:
+                    break
+                id_parts.append(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+                hash_parts.append(np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows)))
+                last_id = rows[-1][0]
+        ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=np.int64)
+        hashes = np.concatenate(hash_parts) if hash_parts else np.empty(0, dtype=np.int64)
+        logger.info("delta: loaded %d existing rows in %.1fs", len(ids), time.time() - started)
+        return cls(ids, hashes)
+
+    def filter(self, rows: list[tuple]) -> list[tuple]:
+        if not rows:
+            return rows
+        row_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        row_hashes = np.fromiter((r[-1] for r in rows), dtype=np.int64, count=len(rows))
+        if len(self.ids):
+            pos = np.minimum(np.searchsorted(self.ids, row_ids), len(self.ids) - 1)
+            found = self.ids[pos] == row_ids
+            self.seen[pos[found]] = True
+            unchanged = found & (self.hashes[pos] == row_hashes)
+        else:
+            found = unchanged = np.zeros(len(rows), dtype=bool)
+        self.counters["unchanged"] += int(unchanged.sum())
+        self.counters["changed"] += int((found & ~unchanged).sum())
+        self.counters["new"] += int((~found).sum())
+        return [r for r, skip in zip(rows, unchanged) if not skip]
+
+    def missing_ids(self) -> np.ndarray:
+        return self.ids[~self.seen]
+
+
+async def _delete_missing(ids: np.ndarray, batch_size: int = 10_000) -> int:
+    deleted = 0
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size].tolist()
+            result = await asyncpg_conn.execute(
+                "DELETE FROM discogs_releases_index WHERE discogs_id = ANY($1::bigint[])",
+                chunk,
+            )
+            deleted += int(result.split()[-1])
+    return deleted
+
+
+async def _record_dump_state(dump_date: date, counters: dict[str, int]) -> None:
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        await asyncpg_conn.execute(
+            "INSERT INTO discogs_dump_state "
+            "(table_name, dump_version, refreshed_at, rows_inserted, rows_updated, rows_deleted, rows_unchanged) "
+            "VALUES ('discogs_releases_index', $1, now(), $2, $3, $4, $5) "
+            "ON CONFLICT (table_name) DO UPDATE SET "
+            "dump_version = EXCLUDED.dump_version, refreshed_at = EXCLUDED.refreshed_at, "
+            "rows_inserted = EXCLUDED.rows_inserted, rows_updated = EXCLUDED.rows_updated, "
+            "rows_deleted = EXCLUDED.rows_deleted, rows_unchanged = EXCLUDED.rows_unchanged",
+            dump_date, counters.get("new", 0), counters.get("changed", 0),
+            counters.get("deleted", 0), counters.get("unchanged", 0),
+        )
+
+
 # ────────────────────────────────────────────────────────────────────────
 # Main ingest loop
 # ────────────────────────────────────────────────────────────────────────
@@ -380,41 +564,241 @@ async def ingest(
     return counters
 
 
+# ────────────────────────────────────────────────────────────────────────
+# Pipelined ingest: reader → process pool (parse) → N × COPY
+# ────────────────────────────────────────────────────────────────────────
+
+
+_RELEASE_OPEN = b"<release "
+_RELEASE_CLOSE = b"</release>"  # `</released>` не совпадёт — там нет `>` сразу
+_CHUNK_BYTES = 4 * 1024 * 1024
+_READ_BYTES = 1024 * 1024
+
+
+def _iter_release_chunks(file_path: Path, chunk_bytes: int = _CHUNK_BYTES):
+    """Режет распакованный поток на куски из целых `<release>...</release>`.
+
+    Пролог (`<?xml ...?><releases>`) и хвост (`</releases>`) отбрасываются.
+    Выполняется в потоке — gzip блокирующий.
+    """
+    buf = b""
+    started = False
+    with gzip.open(file_path, "rb") as f:
+        while True:
+            data = f.read(_READ_BYTES)
+            if data:
+                buf += data
+            if not started:
+                pos = buf.find(_RELEASE_OPEN)
+                if pos < 0:
+                    if not data:
+                        return
+                    continue
+                buf = buf[pos:]
+                started = True
+            if len(buf) >= chunk_bytes or not data:
+                end = buf.rfind(_RELEASE_CLOSE)
+                if end >= 0:
+                    end += len(_RELEASE_CLOSE)
+                    yield buf[:end]
+                    buf = buf[end:]
+            if not data:
+                return
+
+
+def _parse_chunk(chunk: bytes, dump_date: date, resume_from: int | None) -> tuple[list[tuple], int]:
+    """Воркер process pool: парсит кусок релизов → (строки для COPY, skipped)."""
+    rows: list[tuple] = []
+    skipped = 0
+    root = etree.fromstring(b"<releases>" + chunk + b"</releases>")
+    for elem in root.iterchildren("release"):
+        row = _parse_release(elem, dump_date)
+        if row is None or (resume_from is not None and row["discogs_id"] <= resume_from):
+            skipped += 1
+            continue
+        rows.append(_row_tuple(row))
+    return rows, skipped
+
+
+class _Checkpoint:
+    """Упорядоченный checkpoint: resume-точка двигается только по непрерывному
+    префиксу успешно записанных чанков — иначе рестарт с неё потерял бы
+    чанк, который ещё в полёте или упал."""
+
+    def __init__(self) -> None:
+        self._next_seq = 0
+        self._done: dict[int, int | None] = {}
+        self.resume_from: int | None = None
+
+    def complete(self, seq: int, last_id: int | None) -> None:
+        self._done[seq] = last_id
+        while self._next_seq in self._done:
+            last = self._done.pop(self._next_seq)
+            if last is not None:
+                self.resume_from = last
+            self._next_seq += 1
+
+    @property
+    def lag(self) -> int:
+        """Сколько завершённых чанков ждут более ранний."""
+        return len(self._done)
+
+
+async def ingest_pipelined(
+    file_path: Path,
+    dump_date: date,
+    batch_size: int,
+    limit: int | None,
+    resume_from: int | None,
+    skip_existing: bool,
+    workers: int,
+    copy_connections: int,
+    delta: bool = False,
+    table: str = "discogs_releases_index",
+) -> dict[str, int]:
+    counters = {"parsed": 0, "skipped": 0, "inserted": 0, "errors": 0, "read_bytes": 0}
+    delta_state = await _DeltaState.load() if delta else None
+    started = time.time()
+    loop = asyncio.get_running_loop()
+    checkpoint = _Checkpoint()
+    # Backpressure: не больше 2 чанков на парсер в полёте и 2 на COPY в очереди
+    parse_slots = asyncio.Semaphore(workers * 2)
+    copy_queue: asyncio.Queue = asyncio.Queue(maxsize=copy_connections * 2)
+    stop = asyncio.Event()
+
+    logger.info(
+        "Starting pipelined ingest: file=%s, dump_date=%s, workers=%d, copy=%d, "
+        "batch=%d, limit=%s, resume=%s, skip_existing=%s, delta=%s",
+        file_path, dump_date, workers, copy_connections,
+        batch_size, limit, resume_from, skip_existing, delta,
+    )
+
+    async def parse_one(pool: ProcessPoolExecutor, seq: int, chunk: bytes) -> None:
+        # Слот держим до конца put: готовый чанк, ждущий места в copy_queue,
+        # тоже «в полёте» — иначе при медленном COPY reader запускал бы новые
+        # парсы, а результаты копились бы в памяти.
+        try:
+            try:
+                rows, skipped = await loop.run_in_executor(pool, _parse_chunk, chunk, dump_date, resume_from)
+            except Exception:
+                counters["errors"] += 1
+                logger.exception("parse failed for chunk #%d", seq)
+                rows, skipped = None, 0
+            counters["skipped"] += skipped
+            if rows is not None:
+                if limit:
+                    rows = rows[: max(0, limit - counters["parsed"])]
+                    if counters["parsed"] + len(rows) >= limit:
+                        stop.set()
+                counters["parsed"] += len(rows)
+            # Упавший чанк всё равно кладём — COPY-воркер не отметит его в
+            # checkpoint, и resume-точка не перепрыгнет через потерянные строки.
+            await copy_queue.put((seq, rows))
+        finally:
+            parse_slots.release()
+
+    async def reader(pool: ProcessPoolExecutor) -> None:
+        chunks = _iter_release_chunks(file_path)
+        parse_tasks: list[asyncio.Task] = []
+        seq = 0
+        while not stop.is_set():
+            await parse_slots.acquire()
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                parse_slots.release()
+                break
+            counters["read_bytes"] += len(chunk)
+            parse_tasks.append(asyncio.create_task(parse_one(pool, seq, chunk)))
+            parse_tasks = [t for t in parse_tasks if not t.done()]
+            seq += 1
+        await asyncio.gather(*parse_tasks)
+        for _ in range(copy_connections):
+            await copy_queue.put(None)
+
+    async def copier() -> None:
+        while True:
+            item = await copy_queue.get()
+            if item is None:
+                return
+            seq, rows = item
+            if rows is None:
+                continue
+            to_write = delta_state.filter(rows) if delta_state else rows
+            ok = True
+            for i in range(0, len(to_write), batch_size):
+                batch = to_write[i:i + batch_size]
+                try:
+                    if delta_state:
+                        counters["inserted"] += await _upsert_rows(batch)
+                    else:
+                        counters["inserted"] += await _copy_rows(batch, skip_existing, table)
+                except Exception:
+                    ok = False
+                    counters["errors"] += 1
+                    logger.exception("COPY failed for chunk #%d", seq)
+                    break
+            if ok:
+                checkpoint.complete(seq, rows[-1][0] if rows else None)
+
+    async def reporter() -> None:
+        while True:
+            await asyncio.sleep(30)
+            elapsed = max(time.time() - started, 1)
+            logger.info(
+                "progress: read=%dMB (%.1f MB/s) parsed=%d (%.0f rows/s) "
+                "inserted=%d (%.0f rows/s) skipped=%d errors=%d copy_queue=%d "
+                "checkpoint: resume-from=%s (lag %d chunks)",
+                counters["read_bytes"] >> 20, counters["read_bytes"] / elapsed / (1 << 20),
+                counters["parsed"], counters["parsed"] / elapsed,
+                counters["inserted"], counters["inserted"] / elapsed,
+                counters["skipped"], counters["errors"], copy_queue.qsize(),
+                checkpoint.resume_from, checkpoint.lag,
+            )
+
+    report_task = asyncio.create_task(reporter())
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            await asyncio.gather(reader(pool), *(copier() for _ in range(copy_connections)))
+    finally:
+        report_task.cancel()
+
+    if delta_state:
+        counters.update(delta_state.counters)
+        if counters["errors"] == 0 and not limit and resume_from is None:
+            missing = delta_state.missing_ids()
+            logger.info("delta: deleting %d releases missing from the new dump", len(missing))
+            counters["deleted"] = await _delete_missing(missing)
+            await _record_dump_state(dump_date, counters)
+        else:
+            logger.warning("delta: partial run — missing releases NOT deleted, dump_state not bumped")
+
+    elapsed = time.time() - started
+    logger.info(
+        "Ingest done in %.1fs: %s | rate=%.0f rows/s | checkpoint: resume-from=%s",
+        elapsed, counters, counters["parsed"] / max(elapsed, 1), checkpoint.resume_from,
+    )
+    return counters
+
+
 # ────────────────────────────────────────────────────────────────────────
 # Index building (CREATE INDEX CONCURRENTLY)
 # ────────────────────────────────────────────────────────────────────────
 
 
-# Названия + DDL индексов. CONCURRENTLY — не блокирует таблицу, но требует
-# autocommit (не работает в транзакции).
+# Названия + определения индексов. Живая таблица — CONCURRENTLY (не блокирует
+# таблицу, но требует autocommit — не работает в транзакции).
 _INDEXES = [
-    (
-        "ix_dri_barcode",
-        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dri_barcode "
-        "ON discogs_releases_index (barcode_norm) WHERE barcode_norm IS NOT NULL",
-    ),
-    (
-        "ix_dri_catalog",
-        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dri_catalog "
-        "ON discogs_releases_index (catalog_norm) WHERE catalog_norm IS NOT NULL",
-    ),
-    (
-        "ix_dri_master_id",
-        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dri_master_id "
-        "ON discogs_releases_index (master_id) WHERE master_id IS NOT NULL",
-    ),
-    (
-        "ix_dri_artist_trgm",
-        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dri_artist_trgm "
-        "ON discogs_releases_index USING GIN (artist gin_trgm_ops)",
-    ),
-    (
-        "ix_dri_title_trgm",
-        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dri_title_trgm "
-        "ON discogs_releases_index USING GIN (title gin_trgm_ops)",
-    ),
+    ("ix_dri_barcode", "(barcode_norm) WHERE barcode_norm IS NOT NULL"),
+    ("ix_dri_catalog", "(catalog_norm) WHERE catalog_norm IS NOT NULL"),
+    ("ix_dri_master_id", "(master_id) WHERE master_id IS NOT NULL"),
+    ("ix_dri_artist_trgm", "USING GIN (artist gin_trgm_ops)"),
+    ("ix_dri_title_trgm", "USING GIN (title gin_trgm_ops)"),
 ]
 
+_TABLE = "discogs_releases_index"
+_SHADOW_TABLE = "discogs_releases_index_shadow"
+_OLD_TABLE = "discogs_releases_index_old"
+
 
 async def build_indexes() -> None:
     """Создаёт btree + GIN trigram индексы. Каждый — отдельным CONCURRENTLY."""
@@ -424,17 +808,96 @@ async def build_indexes() -> None:
         raw_conn = await conn.get_raw_connection()
         asyncpg_conn = raw_conn.driver_connection
         await asyncpg_conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
-        for name, ddl in _INDEXES:
+        for name, spec in _INDEXES:
             started = time.time()
             logger.info("  → %s", name)
             try:
                 # CONCURRENTLY требует autocommit; asyncpg по умолчанию вне транзакции.
-                await asyncpg_conn.execute(ddl)
+                await asyncpg_conn.execute(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {_TABLE} {spec}"
+                )
                 logger.info("  ✓ %s built in %.1fs", name, time.time() - started)
             except Exception:
                 logger.exception("  ✗ %s failed", name)
 
 
+# ────────────────────────────────────────────────────────────────────────
+# Shadow-table rebuild + atomic swap
+# ────────────────────────────────────────────────────────────────────────
+
+
+async def prepare_shadow() -> None:
+    """Пустая shadow-копия схемы без индексов (индексы — после COPY)."""
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        await asyncpg_conn.execute(f"DROP TABLE IF EXISTS {_SHADOW_TABLE}")
+        await asyncpg_conn.execute(
+            f"CREATE TABLE {_SHADOW_TABLE} (LIKE {_TABLE} INCLUDING DEFAULTS)"
+        )
+    logger.info("shadow: %s created", _SHADOW_TABLE)
+
+
+async def build_shadow_indexes(maintenance_work_mem: str, index_workers: int) -> None:
+    """PK + все _INDEXES на shadow с щедрым maintenance_work_mem, потом ANALYZE.
+    Ошибка здесь фатальна — без индексов swap делать нельзя."""
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        await asyncpg_conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await asyncpg_conn.execute(f"SET maintenance_work_mem = '{maintenance_work_mem}'")
+        await asyncpg_conn.execute(f"SET max_parallel_maintenance_workers = {int(index_workers)}")
+        await asyncpg_conn.execute("SET statement_timeout = 0")
+
+        started = time.time()
+        await asyncpg_conn.execute(
+            f"ALTER TABLE {_SHADOW_TABLE} ADD CONSTRAINT {_SHADOW_TABLE}_pkey PRIMARY KEY (discogs_id)"
+        )
+        logger.info("  ✓ %s_pkey built in %.1fs", _SHADOW_TABLE, time.time() - started)
+        for name, spec in _INDEXES:
+            started = time.time()
+            await asyncpg_conn.execute(f"CREATE INDEX {name}_shadow ON {_SHADOW_TABLE} {spec}")
+            logger.info("  ✓ %s_shadow built in %.1fs", name, time.time() - started)
+
+        started = time.time()
+        await asyncpg_conn.execute(f"ANALYZE {_SHADOW_TABLE}")
+        logger.info("  ✓ ANALYZE in %.1fs", time.time() - started)
+
+
+async def swap_shadow() -> None:
+    """Атомарный rename: live → _old, shadow → live (с индексами и PK).
+    Читатели видят либо старую, либо новую таблицу — полностью проиндексированную."""
+    async with engine.connect() as conn:
+        raw_conn = await conn.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        async with asyncpg_conn.transaction():
+            # Не висим бесконечно за долгим запросом — лучше упасть и повторить
+            await asyncpg_conn.execute("SET LOCAL lock_timeout = '10s'")
+            await asyncpg_conn.execute(f"DROP TABLE IF EXISTS {_OLD_TABLE}")
+            await asyncpg_conn.execute(f"ALTER TABLE {_TABLE} RENAME TO {_OLD_TABLE}")
+            await asyncpg_conn.execute(
+                f"ALTER TABLE {_OLD_TABLE} RENAME CONSTRAINT {_TABLE}_pkey TO {_OLD_TABLE}_pkey"
+            )
+            for name, _ in _INDEXES:
+                await asyncpg_conn.execute(f"ALTER INDEX IF EXISTS {name} RENAME TO {name}_old")
+            await asyncpg_conn.execute(f"ALTER TABLE {_SHADOW_TABLE} RENAME TO {_TABLE}")
+            await asyncpg_conn.execute(
+                f"ALTER TABLE {_TABLE} RENAME CONSTRAINT {_SHADOW_TABLE}_pkey TO {_TABLE}_pkey"
+            )
+            for name, _ in _INDEXES:
+                await asyncpg_conn.execute(f"ALTER INDEX {name}_shadow RENAME TO {name}")
+        logger.info("shadow: swapped into %s", _TABLE)
+        await asyncpg_conn.execute(f"DROP TABLE IF EXISTS {_OLD_TABLE}")
+
+    # Сбрасываем _dump_available во всех процессах (listing_matcher)
+    from app.services.cache import cache
+    from app.services.listing_matcher import bump_dump_generation
+
+    await cache.connect()
+    await bump_dump_generation()
+    await cache.close()
+
+
 # ────────────────────────────────────────────────────────────────────────
 # CLI
 # ────────────────────────────────────────────────────────────────────────
@@ -449,6 +912,15 @@ async def _main() -> None:
     parser.add_argument("--resume-from", type=int, default=None, help="Продолжить после discogs_id")
     parser.add_argument("--skip-existing", action="store_true", help="ON CONFLICT DO NOTHING")
     parser.add_argument("--build-indexes-only", action="store_true", help="Только создать индексы")
+    parser.add_argument(
+        "--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+        help="Процессов-парсеров (1 = последовательный режим)",
+    )
+    parser.add_argument("--copy-connections", type=int, default=4, help="Параллельных COPY")
+    parser.add_argument("--delta", action="store_true", help="Писать только новые/изменённые, удалять пропавшие")
+    parser.add_argument("--shadow", action="store_true", help="Грузить в shadow-таблицу и атомарно подменить")
+    parser.add_argument("--maintenance-work-mem", default="2GB")
+    parser.add_argument("--index-workers", type=int, default=4)
     args = parser.parse_args()
 
     if args.build_indexes_only:
@@ -462,21 +934,51 @@ async def _main() -> None:
     if not args.file.exists():
         parser.error(f"Файл не найден: {args.file}")
 
+    if args.shadow and (args.delta or args.resume_from is not None):
+        parser.error("--shadow несовместим с --delta и --resume-from")
+
     dump_date = datetime.strptime(args.dump_date, "%Y-%m-%d").date()
 
-    counters = await ingest(
-        file_path=args.file,
-        dump_date=dump_date,
-        batch_size=args.batch_size,
-        limit=args.limit,
-        resume_from=args.resume_from,
-        skip_existing=args.skip_existing,
-    )
+    if args.shadow:
+        await prepare_shadow()
+
+    if args.workers > 1 or args.delta or args.shadow:
+        counters = await ingest_pipelined(
+            file_path=args.file,
+            dump_date=dump_date,
+            batch_size=args.batch_size,
+            limit=args.limit,
+            resume_from=args.resume_from,
+            skip_existing=args.skip_existing,
+            workers=args.workers,
+            copy_connections=args.copy_connections,
+            delta=args.delta,
+            table=_SHADOW_TABLE if args.shadow else _TABLE,
+        )
+    else:
+        counters = await ingest(
+            file_path=args.file,
+            dump_date=dump_date,
+            batch_size=args.batch_size,
+            limit=args.limit,
+            resume_from=args.resume_from,
+            skip_existing=args.skip_existing,
+        )
 
     logger.info("Final counters: %s", counters)
 
-    # Автоматически строим индексы после успешного ingest'а.
-    if counters["inserted"] > 0 and counters["errors"] == 0:
+    if args.shadow:
+        if counters["errors"] or not counters["inserted"]:
+            logger.error("shadow: ingest incomplete — live table untouched, %s left for inspection", _SHADOW_TABLE)
+        else:
+            await build_shadow_indexes(args.maintenance_work_mem, args.index_workers)
+            await swap_shadow()
+        await close_db()
+        return
+
+    # Автоматически строим индексы после успешного ingest'а (в delta-режиме
+    # индексы уже есть и поддерживаются на лету).
+    if counters["inserted"] > 0 and counters["errors"] == 0 and not args.delta:
         await build_indexes()
 
     await close_db()
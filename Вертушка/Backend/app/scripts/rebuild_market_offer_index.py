@@ -0,0 +1,41 @@
+"""
+Полная пересборка market_offer_index (миграция 20261017_market_offer_index).
+
+То же, что часовой reconcile_market_offer_index: DELETE + INSERT из живых
+листингов одной транзакцией — читатели до commit видят прежние строки.
+Нужен один раз после миграции (таблица создаётся пустой) и вручную, если
+поменялись FILTER-условия в app/services/market_index.py.
+
+Usage:
+    docker exec vertushka_api python -m app.scripts.rebuild_market_offer_index
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.database import async_session_maker, close_db
+from app.services.market_index import rebuild_offer_index
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger("rebuild_market_offer_index")
+
+
+async def main() -> None:
+    started = time.monotonic()
+    async with async_session_maker() as db:
+        await rebuild_offer_index(db)
+        await db.commit()
+        total = (await db.execute(text("SELECT count(*) FROM market_offer_index"))).scalar_one()
+    logger.info("market_offer_index rebuilt: %d rows in %.1fs", total, time.monotonic() - started)
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+"""
+Полная пересборка record_offer_summary (миграция 20261017_record_offer_summary).
+
+То же, что часовой reconcile_record_offer_summary: DELETE + INSERT из живых
+листингов одной транзакцией — читатели до commit видят прежние строки.
+Нужен один раз после миграции (таблица создаётся пустой) и вручную, если
+поменялись FILTER-условия в app/services/offer_summary.py.
+
+Usage:
+    docker exec vertushka_api python -m app.scripts.rebuild_record_offer_summary
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.database import async_session_maker, close_db
+from app.services.offer_summary import rebuild_offer_summary
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger("rebuild_record_offer_summary")
+
+
+async def main() -> None:
+    started = time.monotonic()
+    async with async_session_maker() as db:
+        await rebuild_offer_summary(db)
+        await db.commit()
+        total = (await db.execute(text("SELECT count(*) FROM record_offer_summary"))).scalar_one()
+    logger.info("record_offer_summary rebuilt: %d rows in %.1fs", total, time.monotonic() - started)
+    await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
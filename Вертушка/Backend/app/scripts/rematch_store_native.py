@@ -50,7 +50,6 @@ from app.services.listing_matcher import (
     safe_merge_store_native_into,
     STORE_NATIVE_MERGE_MIN_CONFIRMATIONS,
 )
-from app.services.scrapers.extractors import normalize_barcode, normalize_catalog
 
 logging.basicConfig(
     level=logging.INFO,
@@ -434,8 +433,8 @@ async def _process_one(
     fuzzy_only: bool,
     counters: dict,
 ) -> bool:
-    barcode = normalize_barcode(rec.barcode) if rec.barcode else None
-    catalog = normalize_catalog(rec.catalog_number) if rec.catalog_number else None
+    barcode = rec.barcode_norm
+    catalog = rec.catalog_norm
 
     dump_entry: dict | None = None
     confidence: float = 0.0
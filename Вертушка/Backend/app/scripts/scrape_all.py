@@ -21,7 +21,7 @@ from app.models.store import Store
 from app.services.cache import cache
 from app.services.scrapers.http_client import http_client
 from app.services.scrapers.browser import browser_pool
-from app.services.scrapers.runner import crawl_store, _upsert_listing
+from app.services.scrapers.runner import ListingWriter, crawl_store
 from app.services.scrapers.shops import *  # noqa: F401,F403  — register all parsers
 from app.services.scrapers.registry import all_parsers, get_parser
 from app.services.scrapers.http_client import ScraperHttpClient
@@ -103,19 +103,24 @@ async def _refresh_known(slug: str | None) -> None:
 
         print(f"[{store.slug}] refresh-known: {len(rows)} URLs")
         ok = err = changed = 0
-        for row in rows:
-            try:
-                dto = await parser.parse_listing(row.url)
-                async with async_session_maker() as db:
-                    await _upsert_listing(db, store.id, dto)
-                    await db.commit()
-                ok += 1
-                if dto.status != "in_stock":
-                    changed += 1
-            except Exception as e:
-                err += 1
-                logger.warning("refresh-known failed for %s: %s", row.url, e)
-        print(f"[{store.slug}] refresh-known done: ok={ok}, errors={err}, status_changed={changed}")
+        counters = {"upserted": 0, "unchanged": 0, "errors": 0}
+        async with async_session_maker() as db:
+            writer = ListingWriter(db, store.id, counters)
+            for row in rows:
+                try:
+                    dto = await parser.parse_listing(row.url)
+                    await writer.add(dto)
+                    ok += 1
+                    if dto.status != "in_stock":
+                        changed += 1
+                except Exception as e:
+                    err += 1
+                    logger.warning("refresh-known failed for %s: %s", row.url, e)
+            await writer.flush()
+        print(
+            f"[{store.slug}] refresh-known done: ok={ok}, errors={err}, "
+            f"status_changed={changed}, db={counters}"
+        )
 
 
 async def main_async(args: argparse.Namespace) -> None:
@@ -18,6 +18,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.user_achievement import UserAchievement
+from app.services.feed import record_feed_event
 from app.services.achievements.registry import (
     AchievementDefinition,
     EvalResult,
@@ -163,6 +164,8 @@ async def _persist(
         )
         db.add(ua)
         await db.flush()
+        if ua.is_unlocked:
+            await _record_unlock(db, ua)
         return
 
     if result.unlocked:
@@ -175,6 +178,7 @@ async def _persist(
         if result.metadata is not None:
             existing.ach_metadata = result.metadata
         await db.flush()
+        await _record_unlock(db, existing)
         return
 
     if result.progress is not None and result.progress > existing.progress:
@@ -182,3 +186,15 @@ async def _persist(
         if result.progress_target is not None:
             existing.progress_target = result.progress_target
         await db.flush()
+
+
+async def _record_unlock(db: AsyncSession, ua: UserAchievement) -> None:
+    """Событие friend_achievement в ленту подписчиков."""
+    await record_feed_event(
+        db,
+        "friend_achievement",
+        source_id=ua.id,
+        actor_id=ua.user_id,
+        created_at=ua.unlocked_at,
+        payload={"code": ua.code},
+    )
@@ -34,6 +34,9 @@ from app.services.achievements.registry import (
 
 logger = logging.getLogger(__name__)
 
+# Поднять при изменении композиции — сменит ключи в render_cache
+SHARE_CARD_RENDER_VERSION = 1
+
 
 TIER_BG_COLORS: dict[AchievementTier, tuple[str, str]] = {
     # (верхний → нижний) для линейного градиента
@@ -3,9 +3,17 @@ Redis-кэш для Вертушка API.
 
 Graceful fallback: если Redis недоступен — приложение работает без кэша.
 Singleton-паттерн: один connection pool на всё приложение.
+
+Двухуровневый: для горячих namespace'ов (релизы, мастера, цены) перед Redis
+стоит in-process L1 — LRU с лимитом по байтам и TTL. L1 хранит сырые
+orjson-байты, а не объекты: каждый get() отдаёт свежую копию, и вызывающий
+может мутировать результат, не портя кэш соседям.
 """
+import asyncio
 import hashlib
 import logging
+import time
+from collections import OrderedDict
 from typing import Any
 
 import orjson
@@ -27,6 +35,90 @@ TTL_SEARCH = 600              # 10 минут — выдача может обн
 TTL_PRICE_STATS = 6 * 3600    # 6 часов — цены меняются
 TTL_MASTER_VERSIONS = 3 * 86400  # 3 дня
 TTL_MASTER_INFO = 7 * 86400   # 7 дней — обложки почти не меняются
+TTL_OFFERS_SUMMARY = 120      # 2 минуты — record_offer_summary меняется на записи листингов
+TTL_PUBLIC_PROFILE = 300      # 5 минут — HTML /@username; записи владельца сбрасывают сразу
+TTL_OG_COVER_MISSING = 6 * 3600  # 6 часов — не скачавшаяся обложка OG-картинки, до повторной попытки
+
+# Namespace'ы, которые дублируются в L1, и их базовый TTL. Фактический TTL
+# в L1 = min(TTL namespace'а, CACHE_L1_TTL_SECONDS): между воркерами L1 не
+# синхронизируется, поэтому держим его коротким.
+_L1_NAMESPACES: dict[str, int] = {
+    "release": TTL_RELEASE,
+    "master": TTL_MASTER,
+    "master_info": TTL_MASTER_INFO,
+    "master_versions": TTL_MASTER_VERSIONS,
+    "price_stats": TTL_PRICE_STATS,
+    "price_stats_404": TTL_PRICE_STATS,
+    "artist": TTL_ARTIST,
+    "artist_thumb": TTL_ARTIST_THUMB,
+    "artist_thumb_404": TTL_ARTIST_THUMB,
+    "offers_summary": TTL_OFFERS_SUMMARY,
+    "og_cover_missing": TTL_OG_COVER_MISSING,
+}
+
+
+class _LocalLRU:
+    """Bounded LRU одного namespace'а: лимит по суммарному размеру значений
+    в байтах + TTL на запись. Не потокобезопасен — живёт в одном event loop.
+    """
+
+    def __init__(self, max_bytes: int, ttl: int) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, raw = item
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return raw
+
+    def set(self, key: str, raw: bytes, ttl: int | None = None) -> None:
+        size = len(raw)
+        if size > self.max_bytes:
+            return
+        self._pop(key)
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        self._data[key] = (time.monotonic() + ttl, raw)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, old) = self._data.popitem(last=False)
+            self._bytes -= len(old)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        self._pop(key)
+
+    def _pop(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[1])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "size_kb": round(self._bytes / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
 
 
 class RedisCache:
@@ -35,6 +127,26 @@ class RedisCache:
     def __init__(self) -> None:
         self._pool: redis.Redis | None = None
         self._available = False
+        self._l1: dict[str, _LocalLRU] = {}
+        self.configure_l1()
+        # Pub/sub: одно subscriber-соединение на воркер, ждущие — локальные futures
+        self._waiters: dict[str, set[asyncio.Future]] = {}
+        self._listener_task: asyncio.Task | None = None
+        self._listener_lock: asyncio.Lock | None = None
+        self._scripts: dict[str, Any] = {}
+
+    def configure_l1(self) -> None:
+        """(Пере)создать L1 по настройкам. CACHE_L1_ENABLED=false — только Redis."""
+        settings = get_settings()
+        self._l1 = {}
+        if not settings.cache_l1_enabled:
+            return
+        max_bytes = settings.cache_l1_max_mb_per_namespace * 1024 * 1024
+        for namespace, ttl in _L1_NAMESPACES.items():
+            self._l1[namespace] = _LocalLRU(
+                max_bytes=max_bytes,
+                ttl=min(ttl, settings.cache_l1_ttl_seconds),
+            )
 
     async def connect(self) -> None:
         """Подключение к Redis. Не крашит приложение при недоступности."""
@@ -57,10 +169,14 @@ class RedisCache:
 
     async def close(self) -> None:
         """Закрытие соединения."""
+        if self._listener_task and not self._listener_task.done():
+            self._listener_task.cancel()
+        self._listener_task = None
         if self._pool:
             await self._pool.aclose()
             self._pool = None
             self._available = False
+            self._scripts = {}
 
     @property
     def available(self) -> bool:
@@ -70,30 +186,105 @@ class RedisCache:
         return f"{_KEY_PREFIX}:{namespace}:{key}"
 
     async def get(self, namespace: str, key: str) -> Any | None:
-        """Получить значение из кэша. Возвращает None при промахе или ошибке."""
+        """Получить значение из кэша. Возвращает None при промахе или ошибке.
+
+        Сначала L1 (если namespace в нём есть), потом Redis; попадание в
+        Redis прогревает L1.
+        """
+        l1 = self._l1.get(namespace)
+        if l1 is not None:
+            raw = l1.get(key)
+            if raw is not None:
+                return orjson.loads(raw)
         if not self._available:
             return None
         try:
             raw = await self._pool.get(self._key(namespace, key))
             if raw is None:
                 return None
-            return orjson.loads(raw)
+            value = orjson.loads(raw)
+            if l1 is not None:
+                l1.set(key, raw)
+            return value
         except Exception:
             logger.warning("Redis GET error: %s:%s", namespace, key, exc_info=True)
             return None
 
     async def set(self, namespace: str, key: str, value: Any, ttl: int) -> None:
         """Записать значение в кэш с TTL."""
-        if not self._available:
+        l1 = self._l1.get(namespace)
+        if not self._available and l1 is None:
             return
         try:
             raw = orjson.dumps(value)
+        except Exception:
+            logger.warning("Cache serialize error: %s:%s", namespace, key, exc_info=True)
+            return
+        if l1 is not None:
+            l1.set(key, raw, ttl)
+        if not self._available:
+            return
+        try:
             await self._pool.set(self._key(namespace, key), raw, ex=ttl)
         except Exception:
             logger.warning("Redis SET error: %s:%s", namespace, key, exc_info=True)
 
+    async def get_many(self, namespace: str, keys: list[str]) -> dict[str, Any]:
+        """Batch-get: {key: value} только для попаданий. L1, затем один MGET
+        в Redis на оставшиеся ключи (попадания прогревают L1)."""
+        found: dict[str, Any] = {}
+        missing: list[str] = []
+        l1 = self._l1.get(namespace)
+        for key in keys:
+            raw = l1.get(key) if l1 is not None else None
+            if raw is None:
+                missing.append(key)
+            else:
+                found[key] = orjson.loads(raw)
+        if not missing or not self._available:
+            return found
+        try:
+            raws = await self._pool.mget([self._key(namespace, k) for k in missing])
+        except Exception:
+            logger.warning("Redis MGET error: %s (%d keys)", namespace, len(missing), exc_info=True)
+            return found
+        for key, raw in zip(missing, raws):
+            if raw is None:
+                continue
+            found[key] = orjson.loads(raw)
+            if l1 is not None:
+                l1.set(key, raw)
+        return found
+
+    async def set_many(self, namespace: str, items: dict[str, Any], ttl: int) -> None:
+        """Batch-set с общим TTL: один pipeline в Redis."""
+        l1 = self._l1.get(namespace)
+        if not items or (not self._available and l1 is None):
+            return
+        try:
+            raws = {key: orjson.dumps(value) for key, value in items.items()}
+        except Exception:
+            logger.warning("Cache serialize error: %s (%d keys)", namespace, len(items), exc_info=True)
+            return
+        if l1 is not None:
+            for key, raw in raws.items():
+                l1.set(key, raw, ttl)
+        if not self._available:
+            return
+        try:
+            async with self._pool.pipeline(transaction=False) as pipe:
+                for key, raw in raws.items():
+                    pipe.set(self._key(namespace, key), raw, ex=ttl)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Redis pipeline SET error: %s (%d keys)", namespace, len(items), exc_info=True)
+
     async def delete(self, namespace: str, key: str) -> None:
-        """Удалить ключ из кэша."""
+        """Удалить ключ из кэша. L1 чистится только в текущем воркере —
+        в остальных запись доживёт до своего (короткого) L1 TTL."""
+        l1 = self._l1.get(namespace)
+        if l1 is not None:
+            l1.delete(key)
         if not self._available:
             return
         try:
@@ -103,6 +294,9 @@ class RedisCache:
 
     async def exists(self, namespace: str, key: str) -> bool:
         """Проверить существование ключа."""
+        l1 = self._l1.get(namespace)
+        if l1 is not None and l1.get(key) is not None:
+            return True
         if not self._available:
             return False
         try:
@@ -126,10 +320,193 @@ class RedisCache:
             logger.warning("Redis SET NX error: %s:%s", namespace, key, exc_info=True)
             return True
 
+    async def run_script(self, script: str, namespace: str, keys: list[str], args: list) -> Any | None:
+        """EVALSHA Lua-скрипта (с авто-загрузкой). Ключи префиксуются как
+        обычные ключи кэша. None — Redis недоступен или скрипт упал:
+        вызывающий деградирует на локальную логику."""
+        if not self._available:
+            return None
+        try:
+            compiled = self._scripts.get(script)
+            if compiled is None:
+                compiled = self._pool.register_script(script)
+                self._scripts[script] = compiled
+            return await compiled(keys=[self._key(namespace, k) for k in keys], args=args)
+        except Exception:
+            logger.warning("Redis EVALSHA error: %s", namespace, exc_info=True)
+            return None
+
+    # ------------------------------------------------------------------
+    # Pub/sub уведомления (single-flight между воркерами)
+    # ------------------------------------------------------------------
+
+    async def listen(self, channel: str) -> asyncio.Future | None:
+        """Подписаться на одно сообщение в channel. Возвращает future, который
+        резолвится payload'ом первого publish() (или None, если subscriber
+        умер). None вместо future — pub/sub недоступен, вызывающий должен
+        деградировать сам.
+
+        Подписка активна к моменту возврата: всё, что опубликуют после,
+        гарантированно дойдёт. Не забудьте unlisten() в finally.
+        """
+        if not self._available or not await self._ensure_listener():
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(channel, set()).add(future)
+        return future
+
+    def unlisten(self, channel: str, future: asyncio.Future) -> None:
+        waiters = self._waiters.get(channel)
+        if waiters is None:
+            return
+        waiters.discard(future)
+        if not waiters:
+            del self._waiters[channel]
+
+    async def publish(self, channel: str, value: Any) -> None:
+        """Разослать value всем listen(channel) во всех воркерах."""
+        if not self._available:
+            self._dispatch(channel, value)
+            return
+        try:
+            await self._pool.publish(self._key("notify", channel), orjson.dumps(value))
+        except Exception:
+            logger.warning("Redis PUBLISH error: %s", channel, exc_info=True)
+            # Свои ждущие хотя бы не досидят до таймаута
+            self._dispatch(channel, value)
+
+    def _dispatch(self, channel: str, value: Any) -> None:
+        for future in self._waiters.pop(channel, ()):
+            if not future.done():
+                future.set_result(value)
+
+    async def _ensure_listener(self) -> bool:
+        if self._listener_task is not None and not self._listener_task.done():
+            return True
+        if self._listener_lock is None:
+            self._listener_lock = asyncio.Lock()
+        async with self._listener_lock:
+            if self._listener_task is not None and not self._listener_task.done():
+                return True
+            pubsub = self._pool.pubsub()
+            try:
+                await pubsub.psubscribe(self._key("notify", "*"))
+                # Ждём подтверждение, иначе publish, отправленный сразу после
+                # listen(), может проскочить мимо ещё не активной подписки.
+                confirmed = False
+                for _ in range(10):
+                    msg = await pubsub.get_message(timeout=0.5)
+                    if msg and msg.get("type") == "psubscribe":
+                        confirmed = True
+                        break
+                if not confirmed:
+                    raise TimeoutError("psubscribe not confirmed")
+            except Exception:
+                logger.warning("Redis pub/sub unavailable", exc_info=True)
+                await pubsub.aclose()
+                return False
+            self._listener_task = asyncio.create_task(self._listen_loop(pubsub))
+            return True
+
+    async def _listen_loop(self, pubsub) -> None:
+        prefix = self._key("notify", "")
+        try:
+            while True:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg is None or msg.get("type") != "pmessage":
+                    continue
+                channel = msg["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                try:
+                    payload = orjson.loads(msg["data"])
+                except orjson.JSONDecodeError:
+                    continue
+                self._dispatch(channel[len(prefix):], payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Redis pub/sub listener died", exc_info=True)
+        finally:
+            # Будим всех ждущих — пусть решают сами, а не ждут таймаута
+            for channel in list(self._waiters):
+                self._dispatch(channel, None)
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------
+    # Сырые каналы и presence (fan-out WebSocket, см. messages_ws_hub)
+    # ------------------------------------------------------------------
+
+    def channel_name(self, namespace: str, key: str) -> str:
+        """Полное имя канала/ключа namespace:key (с префиксом кэша) — по нему
+        подписываются и по нему же разбирают пришедшие сообщения."""
+        return self._key(namespace, key)
+
+    def open_pubsub(self):
+        """Новое subscriber-соединение (закрывает вызывающий). None — Redis недоступен."""
+        if not self._available:
+            return None
+        return self._pool.pubsub()
+
+    async def publish_raw(self, namespace: str, key: str, raw: bytes) -> bool:
+        """PUBLISH готовых байт в канал namespace:key. False — не ушло."""
+        if not self._available:
+            return False
+        try:
+            await self._pool.publish(self._key(namespace, key), raw)
+            return True
+        except Exception:
+            logger.warning("Redis PUBLISH error: %s", namespace, exc_info=True)
+            return False
+
+    async def presence_touch(self, namespace: str, keys: list[str], member: str, ttl: int) -> None:
+        """Отметить member в ZSET'ах keys со score = дедлайн (now + ttl)."""
+        if not self._available or not keys:
+            return
+        deadline = time.time() + ttl
+        try:
+            async with self._pool.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    full = self._key(namespace, key)
+                    pipe.zadd(full, {member: deadline})
+                    pipe.expire(full, ttl)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Redis presence touch error: %s", namespace, exc_info=True)
+
+    async def presence_drop(self, namespace: str, keys: list[str], member: str) -> None:
+        """Убрать member из ZSET'ов keys."""
+        if not self._available or not keys:
+            return
+        try:
+            async with self._pool.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.zrem(self._key(namespace, key), member)
+                await pipe.execute()
+        except Exception:
+            logger.warning("Redis presence drop error: %s", namespace, exc_info=True)
+
+    async def presence_count(self, namespace: str, key: str) -> int:
+        """Сколько member'ов в ZSET key с ещё не истёкшим дедлайном. 0 — без Redis."""
+        if not self._available:
+            return 0
+        try:
+            return int(await self._pool.zcount(self._key(namespace, key), time.time(), "+inf"))
+        except Exception:
+            logger.warning("Redis presence lookup error: %s", namespace, exc_info=True)
+            return 0
+
+    def l1_stats(self) -> dict:
+        """hit/miss/eviction счётчики L1 по namespace'ам (для /health)."""
+        return {namespace: l1.stats() for namespace, l1 in self._l1.items()}
+
     async def health(self) -> dict:
         """Статус Redis для /health endpoint."""
         if not self._available:
-            return {"status": "unavailable"}
+            return {"status": "unavailable", "l1": self.l1_stats()}
         try:
             await self._pool.ping()
             info = await self._pool.info("memory")
@@ -137,9 +514,10 @@ class RedisCache:
                 "status": "connected",
                 "used_memory_mb": round(info.get("used_memory", 0) / 1024 / 1024, 1),
                 "max_memory_mb": round(info.get("maxmemory", 0) / 1024 / 1024, 1),
+                "l1": self.l1_stats(),
             }
         except Exception:
-            return {"status": "error"}
+            return {"status": "error", "l1": self.l1_stats()}
 
 
 def search_cache_key(params: dict) -> str:
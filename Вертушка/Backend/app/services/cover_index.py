@@ -0,0 +1,347 @@
+"""
+Персистентный индекс CLIP-эмбеддингов обложек (ключ — discogs_id релиза).
+
+Зачем: /scan/cover/ на каждый запрос качал до 12 обложек кандидатов и
+эмбеддил их на CPU — одни и те же популярные обложки тысячи раз в день.
+Теперь вектор обложки считается один раз (при скачивании в
+CoverStorageService.download_and_store, при первом rerank'е или фоновым
+build_cover_embedding_index) и дальше читается с диска.
+
+Хранение (uploads/embeddings/):
+  - pending/{discogs_id}.f16 — свежие векторы (512 × float16 = 1 КБ), пишутся
+    любым процессом атомарно (tmp + rename);
+  - index-{ver}.npy / .ids.npy / .ivf.npz — компактный индекс: матрица
+    N × 512 float16 (memmap, страницы делятся между воркерами через page
+    cache), discogs_id int64 и IVF-разбиение (центроиды + offsets);
+  - CURRENT — имя актуальной версии, переключается rename'ом.
+
+compact() (только scheduler-контейнер) вливает pending в новую версию
+индекса. Читатели раз в _RELOAD_CHECK_SEC сверяют CURRENT и подхватывают
+новую версию без рестарта.
+
+ANN: IVF поверх k-means центроидов — search() пробегает только _NPROBE
+ближайших кластеров, каждый лежит в матрице непрерывным срезом. На малом
+каталоге (< _IVF_MIN_ROWS) — точный перебор.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DIM = 512
+_EMB_DIR = Path(settings.covers_dir).parent / "embeddings"
+_PENDING_DIR = _EMB_DIR / "pending"
+_CURRENT = _EMB_DIR / "CURRENT"
+_LOCK_FILE = _EMB_DIR / ".compact.lock"
+
+_RELOAD_CHECK_SEC = 60.0
+# IVF: ниже этого размера точный перебор быстрее и без потерь recall
+_IVF_MIN_ROWS = 20_000
+_NPROBE = 16
+_KMEANS_SAMPLE = 50_000
+_KMEANS_ITERS = 10
+# Сколько строк гоняем за раз при присвоении кластеров / копировании
+_CHUNK_ROWS = 65_536
+
+
+def _version_paths(ver: str) -> tuple[Path, Path, Path]:
+    return (
+        _EMB_DIR / f"index-{ver}.npy",
+        _EMB_DIR / f"index-{ver}.ids.npy",
+        _EMB_DIR / f"index-{ver}.ivf.npz",
+    )
+
+
+class CoverEmbeddingIndex:
+    """Процессный синглтон: lookup по discogs_id, запись pending, ANN-поиск."""
+
+    def __init__(self) -> None:
+        self._ver: str | None = None
+        self._vectors: np.ndarray | None = None  # memmap [N, DIM] float16
+        self._sorted_ids: np.ndarray | None = None  # int64, отсортированы
+        self._sorted_rows: np.ndarray | None = None  # строка матрицы для _sorted_ids[i]
+        self._row_ids: np.ndarray | None = None  # discogs_id по номеру строки
+        self._centroids: np.ndarray | None = None  # [nlist, DIM] float32
+        self._offsets: np.ndarray | None = None  # [nlist + 1]
+        self._checked_at: float | None = None
+
+    # ---- загрузка версии ----
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < _RELOAD_CHECK_SEC:
+            return
+        self._checked_at = now
+        try:
+            ver = _CURRENT.read_text().strip()
+        except OSError:
+            return
+        if not ver or ver == self._ver:
+            return
+        vec_path, ids_path, ivf_path = _version_paths(ver)
+        try:
+            vectors = np.load(vec_path, mmap_mode="r")
+            row_ids = np.load(ids_path)
+            ivf = np.load(ivf_path)
+        except (OSError, ValueError) as e:
+            logger.warning("cover_index: не удалось загрузить версию %s: %s", ver, e)
+            return
+        order = np.argsort(row_ids, kind="stable")
+        self._vectors = vectors
+        self._row_ids = row_ids
+        self._sorted_ids = row_ids[order]
+        self._sorted_rows = order
+        self._centroids = ivf["centroids"]
+        self._offsets = ivf["offsets"]
+        self._ver = ver
+        logger.info("cover_index: загружена версия %s (%d векторов)", ver, len(row_ids))
+
+    # ---- lookup / запись ----
+
+    def _row_of(self, discogs_id: int) -> int | None:
+        if self._sorted_ids is None or not len(self._sorted_ids):
+            return None
+        pos = int(np.searchsorted(self._sorted_ids, discogs_id))
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == discogs_id:
+            return int(self._sorted_rows[pos])
+        return None
+
+    def get(self, discogs_id: str) -> np.ndarray | None:
+        """Сохранённый L2-нормализованный вектор (float32) или None."""
+        if not discogs_id.isdigit():
+            return None
+        self._maybe_reload()
+        row = self._row_of(int(discogs_id))
+        if row is not None:
+            return np.asarray(self._vectors[row], dtype=np.float32)
+        try:
+            raw = (_PENDING_DIR / f"{discogs_id}.f16").read_bytes()
+        except OSError:
+            return None
+        if len(raw) != DIM * 2:
+            return None
+        return np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+
+    def has(self, discogs_id: str) -> bool:
+        """Есть ли вектор (в индексе или pending) — без чтения самого вектора."""
+        if not discogs_id.isdigit():
+            return False
+        self._maybe_reload()
+        if self._row_of(int(discogs_id)) is not None:
+            return True
+        return (_PENDING_DIR / f"{discogs_id}.f16").exists()
+
+    def get_many(self, discogs_ids: list[str]) -> dict[str, np.ndarray]:
+        out: dict[str, np.ndarray] = {}
+        for discogs_id in discogs_ids:
+            vec = self.get(discogs_id)
+            if vec is not None:
+                out[discogs_id] = vec
+        return out
+
+    def put(self, discogs_id: str, vec: np.ndarray) -> None:
+        """Записать вектор в pending (попадёт в ANN после следующего compact)."""
+        if not discogs_id.isdigit():
+            return
+        _PENDING_DIR.mkdir(parents=True, exist_ok=True)
+        dest = _PENDING_DIR / f"{discogs_id}.f16"
+        tmp = _PENDING_DIR / f".tmp_{discogs_id}_{uuid.uuid4().hex}"
+        tmp.write_bytes(np.asarray(vec, dtype=np.float16).tobytes())
+        os.replace(tmp, dest)
+
+    async def embed_and_store(self, discogs_id: str, image_bytes: bytes) -> np.ndarray | None:
+        """Эмбеддинг обложки через CoverMatcher + запись в pending."""
+        from app.services.cover_matcher import CoverMatcher
+
+        matcher = await CoverMatcher.get()
+        vec = await matcher.embed(image_bytes)
+        if vec is not None:
+            await asyncio.to_thread(self.put, discogs_id, vec)
+        return vec
+
+    # ---- ANN ----
+
+    def _search_sync(self, query: np.ndarray, k: int) -> list[tuple[str, float]]:
+        self._maybe_reload()
+        if self._vectors is None or not len(self._row_ids):
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        if len(self._centroids) <= 1:
+            ranges = [(0, len(self._row_ids))]
+        else:
+            nprobe = min(_NPROBE, len(self._centroids))
+            probe = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+            ranges = [(int(self._offsets[c]), int(self._offsets[c + 1])) for c in probe]
+
+        rows: list[np.ndarray] = []
+        scores: list[np.ndarray] = []
+        for start, end in ranges:
+            for lo in range(start, end, _CHUNK_ROWS):
+                hi = min(end, lo + _CHUNK_ROWS)
+                block = np.asarray(self._vectors[lo:hi], dtype=np.float32)
+                s = block @ q
+                if len(s) > k:
+                    top = np.argpartition(-s, k - 1)[:k]
+                    s, idx = s[top], top + lo
+                else:
+                    idx = np.arange(lo, hi)
+                rows.append(idx)
+                scores.append(s)
+        if not rows:
+            return []
+        all_rows = np.concatenate(rows)
+        all_scores = np.concatenate(scores)
+        best = np.argsort(-all_scores)[:k]
+        return [
+            (str(int(self._row_ids[all_rows[i]])), round(float(all_scores[i]), 4))
+            for i in best
+        ]
+
+    async def search(self, query: np.ndarray, k: int = 15) -> list[tuple[str, float]]:
+        """Top-k похожих обложек по всему индексу: [(discogs_id, cosine), ...]."""
+        return await asyncio.to_thread(self._search_sync, query, k)
+
+    def stats(self) -> dict:
+        self._maybe_reload()
+        try:
+            pending = sum(1 for p in _PENDING_DIR.iterdir() if p.suffix == ".f16")
+        except OSError:
+            pending = 0
+        return {
+            "version": self._ver,
+            "vectors": int(len(self._row_ids)) if self._row_ids is not None else 0,
+            "lists": int(len(self._centroids)) if self._centroids is not None else 0,
+            "pending": pending,
+        }
+
+    # ---- компактизация (scheduler) ----
+
+    def compact(self) -> int:
+        """Влить pending в новую версию индекса. Возвращает размер новой версии.
+
+        Берёт file lock — параллельный запуск просто выходит с 0.
+        """
+        _EMB_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_LOCK_FILE, "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("cover_index: compact уже идёт в другом процессе")
+                return 0
+            return self._compact_locked()
+
+    def _compact_locked(self) -> int:
+        self._checked_at = None
+        self._maybe_reload()
+        pending_files = sorted(_PENDING_DIR.glob("*.f16")) if _PENDING_DIR.exists() else []
+        if not pending_files:
+            return len(self._row_ids) if self._row_ids is not None else 0
+
+        new_ids: list[int] = []
+        new_vecs: list[np.ndarray] = []
+        for p in pending_files:
+            raw = p.read_bytes()
+            if len(raw) == DIM * 2:
+                new_ids.append(int(p.stem))
+                new_vecs.append(np.frombuffer(raw, dtype=np.float16))
+        pending_ids = np.asarray(new_ids, dtype=np.int64)
+        pending_vecs = np.vstack(new_vecs) if new_vecs else np.empty((0, DIM), np.float16)
+
+        # Старые строки, не перезаписанные pending'ом
+        if self._row_ids is not None and len(self._row_ids):
+            keep = np.flatnonzero(~np.isin(self._row_ids, pending_ids))
+            old_vectors, old_ids = self._vectors, self._row_ids[keep]
+        else:
+            keep, old_vectors, old_ids = np.empty(0, np.int64), None, np.empty(0, np.int64)
+        total = len(keep) + len(pending_ids)
+
+        def _rows(sel: np.ndarray) -> np.ndarray:
+            """Строки объединённой матрицы (старые keep + pending) по индексам."""
+            out = np.empty((len(sel), DIM), dtype=np.float16)
+            is_old = sel < len(keep)
+            if is_old.any():
+                out[is_old] = old_vectors[keep[sel[is_old]]]
+            if (~is_old).any():
+                out[~is_old] = pending_vecs[sel[~is_old] - len(keep)]
+            return out
+
+        all_ids = np.concatenate([old_ids, pending_ids])
+        centroids = self._train_centroids(total, _rows)
+        assign = np.empty(total, dtype=np.int32)
+        for lo in range(0, total, _CHUNK_ROWS):
+            sel = np.arange(lo, min(total, lo + _CHUNK_ROWS))
+            block = _rows(sel).astype(np.float32)
+            assign[lo:lo + len(sel)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+        ver = time.strftime("%Y%m%d%H%M%S") + f"-{uuid.uuid4().hex[:6]}"
+        vec_path, ids_path, ivf_path = _version_paths(ver)
+        out = np.lib.format.open_memmap(vec_path, mode="w+", dtype=np.float16, shape=(total, DIM))
+        for lo in range(0, total, _CHUNK_ROWS):
+            sel = order[lo:lo + _CHUNK_ROWS]
+            out[lo:lo + len(sel)] = _rows(sel)
+        out.flush()
+        del out
+        np.save(ids_path, all_ids[order])
+        np.savez(ivf_path, centroids=centroids, offsets=offsets)
+
+        tmp = _EMB_DIR / f".CURRENT.{uuid.uuid4().hex}"
+        tmp.write_text(ver)
+        os.replace(tmp, _CURRENT)
+        old_ver = self._ver
+        self._checked_at = None
+        self._maybe_reload()
+
+        for p in pending_files:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+        # Старую версию удаляем: открытые memmap'ы в других воркерах держат
+        # inode до перезагрузки, на Linux это безопасно.
+        if old_ver and old_ver != ver:
+            for path in _version_paths(old_ver):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        logger.info(
+            "cover_index: compact → %s, %d векторов (+%d pending), %d кластеров",
+            ver, total, len(pending_ids), len(centroids),
+        )
+        return total
+
+    @staticmethod
+    def _train_centroids(total: int, rows) -> np.ndarray:
+        """Сферический k-means на сэмпле. nlist ≈ √N; на малом каталоге — 1."""
+        if total < _IVF_MIN_ROWS:
+            return np.zeros((1, DIM), dtype=np.float32)
+        nlist = min(4096, int(np.sqrt(total)))
+        rng = np.random.default_rng(0)
+        sample_idx = np.sort(rng.choice(total, size=min(total, _KMEANS_SAMPLE), replace=False))
+        sample = rows(sample_idx).astype(np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(_KMEANS_ITERS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            sums[~empty] /= norms[~empty]
+            sums[empty] = centroids[empty]
+            centroids = sums
+        return centroids
+
+
+cover_index = CoverEmbeddingIndex()
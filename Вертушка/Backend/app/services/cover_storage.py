@@ -20,6 +20,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import get_settings
 from app.services.cache import cache
+from app.services.cover_index import cover_index
 
 logger = logging.getLogger(__name__)
 
@@ -143,6 +144,8 @@ class CoverStorageService:
             )
             await db.commit()
             logger.info("cover_storage: saved cover for %s → %s", discogs_id, rel_path)
+            if self._settings.cover_embed_on_download:
+                await self._embed_cover(discogs_id, dest)
             return rel_path
 
         except Exception as exc:
@@ -157,6 +160,15 @@ class CoverStorageService:
                     pass
             await self._release_lock(discogs_id)
 
+    async def _embed_cover(self, discogs_id: str, path: Path) -> None:
+        """CLIP-вектор свежей обложки в cover_index. Best-effort: при ошибке
+        вектор досчитает build_cover_embedding_index."""
+        try:
+            image_bytes = await asyncio.to_thread(path.read_bytes)
+            await cover_index.embed_and_store(discogs_id, image_bytes)
+        except Exception as exc:
+            logger.warning("cover_storage: embedding failed for %s: %s", discogs_id, exc)
+
     def get_cover_path(self, discogs_id: str) -> Path | None:
         """Возвращает Path к локальной обложке или None если не скачана."""
         p = self._cover_path(discogs_id)
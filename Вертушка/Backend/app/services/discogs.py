@@ -75,6 +75,18 @@ class CircuitOpenError(Exception):
     """Raised when Discogs circuit breaker is OPEN — fast-fail без похода в сеть."""
 
 
+class SingleFlightLeaderError(Exception):
+    """Лидер single-flight (другой воркер) получил ошибку от Discogs.
+
+    Ждущие не повторяют запрос, а падают с той же причиной — иначе холодный
+    404/503 превращается в N одинаковых запросов к Discogs.
+    """
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
 class _CircuitBreaker:
     """Circuit breaker для Discogs.
 
@@ -228,6 +240,9 @@ class DiscogsService:
                 raise
 
             status_code = last_response.status_code
+            await discogs_limiter.sync_from_headers(last_response.headers)
+            if status_code == 429:
+                await discogs_limiter.on_rate_limited(priority)
             if status_code in (429, 503) and attempt < 2:
                 retry_after = int(last_response.headers.get("Retry-After", "2"))
                 logger.warning("Discogs %d, retry after %ds", status_code, retry_after)
@@ -258,6 +273,9 @@ class DiscogsService:
             return None
         return re.sub(r'_\d+\.(jpg|jpeg|png)', r'_500.\1', thumb_url)
 
+    # In-process single-flight: (namespace, key) → future лидера в этом воркере
+    _inflight: dict[tuple[str, str], asyncio.Future] = {}
+
     async def _single_flight(
         self,
         namespace: str,
@@ -269,23 +287,140 @@ class DiscogsService:
         lock_ttl: int = 30,
     ):
         """Single-flight: схлопывает параллельные запросы за одним ресурсом
-        в один HTTP-вызов. Если lock не взят — polling кэша до wait_total
-        секунд, потом fallback на собственный запрос.
+        в один HTTP-вызов.
+
+        Внутри воркера — общий future: первый вызов становится лидером,
+        остальные ждут его результат (или его исключение) без похода в Redis.
+        Между воркерами — Redis-lock + pub/sub уведомление от лидера
+        (см. _single_flight_across_workers).
+        """
+        flight_key = (namespace, key)
+        while (inflight := DiscogsService._inflight.get(flight_key)) is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Лидера отменили (таймаут его HTTP-запроса) — сами не
+                # отменены, значит пробуем стать лидером.
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        DiscogsService._inflight[flight_key] = future
+        try:
+            result = await self._single_flight_across_workers(
+                namespace, key, loader,
+                wait_total=wait_total,
+                poll_interval=poll_interval,
+                lock_ttl=lock_ttl,
+            )
+        except BaseException as exc:
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                # Исключение лидера уже проброшено вызывающему — не даём
+                # asyncio ругаться "Future exception was never retrieved",
+                # если ждущих не было.
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            DiscogsService._inflight.pop(flight_key, None)
+
+    async def _single_flight_across_workers(
+        self,
+        namespace: str,
+        key: str,
+        loader,
+        *,
+        wait_total: float,
+        poll_interval: float,
+        lock_ttl: int,
+    ):
+        """Лидер — тот, кто взял Redis-lock; по завершении он публикует исход
+        в канал sf:{namespace}:{key}. Остальные подписываются и просыпаются
+        сразу по сообщению. Ошибка лидера доходит до ждущих как
+        SingleFlightLeaderError (и живёт ещё несколько секунд в
+        inflight_err:{namespace} для опоздавших). Без pub/sub — прежний
+        polling кэша.
         """
         got_lock = await cache.set_nx(f"inflight:{namespace}", key, 1, ttl=lock_ttl)
         if not got_lock:
-            loop = asyncio.get_event_loop()
+            cached = await self._wait_for_leader(
+                namespace, key, wait_total=wait_total, poll_interval=poll_interval,
+            )
+            if cached is not None:
+                return cached
+            return await loader()
+
+        channel = f"sf:{namespace}:{key}"
+        try:
+            result = await loader()
+        except asyncio.CancelledError:
+            await self._release_flight(namespace, key, channel, {"status": "abandoned"})
+            raise
+        except Exception as exc:
+            status_code = (
+                exc.response.status_code if isinstance(exc, httpx.HTTPStatusError) else None
+            )
+            error = {"status": "error", "http_status": status_code, "error": type(exc).__name__}
+            await cache.set(f"inflight_err:{namespace}", key, error, ttl=self._SF_NEGATIVE_TTL)
+            await self._release_flight(namespace, key, channel, error)
+            raise
+        await self._release_flight(namespace, key, channel, {"status": "ok"})
+        return result
+
+    # Сколько секунд помним ошибку лидера для опоздавших ждущих
+    _SF_NEGATIVE_TTL = 5
+
+    async def _release_flight(self, namespace: str, key: str, channel: str, outcome: dict) -> None:
+        await cache.delete(f"inflight:{namespace}", key)
+        await cache.publish(channel, outcome)
+
+    async def _wait_for_leader(
+        self,
+        namespace: str,
+        key: str,
+        *,
+        wait_total: float,
+        poll_interval: float,
+    ):
+        """Ждём лидера из другого воркера. Возвращает закэшированный результат
+        или None — тогда вызывающий грузит сам (лидер отвалился / таймаут)."""
+        channel = f"sf:{namespace}:{key}"
+        future = await cache.listen(channel)
+        if future is None:
+            loop = asyncio.get_running_loop()
             deadline = loop.time() + wait_total
             while loop.time() < deadline:
                 await asyncio.sleep(poll_interval)
                 cached = await cache.get(namespace, key)
                 if cached is not None:
                     return cached
+            return None
+
         try:
-            return await loader()
+            # Лидер мог закончить до подписки — проверяем один раз
+            cached = await cache.get(namespace, key)
+            if cached is not None:
+                return cached
+            outcome = await cache.get(f"inflight_err:{namespace}", key)
+            if outcome is None:
+                try:
+                    outcome = await asyncio.wait_for(future, timeout=wait_total)
+                except asyncio.TimeoutError:
+                    outcome = None
         finally:
-            if got_lock:
-                await cache.delete(f"inflight:{namespace}", key)
+            cache.unlisten(channel, future)
+
+        if outcome and outcome.get("status") == "error":
+            raise SingleFlightLeaderError(
+                f"Discogs {namespace}/{key}: leader failed with {outcome.get('error')}",
+                status_code=outcome.get("http_status"),
+            )
+        return await cache.get(namespace, key)
 
     # ------------------------------------------------------------------
     # Автодополнение (suggest)
@@ -900,26 +1035,26 @@ class DiscogsService:
             await save_to_search_cache("releases", params, resp_dict)
         return response
 
-    async def get_master(self, master_id: str) -> MasterRelease:
+    async def get_master(self, master_id: str, priority: int = Priority.DETAIL) -> MasterRelease:
         """Получение информации о мастер-релизе. Кэшируется в Redis."""
         cached = await cache.get("master", master_id)
         if cached is not None:
             return MasterRelease(**cached)
         result = await self._single_flight(
             "master", master_id,
-            lambda: self._fetch_master_uncached(master_id),
+            lambda: self._fetch_master_uncached(master_id, priority),
         )
         if isinstance(result, MasterRelease):
             return result
         return MasterRelease(**result)
 
-    async def _fetch_master_uncached(self, master_id: str) -> MasterRelease:
+    async def _fetch_master_uncached(self, master_id: str, priority: int = Priority.DETAIL) -> MasterRelease:
         # Повторная проверка кэша — пока ждали lock, кто-то мог записать
         cached = await cache.get("master", master_id)
         if cached is not None:
             return MasterRelease(**cached)
 
-        data = await self._get(f"{self.BASE_URL}/masters/{master_id}", priority=Priority.DETAIL)
+        data = await self._get(f"{self.BASE_URL}/masters/{master_id}", priority=priority)
 
         artists = data.get("artists", [])
         artist_name = ", ".join([a.get("name", "") for a in artists]) if artists else "Unknown"
@@ -1470,7 +1605,9 @@ class DiscogsService:
             logger.exception("Failed to get versions count for master %s", master_id)
         return None
 
-    async def _get_price_stats(self, release_id: str) -> dict | None:
+    async def _get_price_stats(
+        self, release_id: str, priority: int = Priority.ENRICHMENT,
+    ) -> dict | None:
         """Получение статистики цен для релиза (всегда в USD).
         Кэшируется в Redis на 6 часов. Negative cache на 404."""
         cached = await cache.get("price_stats", release_id)
@@ -1484,7 +1621,7 @@ class DiscogsService:
                 f"{self.BASE_URL}/marketplace/stats/{release_id}",
                 params={"curr_abbr": "USD"},
                 headers=self._get_token_headers(),
-                priority=Priority.ENRICHMENT,
+                priority=priority,
             )
             await cache.set("price_stats", release_id, result, TTL_PRICE_STATS)
             return result
@@ -4,26 +4,161 @@
 Возвращает SocialFeedItem с типами:
 - collection_add        — друг добавил пластинку в коллекцию
 - wishlist_add          — друг добавил пластинку в вишлист
-- gift_completed        — друг получил подарок (gift_booking → completed)
+- gift_completed        — друг подарил пластинку (gift_booking → completed)
 - friend_achievement    — друг разблокировал ачивку
 - friend_new_following  — друг подписался на нового пользователя
+
+События материализованы в feed_events (миграция 20261017_feed_events): строка
+на событие, ключ — (actor_id, created_at, id), уникальность — (kind, source_id),
+где source_id — id исходной строки (collection_items / wishlist_items /
+gift_bookings / user_achievements / follows). Пишутся в транзакции действия
+через record_feed_event, удаляются там же, где удаляется источник
+(discard_feed_events: отписка, удаление из коллекции / вишлиста). Раз в час
+sync_feed_events догоняет то, что записано в обход хуков (импорт, скрипты),
+и вычищает мёртвые события в том же окне.
+
+Чтение — один keyset-запрос: по каждой подписке LATERAL берёт не больше
+страницы из индекса ix_feed_events_actor, сверху — общий ORDER BY/LIMIT.
+Строки страницы проверяются на «живость» источника (пластинку убрали из
+коллекции, отписался) по PK, так что удаление видно сразу, без хука на
+каждом пути удаления. Дальше — батч-загрузка юзеров/пластинок/коллекций
+страницы: время чтения — O(размер страницы), а не O(числа подписок).
 """
 from __future__ import annotations
 
+import json
+import logging
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterable, Sequence
 from uuid import UUID
 
-from sqlalchemy import select
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from app.models.collection import Collection, CollectionItem
-from app.models.follow import Follow
-from app.models.gift_booking import GiftBooking, GiftStatus
+from app.models.collection import Collection
+from app.models.record import Record
 from app.models.user import User
-from app.models.user_achievement import UserAchievement
-from app.models.wishlist import Wishlist, WishlistItem
+
+logger = logging.getLogger(__name__)
+
+
+FEED_KINDS = (
+    "collection_add",
+    "wishlist_add",
+    "gift_completed",
+    "friend_achievement",
+    "friend_new_following",
+)
+
+# Жив ли источник события: проверяется только для строк страницы (PK lookup)
+_ALIVE = """
+CASE p.kind
+    WHEN 'collection_add' THEN EXISTS (SELECT 1 FROM collection_items x WHERE x.id = p.source_id)
+    WHEN 'wishlist_add' THEN EXISTS (SELECT 1 FROM wishlist_items x WHERE x.id = p.source_id)
+    WHEN 'gift_completed' THEN EXISTS (
+        SELECT 1 FROM gift_bookings x WHERE x.id = p.source_id AND x.status = 'COMPLETED'
+    )
+    WHEN 'friend_achievement' THEN EXISTS (
+        SELECT 1 FROM user_achievements x WHERE x.id = p.source_id AND x.is_unlocked
+    )
+    WHEN 'friend_new_following' THEN EXISTS (SELECT 1 FROM follows x WHERE x.id = p.source_id)
+    ELSE false
+END
+"""
+
+_FOLLOWING_PAGE = """
+SELECT p.id, p.kind, p.source_id, p.actor_id, p.created_at, p.record_id,
+       p.target_user_id, p.payload, {alive} AS alive
+FROM (
+    SELECT e.*
+    FROM follows f
+    CROSS JOIN LATERAL (
+        SELECT fe.*
+        FROM feed_events fe
+        WHERE fe.actor_id = f.following_id
+          AND NOT (fe.kind = 'friend_new_following' AND fe.target_user_id = :me)
+          {filters}
+        ORDER BY fe.created_at DESC, fe.id DESC
+        LIMIT :inner
+    ) e
+    WHERE f.follower_id = :me
+    ORDER BY e.created_at DESC, e.id DESC
+    LIMIT :n OFFSET :offset
+) p
+ORDER BY p.created_at DESC, p.id DESC
+"""
+
+_INSERT_EVENT = text(
+    """
+    INSERT INTO feed_events
+        (kind, source_id, actor_id, created_at, record_id, target_user_id, payload)
+    VALUES
+        (:kind, :source_id, :actor_id, :created_at, :record_id, :target_user_id,
+         cast(:payload as jsonb))
+    ON CONFLICT (kind, source_id) DO NOTHING
+    """
+)
+
+# Догоняющая запись из источников: (kind, SELECT …, колонка времени для окна)
+_SYNC_SOURCES: tuple[tuple[str, str, str], ...] = (
+    (
+        "collection_add",
+        """
+        SELECT 'collection_add', ci.id, c.user_id, ci.added_at, ci.record_id, NULL::uuid,
+               jsonb_build_object('collection_id', c.id::text)
+        FROM collection_items ci
+        JOIN collections c ON c.id = ci.collection_id
+        WHERE true {since}
+        """,
+        "ci.added_at",
+    ),
+    (
+        "wishlist_add",
+        """
+        SELECT 'wishlist_add', wi.id, w.user_id, wi.added_at, wi.record_id, NULL::uuid,
+               '{{}}'::jsonb
+        FROM wishlist_items wi
+        JOIN wishlists w ON w.id = wi.wishlist_id
+        WHERE true {since}
+        """,
+        "wi.added_at",
+    ),
+    (
+        # Пункт вишлиста к этому моменту уже удалён — пластинку и получателя
+        # знает только хук в complete_gift_booking; тут — без них
+        "gift_completed",
+        """
+        SELECT 'gift_completed', gb.id, gb.booked_by_user_id, gb.completed_at,
+               NULL::uuid, NULL::uuid, '{{}}'::jsonb
+        FROM gift_bookings gb
+        WHERE gb.status = 'COMPLETED'
+          AND gb.booked_by_user_id IS NOT NULL
+          AND gb.completed_at IS NOT NULL {since}
+        """,
+        "gb.completed_at",
+    ),
+    (
+        "friend_achievement",
+        """
+        SELECT 'friend_achievement', ua.id, ua.user_id, ua.unlocked_at, NULL::uuid, NULL::uuid,
+               jsonb_build_object('code', ua.code)
+        FROM user_achievements ua
+        WHERE ua.is_unlocked AND ua.unlocked_at IS NOT NULL {since}
+        """,
+        "ua.unlocked_at",
+    ),
+    (
+        "friend_new_following",
+        """
+        SELECT 'friend_new_following', f.id, f.follower_id, f.created_at, NULL::uuid,
+               f.following_id, '{{}}'::jsonb
+        FROM follows f
+        WHERE true {since}
+        """,
+        "f.created_at",
+    ),
+)
 
 
 def _actor_payload(user: User) -> dict[str, Any]:
@@ -46,6 +181,149 @@ def _record_payload(record) -> dict[str, Any] | None:
     }
 
 
+def _encode_cursor(created_at: datetime, event_id: UUID) -> str:
+    return f"{created_at.isoformat()}|{event_id}"
+
+
+def _decode_cursor(cursor: str | None) -> tuple[datetime, UUID | None] | None:
+    """`<iso>|<event id>`; голая ISO-метка — курсор старого формата (только время)."""
+    if not cursor:
+        return None
+    ts_raw, _, id_raw = cursor.partition("|")
+    try:
+        return datetime.fromisoformat(ts_raw), UUID(id_raw) if id_raw else None
+    except ValueError:
+        return None
+
+
+async def record_feed_event(
+    db: AsyncSession,
+    kind: str,
+    *,
+    source_id: UUID,
+    actor_id: UUID,
+    created_at: datetime,
+    record_id: UUID | None = None,
+    target_user_id: UUID | None = None,
+    payload: dict[str, Any] | None = None,
+) -> None:
+    """Записать событие в ленту в транзакции действия (не коммитит).
+
+    Повторная запись того же источника — no-op. Ошибка не роняет действие:
+    событие догонит sync_feed_events.
+    """
+    try:
+        async with db.begin_nested():
+            await db.execute(
+                _INSERT_EVENT,
+                {
+                    "kind": kind,
+                    "source_id": source_id,
+                    "actor_id": actor_id,
+                    "created_at": created_at,
+                    "record_id": record_id,
+                    "target_user_id": target_user_id,
+                    "payload": json.dumps(payload or {}),
+                },
+            )
+    except Exception:
+        logger.exception("record_feed_event failed (%s %s)", kind, source_id)
+
+
+async def discard_feed_events(db: AsyncSession, kind: str, source_ids: Iterable[UUID]) -> None:
+    """Удалить события источников, удалённых в транзакции действия (не коммитит).
+
+    Ошибка не роняет действие: мёртвое событие и так отфильтруется при чтении.
+    """
+    ids = list(source_ids)
+    if not ids:
+        return
+    try:
+        async with db.begin_nested():
+            await db.execute(
+                text(
+                    "DELETE FROM feed_events "
+                    "WHERE kind = :kind AND source_id = ANY(cast(:ids as uuid[]))"
+                ),
+                {"kind": kind, "ids": ids},
+            )
+    except Exception:
+        logger.exception("discard_feed_events failed (%s, %d ids)", kind, len(ids))
+
+
+async def sync_feed_events(db: AsyncSession, *, since: datetime | None = None) -> tuple[int, int]:
+    """Догнать feed_events по источникам и вычистить события удалённых.
+
+    since — окно по времени события (None — все источники целиком, бэкфилл):
+    и догон, и чистка идут только по событиям окна. Проверка живости —
+    коррелированный EXISTS на строку, по всей таблице она растёт вместе с
+    ней; основное удаление — discard_feed_events на путях удаления, старые
+    пропущенные мёртвые строки отсекает чтение.
+    Возвращает (добавлено, удалено). Не коммитит.
+    """
+    params: dict[str, Any] = {}
+    if since is not None:
+        params["since"] = since
+    added = 0
+    for kind, source_sql, ts_col in _SYNC_SOURCES:
+        since_clause = f"AND {ts_col} >= :since" if since is not None else ""
+        res = await db.execute(
+            text(
+                "INSERT INTO feed_events "
+                "(kind, source_id, actor_id, created_at, record_id, target_user_id, payload) "
+                + source_sql.format(since=since_clause)
+                + " ON CONFLICT (kind, source_id) DO NOTHING"
+            ),
+            params,
+        )
+        added += res.rowcount or 0
+    window = "AND p.created_at >= :since" if since is not None else ""
+    res = await db.execute(
+        text(f"DELETE FROM feed_events p WHERE NOT ({_ALIVE}) {window}"),
+        params,
+    )
+    return added, res.rowcount or 0
+
+
+async def following_events(
+    db: AsyncSession,
+    *,
+    user_id: UUID,
+    limit: int,
+    cursor: tuple[datetime, UUID | None] | None = None,
+    offset: int = 0,
+    kinds: Iterable[str] | None = None,
+) -> Sequence[Any]:
+    """Страница событий подписок user_id, новые сверху.
+
+    Строки: id, kind, source_id, actor_id, created_at, record_id,
+    target_user_id, payload, alive. Мёртвые (alive=False) не отбрасываются
+    здесь — курсор следующей страницы должен идти от последней строки.
+    """
+    params: dict[str, Any] = {
+        "me": user_id,
+        "n": limit,
+        "offset": offset,
+        "inner": limit + offset,
+    }
+    filters: list[str] = []
+    if cursor is not None:
+        params["c_at"] = cursor[0]
+        if cursor[1] is not None:
+            params["c_id"] = cursor[1]
+            filters.append("AND (fe.created_at, fe.id) < (:c_at, :c_id)")
+        else:
+            filters.append("AND fe.created_at < :c_at")
+    if kinds is not None:
+        params["kinds"] = list(kinds)
+        filters.append("AND fe.kind = ANY(cast(:kinds as text[]))")
+
+    stmt = text(
+        _FOLLOWING_PAGE.format(alive=_ALIVE, filters="\n          ".join(filters))
+    ).columns(payload=JSONB)
+    return (await db.execute(stmt, params)).all()
+
+
 async def get_social_feed(
     db: AsyncSession,
     *,
@@ -53,171 +331,67 @@ async def get_social_feed(
     limit: int = 20,
     cursor_iso: str | None = None,
 ) -> tuple[list[dict[str, Any]], str | None]:
-    """Собрать ленту подписок. Cursor — ISO-метка `created_at` последнего item'а."""
-    following_ids_rows = await db.execute(
-        select(Follow.following_id).where(Follow.follower_id == user_id)
+    """Собрать ленту подписок. Cursor — `<created_at>|<event id>` последнего события страницы."""
+    rows = await following_events(
+        db, user_id=user_id, limit=limit, cursor=_decode_cursor(cursor_iso)
     )
-    following_ids = [r[0] for r in following_ids_rows.all()]
-    if not following_ids:
+    if not rows:
         return [], None
+    next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id) if len(rows) == limit else None
 
-    cutoff: datetime | None = None
-    if cursor_iso:
-        try:
-            cutoff = datetime.fromisoformat(cursor_iso)
-        except ValueError:
-            cutoff = None
-
-    items: list[tuple[datetime, dict[str, Any]]] = []
-    per_source_limit = max(limit, 20)
-
-    # --- collection_add ---
-    q = (
-        select(CollectionItem)
-        .join(Collection)
-        .where(Collection.user_id.in_(following_ids))
-        .options(
-            selectinload(CollectionItem.record),
-            selectinload(CollectionItem.collection).selectinload(Collection.user),
-        )
-        .order_by(CollectionItem.added_at.desc())
-        .limit(per_source_limit)
+    live = [r for r in rows if r.alive]
+    user_ids = {r.actor_id for r in live} | {r.target_user_id for r in live if r.target_user_id}
+    record_ids = {r.record_id for r in live if r.record_id}
+    collection_ids = {
+        UUID(r.payload["collection_id"])
+        for r in live
+        if r.kind == "collection_add" and r.payload.get("collection_id")
+    }
+    users = (
+        {u.id: u for u in (await db.execute(select(User).where(User.id.in_(user_ids)))).scalars()}
+        if user_ids else {}
     )
-    if cutoff is not None:
-        q = q.where(CollectionItem.added_at < cutoff)
-    for ci in (await db.execute(q)).scalars().all():
-        items.append((ci.added_at, {
-            "type": "collection_add",
-            "actor": _actor_payload(ci.collection.user),
-            "created_at": ci.added_at.isoformat(),
-            "record": _record_payload(ci.record),
-            "target_user": None,
-            "payload": {"collection_id": str(ci.collection.id), "collection_name": ci.collection.name},
-        }))
-
-    # --- wishlist_add ---
-    q = (
-        select(WishlistItem)
-        .join(Wishlist)
-        .where(Wishlist.user_id.in_(following_ids))
-        .options(
-            selectinload(WishlistItem.record),
-            selectinload(WishlistItem.wishlist).selectinload(Wishlist.user),
-        )
-        .order_by(WishlistItem.added_at.desc())
-        .limit(per_source_limit)
+    records = (
+        {r.id: r for r in (await db.execute(select(Record).where(Record.id.in_(record_ids)))).scalars()}
+        if record_ids else {}
     )
-    if cutoff is not None:
-        q = q.where(WishlistItem.added_at < cutoff)
-    for wi in (await db.execute(q)).scalars().all():
-        items.append((wi.added_at, {
-            "type": "wishlist_add",
-            "actor": _actor_payload(wi.wishlist.user),
-            "created_at": wi.added_at.isoformat(),
-            "record": _record_payload(wi.record),
-            "target_user": None,
-            "payload": {},
-        }))
-
-    # --- gift_completed: друг подарил пластинку другому ---
-    q = (
-        select(GiftBooking)
-        .where(
-            GiftBooking.status == GiftStatus.COMPLETED,
-            GiftBooking.booked_by_user_id.in_(following_ids),
-        )
-        .options(
-            selectinload(GiftBooking.wishlist_item).selectinload(WishlistItem.record),
-            selectinload(GiftBooking.wishlist_item).selectinload(WishlistItem.wishlist).selectinload(Wishlist.user),
-        )
-        .order_by(GiftBooking.updated_at.desc())
-        .limit(per_source_limit)
+    collections = (
+        {
+            c_id: name
+            for c_id, name in await db.execute(
+                select(Collection.id, Collection.name).where(Collection.id.in_(collection_ids))
+            )
+        }
+        if collection_ids else {}
     )
-    if cutoff is not None:
-        q = q.where(GiftBooking.updated_at < cutoff)
-    for gb in (await db.execute(q)).scalars().all():
-        actor_user = await db.scalar(select(User).where(User.id == gb.booked_by_user_id))
-        if not actor_user:
+
+    items: list[tuple[datetime, dict[str, Any]]] = []
+    for r in live:
+        actor = users.get(r.actor_id)
+        if actor is None:
+            continue
+        target = users.get(r.target_user_id) if r.target_user_id else None
+        if r.kind == "friend_new_following" and target is None:
             continue
-        wi = gb.wishlist_item
-        target = wi.wishlist.user if (wi and wi.wishlist) else None
-        record = wi.record if wi else None
-        items.append((gb.updated_at, {
-            "type": "gift_completed",
-            "actor": _actor_payload(actor_user),
-            "created_at": gb.updated_at.isoformat(),
-            "record": _record_payload(record),
+        payload: dict[str, Any] = {}
+        if r.kind == "collection_add":
+            c_id = r.payload.get("collection_id")
+            payload = {
+                "collection_id": c_id,
+                "collection_name": collections.get(UUID(c_id)) if c_id else None,
+            }
+        elif r.kind == "friend_achievement":
+            payload = {"code": r.payload.get("code")}
+        items.append((r.created_at, {
+            "type": r.kind,
+            "actor": _actor_payload(actor),
+            "created_at": r.created_at.isoformat(),
+            "record": _record_payload(records.get(r.record_id)) if r.record_id else None,
             "target_user": _actor_payload(target) if target else None,
-            "payload": {},
+            "payload": payload,
         }))
 
-    # --- friend_achievement ---
-    q = (
-        select(UserAchievement)
-        .where(
-            UserAchievement.user_id.in_(following_ids),
-            UserAchievement.is_unlocked == True,
-        )
-        .order_by(UserAchievement.unlocked_at.desc().nullslast())
-        .limit(per_source_limit)
-    )
-    if cutoff is not None:
-        q = q.where(UserAchievement.unlocked_at < cutoff)
-    rows = (await db.execute(q)).scalars().all()
-    if rows:
-        actor_ids = {r.user_id for r in rows}
-        actors = {
-            u.id: u
-            for u in (await db.execute(select(User).where(User.id.in_(actor_ids)))).scalars().all()
-        }
-        for ua in rows:
-            actor = actors.get(ua.user_id)
-            if not actor or not ua.unlocked_at:
-                continue
-            items.append((ua.unlocked_at, {
-                "type": "friend_achievement",
-                "actor": _actor_payload(actor),
-                "created_at": ua.unlocked_at.isoformat(),
-                "record": None,
-                "target_user": None,
-                "payload": {"code": ua.code},
-            }))
-
-    # --- friend_new_following: друг подписался на нового пользователя ---
-    q = (
-        select(Follow)
-        .where(Follow.follower_id.in_(following_ids))
-        .order_by(Follow.created_at.desc())
-        .limit(per_source_limit)
-    )
-    if cutoff is not None:
-        q = q.where(Follow.created_at < cutoff)
-    rows = (await db.execute(q)).scalars().all()
-    if rows:
-        user_ids = {r.follower_id for r in rows} | {r.following_id for r in rows}
-        users_map = {
-            u.id: u
-            for u in (await db.execute(select(User).where(User.id.in_(user_ids)))).scalars().all()
-        }
-        for f in rows:
-            actor = users_map.get(f.follower_id)
-            target = users_map.get(f.following_id)
-            if not actor or not target or target.id == user_id:
-                continue
-            items.append((f.created_at, {
-                "type": "friend_new_following",
-                "actor": _actor_payload(actor),
-                "created_at": f.created_at.isoformat(),
-                "record": None,
-                "target_user": _actor_payload(target),
-                "payload": {},
-            }))
-
-    items.sort(key=lambda x: x[0], reverse=True)
-    aggregated = _aggregate_similar(items)
-    sliced = aggregated[:limit]
-    next_cursor = sliced[-1][0].isoformat() if len(sliced) == limit else None
-    return [it[1] for it in sliced], next_cursor
+    return [it[1] for it in _aggregate_similar(items)], next_cursor
 
 
 # Какие типы можно схлопывать в «X добавил N пластинок» / «X получил N ачивок» и т.д.
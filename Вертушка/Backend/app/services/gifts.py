@@ -17,6 +17,7 @@ from app.models.collection import Collection, CollectionItem
 from app.models.gift_booking import GiftBooking, GiftStatus
 from app.models.user import User
 from app.models.wishlist import WishlistItem
+from app.services.feed import discard_feed_events, record_feed_event
 
 logger = logging.getLogger(__name__)
 
@@ -82,9 +83,31 @@ async def complete_gift_booking(
     booking.wishlist_item_id = None
 
     # Удаляем сам пункт вишлиста (поведение симметрично move-to-collection)
+    await discard_feed_events(db, "wishlist_add", [item.id])
     await db.delete(item)
     await db.flush()
 
+    # Лента подписок: пластинка у владельца + подарок от дарителя (если он юзер)
+    await record_feed_event(
+        db,
+        "collection_add",
+        source_id=collection_item.id,
+        actor_id=owner.id,
+        created_at=collection_item.added_at,
+        record_id=collection_item.record_id,
+        payload={"collection_id": str(target_collection.id)},
+    )
+    if booking.booked_by_user_id is not None:
+        await record_feed_event(
+            db,
+            "gift_completed",
+            source_id=booking.id,
+            actor_id=booking.booked_by_user_id,
+            created_at=booking.completed_at,
+            record_id=collection_item.record_id,
+            target_user_id=owner.id,
+        )
+
     logger.info(
         "gift_completed",
         extra={
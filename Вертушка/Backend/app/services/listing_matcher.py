@@ -3,8 +3,8 @@
 
 Стратегия — каскад фолбэков с разными confidence:
   1. discogs_release_url (raw_payload) → точное совпадение по Record.discogs_id  → 1.0
-  2. barcode → Record.barcode                                                     → 1.0
-  3. catalog_number → Record.catalog_number (нормализованный)                     → 0.9
+  2. barcode → Record.barcode_norm                                                → 1.0
+  3. catalog_number → Record.catalog_norm                                         → 0.9
   4. fuzzy(artist + title + year) через pg_trgm + rapidfuzz                       → score
   5. on-demand fetch через Discogs (если есть barcode/catalog но Record нет)      → 0.95
   6. store-native fallback: если Discogs ничего не знает — создаём Record из     → 1.0
@@ -13,13 +13,19 @@
 
 Пишет: matched_record_id, match_confidence, match_method, matched_at.
 Не падает на единичных ошибках — собирает счётчики, логирует.
+
+match_unmatched_batch гоняет шаги 1–4.5 set-based (_prematch_batch): сигналы
+всей пачки резолвятся несколькими `= ANY(:array)` запросами и одним LATERAL
+trigram join'ом. Поштучно (match_listing-семантика) идут только остатки —
+on-demand Discogs fetch и store-native.
 """
 from __future__ import annotations
 
 import logging
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Iterable
+from typing import Any, Iterable
 
 import re
 
@@ -30,6 +36,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import async_session_maker
 from app.models.record import Record
 from app.models.store_listing import StoreListing, MatchMethod
+from app.services.cache import cache
+from app.services.market_index import refresh_offer_index
+from app.services.market_stats import refresh_store_stats
+from app.services.offer_summary import refresh_offer_summary
 from app.services.scrapers.extractors import (
     normalize_barcode,
     normalize_catalog,
@@ -40,6 +50,14 @@ logger = logging.getLogger(__name__)
 
 FUZZY_THRESHOLD = 0.85
 FUZZY_CANDIDATES_LIMIT = 50
+FUZZY_MIN_SIMILARITY = 0.25
+
+# Сколько листингов match_unmatched_batch прогоняет через _prematch_batch за
+# раз. Ограничивает размер массивов в ANY/unnest и объём одной транзакции —
+# коммитим после каждого чанка.
+MATCH_CHUNK_SIZE = 1000
+
+_DISCOGS_RELEASE_RE = re.compile(r"/release/(\d+)")
 
 # Аксессуары: магазины ставят их в общий каталог рядом с пластинками
 # (пины-значки, пакеты, щётки, постеры, сертификаты), а парсер по дефолту
@@ -112,14 +130,37 @@ STORE_NATIVE_MERGE_MIN_CONFIRMATIONS = 2
 
 # Кэшируем результат проверки «есть ли вообще данные в дампе» — таблица
 # может существовать но быть пустой (миграция применена, ingest не запущен).
-# Сбрасывается при каждом перезапуске процесса; ингест на проде — редкое
-# событие, in-process cache вместо Redis достаточен.
+# Флаг in-process, но раз в _DUMP_RECHECK_SEC сверяем generation-ключ в Redis:
+# ingest_discogs_dump --shadow бампает его после swap'а таблиц, и все
+# процессы перепроверяют таблицу, не дожидаясь рестарта.
 _dump_available: bool | None = None
+_dump_generation: Any = None
+_dump_checked_at = 0.0
+_DUMP_RECHECK_SEC = 60.0
+
+
+def invalidate_dump_available() -> None:
+    """Сбросить кэш флага в текущем процессе."""
+    global _dump_available
+    _dump_available = None
+
+
+async def bump_dump_generation() -> None:
+    """Сбросить флаг во всех процессах (после swap/rebuild индекса)."""
+    invalidate_dump_available()
+    await cache.set("dump_index", "generation", time.time(), ttl=365 * 86400)
 
 
 async def _is_dump_available(db: AsyncSession) -> bool:
     """Лазает в таблицу один раз за процесс — после узнаём через cached flag."""
-    global _dump_available
+    global _dump_available, _dump_generation, _dump_checked_at
+    now = time.monotonic()
+    if now - _dump_checked_at >= _DUMP_RECHECK_SEC:
+        _dump_checked_at = now
+        generation = await cache.get("dump_index", "generation")
+        if generation != _dump_generation:
+            _dump_generation = generation
+            _dump_available = None
     if _dump_available is not None:
         return _dump_available
     try:
@@ -131,6 +172,23 @@ async def _is_dump_available(db: AsyncSession) -> bool:
     return _dump_available
 
 
+_DUMP_COLUMNS = (
+    "discogs_id, master_id, artist, title, year, country, "
+    "format_type, label, cover_image_url"
+)
+# Fuzzy-порог по дампу: сумма similarity(artist) + similarity(title).
+# 1.4 = в среднем 0.7 на поле.
+DUMP_FUZZY_MIN_SCORE = 1.4
+
+
+def _dump_fuzzy_confidence(score: float | None) -> Decimal | None:
+    """Confidence для fuzzy-хита по дампу или None, если ниже порога."""
+    if not score or score < DUMP_FUZZY_MIN_SCORE:
+        return None
+    # Confidence масштабируем: 1.4 → 0.85, 2.0 → 0.95.
+    return min(Decimal("0.950"), Decimal(str(round(0.5 + score * 0.25, 3))))
+
+
 async def _lookup_in_dump_index(
     db: AsyncSession,
     *,
@@ -153,9 +211,7 @@ async def _lookup_in_dump_index(
     if barcode:
         row = (await db.execute(
             text(
-                "SELECT discogs_id, master_id, artist, title, year, country, "
-                "       format_type, label, cover_image_url "
-                "FROM discogs_releases_index "
+                f"SELECT {_DUMP_COLUMNS} FROM discogs_releases_index "
                 "WHERE barcode_norm = :b LIMIT 1"
             ),
             {"b": barcode},
@@ -167,9 +223,7 @@ async def _lookup_in_dump_index(
     if catalog:
         row = (await db.execute(
             text(
-                "SELECT discogs_id, master_id, artist, title, year, country, "
-                "       format_type, label, cover_image_url "
-                "FROM discogs_releases_index "
+                f"SELECT {_DUMP_COLUMNS} FROM discogs_releases_index "
                 "WHERE catalog_norm = :c LIMIT 1"
             ),
             {"c": catalog},
@@ -185,8 +239,7 @@ async def _lookup_in_dump_index(
     if artist and title:
         row = (await db.execute(
             text(
-                "SELECT discogs_id, master_id, artist, title, year, country, "
-                "       format_type, label, cover_image_url, "
+                f"SELECT {_DUMP_COLUMNS}, "
                 "       (similarity(artist, :a) + similarity(title, :t)) AS score "
                 "FROM discogs_releases_index "
                 "WHERE artist % :a AND title % :t "
@@ -195,9 +248,8 @@ async def _lookup_in_dump_index(
             ),
             {"a": artist, "t": title, "y": year},
         )).mappings().first()
-        if row and row.get("score") and row["score"] >= 1.4:
-            # Confidence масштабируем: 1.4 → 0.85, 2.0 → 0.95.
-            conf = min(Decimal("0.950"), Decimal(str(round(0.5 + row["score"] * 0.25, 3))))
+        conf = _dump_fuzzy_confidence(row["score"]) if row else None
+        if conf is not None:
             return dict(row), MatchMethod.DUMP_INDEX, conf
 
     return None
@@ -255,25 +307,18 @@ async def _find_by_discogs_id(db: AsyncSession, discogs_id: str) -> Record | Non
 
 
 async def _find_by_barcode(db: AsyncSession, barcode: str) -> Record | None:
-    res = await db.execute(select(Record).where(Record.barcode == barcode))
+    res = await db.execute(
+        select(Record).where(Record.barcode_norm == barcode).order_by(Record.created_at).limit(1)
+    )
     return res.scalar_one_or_none()
 
 
 async def _find_by_catalog(db: AsyncSession, catalog_norm: str) -> Record | None:
-    """Catalog в БД не нормализован — нормализуем на лету через regexp_replace."""
+    """Точный lookup по records.catalog_norm (btree ix_records_catalog_norm)."""
     res = await db.execute(
-        text(
-            "SELECT * FROM records "
-            "WHERE upper(regexp_replace(catalog_number, '[ \\-_/.]', '', 'g')) = :cat "
-            "LIMIT 1"
-        ),
-        {"cat": catalog_norm},
+        select(Record).where(Record.catalog_norm == catalog_norm).order_by(Record.created_at).limit(1)
     )
-    row = res.fetchone()
-    if not row:
-        return None
-    rec = await db.execute(select(Record).where(Record.id == row.id))
-    return rec.scalar_one_or_none()
+    return res.scalar_one_or_none()
 
 
 async def _fuzzy_candidates(
@@ -287,28 +332,17 @@ async def _fuzzy_candidates(
     # (`UndefinedFunctionError` даже когда оператор есть в БД).
     # На малых records-таблицах seqscan мгновенный; на больших — pg_trgm GIN
     # индекс по `gin_trgm_ops` всё равно ускоряет similarity-сортировку.
-    if title:
-        sql = text(
-            "SELECT * FROM records "
-            "WHERE similarity(title::text, cast(:q as text)) >= :thr "
-            "ORDER BY similarity(title::text, cast(:q as text)) DESC "
-            "LIMIT :lim"
-        )
-        q = title
-    else:
-        sql = text(
+    col, q = ("title", title) if title else ("artist", artist)
+    res = await db.execute(
+        select(Record).from_statement(text(
             "SELECT * FROM records "
-            "WHERE similarity(artist::text, cast(:q as text)) >= :thr "
-            "ORDER BY similarity(artist::text, cast(:q as text)) DESC "
+            f"WHERE similarity({col}::text, cast(:q as text)) >= :thr "
+            f"ORDER BY similarity({col}::text, cast(:q as text)) DESC "
             "LIMIT :lim"
-        )
-        q = artist  # type: ignore[assignment]
-    res = await db.execute(sql, {"q": q, "lim": FUZZY_CANDIDATES_LIMIT, "thr": 0.25})
-    ids = [row.id for row in res.fetchall()]
-    if not ids:
-        return []
-    res2 = await db.execute(select(Record).where(Record.id.in_(ids)))
-    return list(res2.scalars().all())
+        )),
+        {"q": q, "lim": FUZZY_CANDIDATES_LIMIT, "thr": FUZZY_MIN_SIMILARITY},
+    )
+    return list(res.scalars().all())
 
 
 def _fuzzy_score(rec: Record, listing: StoreListing) -> float:
@@ -321,6 +355,34 @@ def _fuzzy_score(rec: Record, listing: StoreListing) -> float:
     return min(1.0, title_score * 0.6 + artist_score * 0.3 + year_bonus)
 
 
+def _best_fuzzy(listing: StoreListing, candidates: Iterable[Record]) -> tuple[Record, float] | None:
+    """Лучший кандидат по _fuzzy_score, если он проходит FUZZY_THRESHOLD."""
+    best, best_score = None, 0.0
+    for rec in candidates:
+        score = _fuzzy_score(rec, listing)
+        if score > best_score:
+            best, best_score = rec, score
+    if best and best_score >= FUZZY_THRESHOLD:
+        return best, best_score
+    return None
+
+
+def _listing_signals(listing: StoreListing) -> tuple[str | None, str | None, str | None]:
+    """(discogs_id из discogs_release_url, barcode, catalog) — уже нормализованные."""
+    raw = listing.raw_payload or {}
+    discogs_id = None
+    discogs_url = raw.get("discogs_release_url")
+    if discogs_url:
+        m = _DISCOGS_RELEASE_RE.search(discogs_url)
+        if m:
+            discogs_id = m.group(1)
+    return (
+        discogs_id,
+        normalize_barcode(raw.get("barcode")),
+        normalize_catalog(raw.get("catalog_number")),
+    )
+
+
 # ---- Главная функция матчинга ------------------------------------------ #
 
 
@@ -329,23 +391,16 @@ async def match_listing(listing: StoreListing, db: AsyncSession) -> bool:
 
     Не делает commit — вызывающий должен закоммитить.
     """
-    raw = listing.raw_payload or {}
+    discogs_id, barcode, catalog = _listing_signals(listing)
 
     # 1) Discogs URL
-    discogs_url = raw.get("discogs_release_url")
-    if discogs_url:
-        # парсим release/<id>
-        import re
-        m = re.search(r"/release/(\d+)", discogs_url)
-        if m:
-            rec = await _find_by_discogs_id(db, m.group(1))
-            if rec:
-                _apply_match(listing, rec, Decimal("1.000"), MatchMethod.DISCOGS_URL)
-                return True
+    if discogs_id:
+        rec = await _find_by_discogs_id(db, discogs_id)
+        if rec:
+            _apply_match(listing, rec, Decimal("1.000"), MatchMethod.DISCOGS_URL)
+            return True
 
     # 2) Barcode
-    barcode_raw = raw.get("barcode") or listing.raw_payload.get("barcode") if listing.raw_payload else None
-    barcode = normalize_barcode(barcode_raw)
     if barcode:
         rec = await _find_by_barcode(db, barcode)
         if rec:
@@ -353,7 +408,6 @@ async def match_listing(listing: StoreListing, db: AsyncSession) -> bool:
             return True
 
     # 3) Catalog
-    catalog = normalize_catalog(raw.get("catalog_number"))
     if catalog:
         rec = await _find_by_catalog(db, catalog)
         if rec:
@@ -362,15 +416,11 @@ async def match_listing(listing: StoreListing, db: AsyncSession) -> bool:
 
     # 4) Fuzzy
     candidates = await _fuzzy_candidates(db, listing.artist_raw, listing.title_raw)
-    if candidates:
-        best, best_score = None, 0.0
-        for rec in candidates:
-            score = _fuzzy_score(rec, listing)
-            if score > best_score:
-                best, best_score = rec, score
-        if best and best_score >= FUZZY_THRESHOLD:
-            _apply_match(listing, best, Decimal(str(round(best_score, 3))), MatchMethod.FUZZY)
-            return True
+    hit = _best_fuzzy(listing, candidates)
+    if hit:
+        best, best_score = hit
+        _apply_match(listing, best, Decimal(str(round(best_score, 3))), MatchMethod.FUZZY)
+        return True
 
     # 4.5) Slim Discogs Dump (local index) — barcode/catalog/fuzzy lookup
     # ДО on-demand Discogs API. Покрытие дампа 80%+ от всех релизов, поиск
@@ -390,6 +440,20 @@ async def match_listing(listing: StoreListing, db: AsyncSession) -> bool:
             _apply_match(listing, rec, conf, method)
             return True
 
+    return await _match_residue(listing, db, barcode=barcode, catalog=catalog)
+
+
+async def _match_residue(
+    listing: StoreListing,
+    db: AsyncSession,
+    *,
+    barcode: str | None,
+    catalog: str | None,
+) -> bool:
+    """Шаги 5–6 каскада: то, что не резолвится локальными данными.
+
+    Вызывается из match_listing и для остатка после _prematch_batch.
+    """
     # 5) On-demand Discogs fetch — отдельная задача (не блокируем матчер)
     if barcode or catalog:
         rec = await _try_discogs_fetch(db, barcode=barcode, catalog=catalog)
@@ -774,9 +838,305 @@ async def _create_store_native_record(
     return rec
 
 
+# ---- Set-based движок для пачки листингов ------------------------------ #
+
+
+async def _records_by_discogs_ids(db: AsyncSession, ids: set[str]) -> dict[str, Record]:
+    if not ids:
+        return {}
+    res = await db.execute(select(Record).where(Record.discogs_id.in_(ids)))
+    return {rec.discogs_id: rec for rec in res.scalars()}
+
+
+async def _records_by_norm(
+    db: AsyncSession, column: Any, keys: set[str],
+) -> dict[str, Record]:
+    """{key: Record} по Record.barcode_norm / Record.catalog_norm; при дублях — самый старый."""
+    if not keys:
+        return {}
+    res = await db.execute(
+        select(Record).where(column.in_(keys)).order_by(Record.created_at)
+    )
+    found: dict[str, Record] = {}
+    for rec in res.scalars():
+        found.setdefault(getattr(rec, column.key), rec)
+    return found
+
+
+async def _fuzzy_candidates_batch(
+    db: AsyncSession, listings: list[StoreListing],
+) -> dict[Any, list[Record]]:
+    """_fuzzy_candidates для всей пачки: один LATERAL trigram join на колонку.
+
+    Как и в поштучной версии, ищем по title, а если его нет — по artist.
+    Возвращает {listing.id: [Record, ...]}.
+    """
+    by_col: dict[str, list[StoreListing]] = {"title": [], "artist": []}
+    for listing in listings:
+        if listing.title_raw:
+            by_col["title"].append(listing)
+        elif listing.artist_raw:
+            by_col["artist"].append(listing)
+
+    pairs: list[tuple[Any, Any]] = []
+    for col, group in by_col.items():
+        if not group:
+            continue
+        res = await db.execute(
+            text(
+                "SELECT q.idx, c.id "
+                "FROM unnest(cast(:qs as text[])) WITH ORDINALITY AS q(txt, idx) "
+                "CROSS JOIN LATERAL ( "
+                "    SELECT r.id FROM records r "
+                f"    WHERE similarity(r.{col}::text, q.txt) >= :thr "
+                f"    ORDER BY similarity(r.{col}::text, q.txt) DESC "
+                "    LIMIT :lim "
+                ") c"
+            ),
+            {
+                "qs": [l.title_raw if col == "title" else l.artist_raw for l in group],
+                "thr": FUZZY_MIN_SIMILARITY,
+                "lim": FUZZY_CANDIDATES_LIMIT,
+            },
+        )
+        pairs.extend((group[row.idx - 1].id, row.id) for row in res)
+
+    if not pairs:
+        return {}
+    res = await db.execute(select(Record).where(Record.id.in_({rid for _, rid in pairs})))
+    records = {rec.id: rec for rec in res.scalars()}
+    out: dict[Any, list[Record]] = {}
+    for listing_id, rid in pairs:
+        if rid in records:
+            out.setdefault(listing_id, []).append(records[rid])
+    return out
+
+
+async def _dump_by_keys(db: AsyncSession, column: str, keys: set[str]) -> dict[str, dict]:
+    """Точный lookup по barcode_norm / catalog_norm для набора ключей."""
+    if not keys:
+        return {}
+    res = await db.execute(
+        text(
+            f"SELECT DISTINCT ON ({column}) {column} AS _key, {_DUMP_COLUMNS} "
+            "FROM discogs_releases_index "
+            f"WHERE {column} = ANY(cast(:keys as text[])) "
+            f"ORDER BY {column}"
+        ),
+        {"keys": list(keys)},
+    )
+    out: dict[str, dict] = {}
+    for row in res.mappings():
+        entry = dict(row)
+        out[entry.pop("_key")] = entry
+    return out
+
+
+async def _dump_fuzzy_batch(
+    db: AsyncSession, listings: list[StoreListing],
+) -> dict[Any, tuple[dict, Decimal]]:
+    """Fuzzy artist+title по дампу для пачки — один LATERAL join.
+
+    Та же выборка, что и в _lookup_in_dump_index: `%` по обоим полям,
+    year ±2 или NULL, лучший по сумме similarity.
+    """
+    if not listings:
+        return {}
+    res = await db.execute(
+        text(
+            "SELECT q.idx, d.* "
+            "FROM unnest(cast(:artists as text[]), cast(:titles as text[]), cast(:years as int[])) "
+            "     WITH ORDINALITY AS q(a, t, y, idx) "
+            "CROSS JOIN LATERAL ( "
+            f"    SELECT {_DUMP_COLUMNS}, "
+            "           (similarity(artist, q.a) + similarity(title, q.t)) AS score "
+            "    FROM discogs_releases_index "
+            "    WHERE artist % q.a AND title % q.t "
+            "      AND (q.y IS NULL OR year IS NULL OR ABS(year - q.y) <= 2) "
+            "    ORDER BY score DESC LIMIT 1 "
+            ") d"
+        ),
+        {
+            "artists": [l.artist_raw for l in listings],
+            "titles": [l.title_raw for l in listings],
+            "years": [l.year_raw for l in listings],
+        },
+    )
+    out: dict[Any, tuple[dict, Decimal]] = {}
+    for row in res.mappings():
+        entry = dict(row)
+        idx = entry.pop("idx")
+        conf = _dump_fuzzy_confidence(entry["score"])
+        if conf is not None:
+            out[listings[idx - 1].id] = (entry, conf)
+    return out
+
+
+async def _prematch_batch(listings: list[StoreListing], db: AsyncSession) -> list[StoreListing]:
+    """Шаги 1–4.5 каскада match_listing для всей пачки разом.
+
+    Каждый шаг — несколько `= ANY(:array)` запросов / один LATERAL join на
+    листинги, не сматченные предыдущими шагами. Порядок шагов, confidence и
+    match_method совпадают с match_listing. Возвращает остаток для
+    _match_residue (Discogs fetch, store-native). Не делает commit.
+    """
+    signals = {l.id: _listing_signals(l) for l in listings}
+
+    # 1–3) discogs_id / barcode / catalog
+    by_id = await _records_by_discogs_ids(db, {s[0] for s in signals.values() if s[0]})
+    by_bc = await _records_by_norm(db, Record.barcode_norm, {s[1] for s in signals.values() if s[1]})
+    by_cat = await _records_by_norm(db, Record.catalog_norm, {s[2] for s in signals.values() if s[2]})
+    rest: list[StoreListing] = []
+    for listing in listings:
+        discogs_id, barcode, catalog = signals[listing.id]
+        if discogs_id and discogs_id in by_id:
+            _apply_match(listing, by_id[discogs_id], Decimal("1.000"), MatchMethod.DISCOGS_URL)
+        elif barcode and barcode in by_bc:
+            _apply_match(listing, by_bc[barcode], Decimal("1.000"), MatchMethod.BARCODE)
+        elif catalog and catalog in by_cat:
+            _apply_match(listing, by_cat[catalog], Decimal("0.900"), MatchMethod.CATALOG)
+        else:
+            rest.append(listing)
+
+    # 4) Fuzzy
+    candidates = await _fuzzy_candidates_batch(db, rest)
+    pending, rest = rest, []
+    for listing in pending:
+        hit = _best_fuzzy(listing, candidates.get(listing.id, ()))
+        if hit:
+            best, best_score = hit
+            _apply_match(listing, best, Decimal(str(round(best_score, 3))), MatchMethod.FUZZY)
+        else:
+            rest.append(listing)
+
+    # 4.5) Slim Discogs Dump
+    if not rest or not await _is_dump_available(db):
+        return rest
+    dump_bc = await _dump_by_keys(
+        db, "barcode_norm", {signals[l.id][1] for l in rest if signals[l.id][1]},
+    )
+    dump_cat = await _dump_by_keys(
+        db, "catalog_norm", {signals[l.id][2] for l in rest if signals[l.id][2]},
+    )
+    hits: dict[Any, tuple[dict, Decimal]] = {}
+    need_fuzzy: list[StoreListing] = []
+    for listing in rest:
+        _, barcode, catalog = signals[listing.id]
+        if barcode and barcode in dump_bc:
+            hits[listing.id] = (dump_bc[barcode], Decimal("1.000"))
+        elif catalog and catalog in dump_cat:
+            hits[listing.id] = (dump_cat[catalog], Decimal("0.900"))
+        elif listing.artist_raw and listing.title_raw:
+            need_fuzzy.append(listing)
+    hits.update(await _dump_fuzzy_batch(db, need_fuzzy))
+
+    known = await _records_by_discogs_ids(
+        db, {str(entry["discogs_id"]) for entry, _ in hits.values()},
+    )
+    pending, rest = rest, []
+    for listing in pending:
+        hit = hits.get(listing.id)
+        if hit:
+            entry, conf = hit
+            discogs_id = str(entry["discogs_id"])
+            rec = known.get(discogs_id) or await _get_or_create_record_from_dump(db, entry)
+            if rec:
+                known[discogs_id] = rec
+                _apply_match(listing, rec, conf, MatchMethod.DUMP_INDEX)
+                continue
+        rest.append(listing)
+    return rest
+
+
 # ---- Batch-матчер для cron --------------------------------------------- #
 
 
+async def _match_chunk(
+    db: AsyncSession,
+    listings: list[StoreListing],
+    counters: dict[str, int],
+    signals: dict[str, int],
+) -> None:
+    """Сматчить чанк: set-based шаги через _prematch_batch, остаток — поштучно."""
+    chunk: list[StoreListing] = []
+    for listing in listings:
+        counters["processed"] += 1
+        if _is_accessory(listing):
+            counters["skipped_accessory"] += 1
+            counters["unmatched"] += 1
+            continue
+        raw = listing.raw_payload or {}
+        has_url = bool(raw.get("discogs_release_url"))
+        has_bc = bool(raw.get("barcode"))
+        has_cat = bool(raw.get("catalog_number"))
+        if has_url:
+            signals["with_discogs_url"] += 1
+        if has_bc:
+            signals["with_barcode"] += 1
+        if has_cat:
+            signals["with_catalog"] += 1
+        if not (has_url or has_bc or has_cat):
+            signals["no_ids"] += 1
+        chunk.append(listing)
+
+    # Set-based шаги только читают (плюс create-from-dump в своих savepoint'ах).
+    # Если батчевый запрос упал — откатываем savepoint и гоняем чанк старым
+    # поштучным каскадом, чтобы одна битая строка не стопорила весь крон.
+    per_listing = False
+    sp = await db.begin_nested()
+    try:
+        residue = await _prematch_batch(chunk, db)
+        await sp.commit()
+    except Exception:
+        await sp.rollback()
+        logger.exception("batch prematch failed, falling back to per-listing cascade")
+        # rollback savepoint'а экспайрит тронутые в нём листинги — ленивая
+        # догрузка под AsyncSession падает (MissingGreenlet), поэтому
+        # перечитываем явно: в БД они снова несматченные
+        for listing in chunk:
+            await db.refresh(listing)
+        residue, per_listing = chunk, True
+    chunk_matched = len(chunk) - len(residue)
+    counters["matched"] += chunk_matched
+
+    for listing in residue:
+        listing_id = listing.id
+        # SAVEPOINT — если матчинг уронит транзакцию, откатываем только этот
+        # savepoint, остальные листинги продолжаем матчить.
+        sp = await db.begin_nested()
+        try:
+            if per_listing:
+                ok = await match_listing(listing, db)
+            else:
+                _, barcode, catalog = _listing_signals(listing)
+                ok = await _match_residue(listing, db, barcode=barcode, catalog=catalog)
+            await sp.commit()
+            counters["matched" if ok else "unmatched"] += 1
+            chunk_matched += int(ok)
+            if ok and listing.match_method == MatchMethod.STORE_NATIVE:
+                counters["store_native_created"] += 1
+        except Exception:
+            await sp.rollback()
+            counters["errors"] += 1
+            logger.exception("match failed for listing %s", listing_id)
+            # Экспайрен rollback'ом — перечитать до чтения ниже (matched)
+            await db.refresh(listing)
+            continue
+
+    if chunk_matched:
+        matched = [l for l in chunk if l.matched_record_id]
+        await refresh_store_stats(db, {l.store_id for l in matched})
+        await refresh_offer_index(db, record_ids={l.matched_record_id for l in matched})
+        await refresh_offer_summary(db, record_ids={l.matched_record_id for l in matched})
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        counters["errors"] += chunk_matched
+        counters["matched"] -= chunk_matched
+        logger.exception("commit failed in match_unmatched_batch")
+
+
 async def match_unmatched_batch(batch_size: int = 200) -> dict[str, int]:
     """Найти `batch_size` unmatched листингов и попытаться сматчить.
 
@@ -805,47 +1165,8 @@ async def match_unmatched_batch(batch_size: int = 200) -> dict[str, int]:
         )
         listings = list(res.scalars().all())
 
-        for listing in listings:
-            counters["processed"] += 1
-            if _is_accessory(listing):
-                counters["skipped_accessory"] += 1
-                counters["unmatched"] += 1
-                continue
-            raw = listing.raw_payload or {}
-            has_url = bool(raw.get("discogs_release_url"))
-            has_bc = bool(raw.get("barcode"))
-            has_cat = bool(raw.get("catalog_number"))
-            if has_url:
-                signals["with_discogs_url"] += 1
-            if has_bc:
-                signals["with_barcode"] += 1
-            if has_cat:
-                signals["with_catalog"] += 1
-            if not (has_url or has_bc or has_cat):
-                signals["no_ids"] += 1
-
-            # SAVEPOINT — если match_listing уронит транзакцию, откатываем
-            # только этот savepoint, остальные листинги продолжаем матчить.
-            sp = await db.begin_nested()
-            try:
-                ok = await match_listing(listing, db)
-                await sp.commit()
-                counters["matched" if ok else "unmatched"] += 1
-                if ok and listing.match_method == MatchMethod.STORE_NATIVE:
-                    counters["store_native_created"] += 1
-            except Exception:
-                await sp.rollback()
-                counters["errors"] += 1
-                logger.exception("match failed for listing %s", listing.id)
-                continue
-
-        try:
-            await db.commit()
-        except Exception:
-            await db.rollback()
-            counters["errors"] += counters["matched"]
-            counters["matched"] = 0
-            logger.exception("commit failed in match_unmatched_batch")
+        for start in range(0, len(listings), MATCH_CHUNK_SIZE):
+            await _match_chunk(db, listings[start:start + MATCH_CHUNK_SIZE], counters, signals)
 
     logger.info("match batch: %s | signals: %s", counters, signals)
     return counters
@@ -0,0 +1,204 @@
+"""
+market_offer_index — денормализованный индекс in-stock офферов Маркета.
+
+Раньше /market/search, карусели магазинов и /market/new-arrivals на каждый
+некэшированный запрос гоняли CTE по store_listings ⋈ stores ⋈ records с
+ILIKE '%q%', GROUP BY master и тремя ARRAY_AGG(... ORDER BY price). Теперь
+это заранее посчитанные строки, по одной на дедуп-ключ
+(COALESCE(discogs_master_id, record_id)) в разрезе:
+  - fmt: 'all' + класс формата листинга (vinyl / cd / cassette) — фильтр
+    формата в market.py применяется к листингу, поэтому считаем заранее;
+  - store_id: NULL — глобальная строка (поиск, new-arrivals), иначе строка
+    магазина (карусель и витрина /stores/{slug}).
+В строке — самая низкая цена, самый дешёвый магазин и его запись/фото,
+число магазинов, artist/title для trigram-поиска.
+
+Поддержка — точечно, по дедуп-ключам, в транзакции записи (как
+market_stats): обход магазина и stock-refresh → ключи листингов магазина,
+у которых updated_at сдвинулся за обход, матчер → ключи новых матчей.
+Раз в час — полная пересборка (rebuild_offer_index): правит дрейф и
+7-дневное окно свежести.
+
+Пересборки идут параллельно, поэтому запись — upsert по уникальному
+ключу ux_moi_key (dedup_key, fmt, магазин | '' для глобальной) в
+фиксированном порядке строк, а строки, которых пересборка не коснулась
+(refreshed_at < NOW() транзакции), затем удаляются. DELETE + INSERT
+под READ COMMITTED оставлял дубли карточек.
+
+FILTER-условия 1:1 с прежними live-запросами market.py.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+_KEYS_CHUNK = 5000
+
+_VINYL_FMTS = ["LP", "2xLP", "3xLP", "EP", "Single", "Box Set"]
+_VINYL_RE = r'^(\d+x?LP|12"|10"|7")'
+_CD_FMTS = ["CD", "2CD", "SACD"]
+
+_REBUILD = """
+WITH live AS (
+    SELECT
+        COALESCE(r.discogs_master_id, r.id::text) AS dedup_key,
+        sl.store_id, s.slug AS store_slug, sl.price_rub, sl.first_seen_at,
+        sl.format_raw, r.id AS record_id, r.artist, r.title,
+        sl.raw_payload->>'image_url' AS store_photo,
+        CASE
+            WHEN (sl.format_raw ILIKE ANY(cast(:vinyl_fmts as text[])) OR sl.format_raw ~ :vinyl_re)
+                 AND (r.format_type IS NULL OR r.format_type ILIKE '%vinyl%') THEN 'vinyl'
+            WHEN sl.format_raw ILIKE ANY(cast(:cd_fmts as text[]))
+                 AND (r.format_type IS NULL OR r.format_type ILIKE '%cd%') THEN 'cd'
+            WHEN sl.format_raw ILIKE 'cassette%'
+                 AND (r.format_type IS NULL OR r.format_type ILIKE '%cassette%') THEN 'cassette'
+        END AS fmt_class
+    FROM store_listings sl
+    JOIN stores s ON s.id = sl.store_id
+    JOIN records r ON r.id = sl.matched_record_id
+    WHERE s.is_active = true
+      AND sl.status = 'in_stock'
+      AND sl.matched_record_id IS NOT NULL
+      AND sl.price_rub IS NOT NULL
+      AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+      AND r.merged_into_id IS NULL
+      AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+      {scope}
+),
+exploded AS (
+    SELECT live.*, f.fmt
+    FROM live CROSS JOIN LATERAL (VALUES ('all'), (live.fmt_class)) AS f(fmt)
+    WHERE f.fmt IS NOT NULL
+)
+INSERT INTO market_offer_index (
+    dedup_key, fmt, store_id, record_id, min_price_rub, stores_with_stock,
+    cheapest_store_slug, first_seen_at, artist, title, store_photo, format_raw, refreshed_at
+)
+SELECT
+    dedup_key, fmt, NULL,
+    (ARRAY_AGG(record_id ORDER BY price_rub))[1],
+    MIN(price_rub),
+    COUNT(DISTINCT store_id),
+    (ARRAY_AGG(store_slug ORDER BY price_rub))[1],
+    MAX(first_seen_at),
+    (ARRAY_AGG(artist ORDER BY price_rub))[1],
+    (ARRAY_AGG(title ORDER BY price_rub))[1],
+    (ARRAY_AGG(store_photo ORDER BY price_rub))[1],
+    (ARRAY_AGG(format_raw ORDER BY price_rub))[1],
+    NOW()
+FROM exploded
+GROUP BY dedup_key, fmt
+UNION ALL
+SELECT
+    dedup_key, fmt, store_id,
+    (ARRAY_AGG(record_id ORDER BY price_rub))[1],
+    MIN(price_rub),
+    1,
+    MIN(store_slug),
+    (ARRAY_AGG(first_seen_at ORDER BY price_rub))[1],
+    (ARRAY_AGG(artist ORDER BY price_rub))[1],
+    (ARRAY_AGG(title ORDER BY price_rub))[1],
+    (ARRAY_AGG(store_photo ORDER BY price_rub))[1],
+    (ARRAY_AGG(format_raw ORDER BY price_rub))[1],
+    NOW()
+FROM exploded
+GROUP BY dedup_key, fmt, store_id
+ORDER BY 1, 2, 3
+ON CONFLICT (dedup_key, fmt, (coalesce(store_id::text, ''))) DO UPDATE SET
+    record_id = excluded.record_id,
+    min_price_rub = excluded.min_price_rub,
+    stores_with_stock = excluded.stores_with_stock,
+    cheapest_store_slug = excluded.cheapest_store_slug,
+    first_seen_at = excluded.first_seen_at,
+    artist = excluded.artist,
+    title = excluded.title,
+    store_photo = excluded.store_photo,
+    format_raw = excluded.format_raw,
+    refreshed_at = excluded.refreshed_at
+"""
+
+_FMT_PARAMS = {"vinyl_fmts": _VINYL_FMTS, "vinyl_re": _VINYL_RE, "cd_fmts": _CD_FMTS}
+
+
+async def _rebuild_keys(db: AsyncSession, keys: list[str]) -> None:
+    for i in range(0, len(keys), _KEYS_CHUNK):
+        chunk = keys[i:i + _KEYS_CHUNK]
+        await db.execute(
+            text(_REBUILD.format(
+                scope="AND COALESCE(r.discogs_master_id, r.id::text) = ANY(cast(:keys as text[]))",
+            )),
+            {"keys": chunk, **_FMT_PARAMS},
+        )
+        await db.execute(
+            text(
+                "DELETE FROM market_offer_index "
+                "WHERE dedup_key = ANY(cast(:keys as text[])) AND refreshed_at < NOW()"
+            ),
+            {"keys": chunk},
+        )
+
+
+async def refresh_offer_index(
+    db: AsyncSession,
+    *,
+    store_ids: Iterable | None = None,
+    since: datetime | None = None,
+    record_ids: Iterable | None = None,
+) -> None:
+    """Пересобрать строки индекса, которых касаются магазины / записи. Без commit.
+
+    store_ids + since — ключи листингов этих магазинов с updated_at >= since
+    (любой статус: ушедший из наличия оффер должен пропасть). Без since —
+    все ключи листингов магазина + ключи, что уже лежат в индексе за ним.
+    record_ids — ключи этих записей (матчер). Ошибка откатывает только свой
+    savepoint — дрейф поправит rebuild_offer_index.
+    """
+    sids = list({s for s in (store_ids or ()) if s is not None})
+    rids = list({r for r in (record_ids or ()) if r is not None})
+    if not sids and not rids:
+        return
+    if since is not None:
+        store_scope = "AND sl.updated_at >= :since"
+        indexed = ""
+    else:
+        store_scope = ""
+        indexed = (
+            "UNION SELECT dedup_key FROM market_offer_index "
+            "WHERE store_id = ANY(cast(:sids as uuid[]))"
+        )
+    try:
+        async with db.begin_nested():
+            res = await db.execute(
+                text(
+                    f"""
+                    SELECT COALESCE(r.discogs_master_id, r.id::text)
+                    FROM store_listings sl JOIN records r ON r.id = sl.matched_record_id
+                    WHERE sl.store_id = ANY(cast(:sids as uuid[]))
+                      {store_scope}
+                    {indexed}
+                    UNION
+                    SELECT COALESCE(r.discogs_master_id, r.id::text)
+                    FROM records r WHERE r.id = ANY(cast(:rids as uuid[]))
+                    """
+                ),
+                {"sids": sids, "since": since, "rids": rids},
+            )
+            keys = sorted(row[0] for row in res)
+            await _rebuild_keys(db, keys)
+    except Exception:
+        logger.exception(
+            "market_offer_index refresh failed (stores=%d, records=%d)", len(sids), len(rids),
+        )
+
+
+async def rebuild_offer_index(db: AsyncSession) -> None:
+    """Полная пересборка индекса. Без commit — читатели видят старые строки до него."""
+    await db.execute(text(_REBUILD.format(scope="")), _FMT_PARAMS)
+    await db.execute(text("DELETE FROM market_offer_index WHERE refreshed_at < NOW()"))
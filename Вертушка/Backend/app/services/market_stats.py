@@ -0,0 +1,93 @@
+"""
+Витрина магазинов (GET /api/market/stores): агрегаты по магазину в таблице
+market_store_stats.
+
+Раньше это была matview с REFRESH CONCURRENTLY каждые 15 минут — полный
+проход по store_listings, даже если обошли один магазин. Теперь строки
+пересчитываются точечно, по store_id (индексный проход по листингам одного
+магазина), в той же транзакции, что и запись, которая их меняет:
+  - scrapers.runner.crawl_store — по окончании обхода;
+  - scrapers.stock_refresh — после bulk-апдейта цен/статусов;
+  - listing_matcher._match_chunk — когда в чанке появились матчи.
+
+reconcile_all_store_stats (раз в час) пересчитывает все магазины: правит
+дрейф и «стареющие» окна (7d stale / 24h new), которые сами по себе без
+записи в листинги не двигаются.
+
+FILTER-условия 1:1 с живыми запросами market.py — иначе счётчики разойдутся
+с каруселями/сеткой.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+_UPSERT_STATS = """
+INSERT INTO market_store_stats (store_id, in_stock_count, avg_price_rub, new_today_count, refreshed_at)
+SELECT
+    s.id,
+    COUNT(sl.id) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+          AND sl.matched_record_id IS NOT NULL
+          AND sl.price_rub IS NOT NULL
+          AND r.merged_into_id IS NULL
+          AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+    ),
+    AVG(sl.price_rub) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+          AND sl.price_rub IS NOT NULL
+          AND sl.matched_record_id IS NOT NULL
+          AND r.merged_into_id IS NULL
+    ),
+    COUNT(sl.id) FILTER (
+        WHERE sl.status = 'in_stock'
+          AND sl.first_seen_at >= NOW() - INTERVAL '24 hours'
+          AND sl.matched_record_id IS NOT NULL
+          AND sl.price_rub IS NOT NULL
+          AND r.merged_into_id IS NULL
+          AND COALESCE(r.cover_local_path, r.cover_image_url, sl.raw_payload->>'image_url') IS NOT NULL
+    ),
+    NOW()
+FROM stores s
+LEFT JOIN store_listings sl ON sl.store_id = s.id
+LEFT JOIN records r ON r.id = sl.matched_record_id
+WHERE {scope}
+GROUP BY s.id
+ON CONFLICT (store_id) DO UPDATE SET
+    in_stock_count = excluded.in_stock_count,
+    avg_price_rub = excluded.avg_price_rub,
+    new_today_count = excluded.new_today_count,
+    refreshed_at = excluded.refreshed_at
+"""
+
+
+async def refresh_store_stats(db: AsyncSession, store_ids: Iterable) -> None:
+    """Пересчитать строки витрины для магазинов. Без commit — в транзакции вызывающего.
+
+    Ошибка не роняет основную запись: откатывается только свой savepoint,
+    дрейф поправит reconcile_all_store_stats.
+    """
+    ids = list({sid for sid in store_ids if sid is not None})
+    if not ids:
+        return
+    try:
+        async with db.begin_nested():
+            await db.execute(
+                text(_UPSERT_STATS.format(scope="s.id = ANY(cast(:ids as uuid[]))")),
+                {"ids": ids},
+            )
+    except Exception:
+        logger.exception("market_store_stats refresh failed for %d stores", len(ids))
+
+
+async def reconcile_all_store_stats(db: AsyncSession) -> None:
+    """Полный пересчёт витрины по всем активным магазинам. Без commit."""
+    await db.execute(text(_UPSERT_STATS.format(scope="s.is_active = true")))
@@ -1,49 +1,289 @@
 """
-In-memory WebSocket hub для DM.
+WebSocket hub для DM: локальные сокеты воркера + fan-out между воркерами.
 
-Подключения держатся в dict {user_id: [WebSocket, ...]}. Когда сервис messaging
-шлёт push_event(user_id, event), мы рассылаем JSON во все активные сокеты этого
-пользователя. Один воркер uvicorn — соединения in-memory; при росте — заменим
-на Redis pub/sub.
+Подключения держатся в dict {user_id: {WebSocket: _Conn}} своего воркера.
+push_event(user_id, event) сериализует событие один раз и отдаёт его
+бэкенду (WS_HUB_BACKEND):
+  - redis (по умолчанию) — PUBLISH в канал пользователя. Каждый воркер
+    держит одно subscriber-соединение и подписан ровно на каналы тех, у кого
+    есть сокет на нём (SUBSCRIBE на первый сокет юзера, UNSUBSCRIBE — на
+    последний), так что событие доходит до сокетов на любом воркере. Пока
+    Redis недоступен — деградируем в local;
+  - local — только сокеты этого воркера (один воркер / dev).
+
+Рассылка по локальным сокетам не ждёт сокеты по очереди: у каждого своя
+ограниченная очередь отправки и своя задача-отправитель. Очередь
+переполнилась (клиент не читает) — сокет закрываем, остальных это не тормозит.
+
+Presence (has_active) — по всему кластеру: ZSET в Redis на юзера, member =
+воркер, score = дедлайн; воркер продлевает его для своих юзеров раз в
+PRESENCE_HEARTBEAT секунд, упавший воркер сам выпадет через PRESENCE_TTL.
 
 Typing: на клиента приходит событие 'typing' от собеседника (сервер ретрансилит
 команду одного юзера всем другим участникам).
 """
+import asyncio
 import logging
+import uuid
 from typing import Any
 
+import orjson
 from fastapi import WebSocket
 
+from app.config import get_settings
+from app.services.cache import cache
+
 logger = logging.getLogger(__name__)
 
-# user_id (str) → set of active WebSocket
-_hub: dict[str, set[WebSocket]] = {}
+SEND_QUEUE_SIZE = 64        # событий в очереди одного сокета до отключения
+PRESENCE_TTL = 60           # сек — сколько живёт отметка воркера без heartbeat
+PRESENCE_HEARTBEAT = 20     # сек — как часто воркер продлевает свои отметки
+
+_CHANNEL_NS = "ws_dm"
+_PRESENCE_NS = "ws_presence"
+
+
+class _Conn:
+    """Сокет + его очередь отправки. Отправитель живёт столько же, сколько сокет."""
+
+    __slots__ = ("user_id", "ws", "queue", "task")
+
+    def __init__(self, user_id: str, ws: WebSocket) -> None:
+        self.user_id = user_id
+        self.ws = ws
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.task = asyncio.create_task(self._sender())
+
+    def offer(self, text: str) -> bool:
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _sender(self) -> None:
+        try:
+            while True:
+                text = await self.queue.get()
+                await self.ws.send_text(text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Соединение оборвалось — выкидываем из hub
+            asyncio.create_task(unregister(self.user_id, self.ws))
+
+
+# user_id (str) → {WebSocket: _Conn}
+_hub: dict[str, dict[WebSocket, _Conn]] = {}
+
+
+def _deliver(user_id: str, raw: bytes) -> None:
+    """Разложить событие по очередям локальных сокетов юзера (без await)."""
+    conns = _hub.get(user_id)
+    if not conns:
+        return
+    text = raw.decode()
+    for conn in list(conns.values()):
+        if not conn.offer(text):
+            logger.warning("ws send queue overflow for user %s — closing slow socket", user_id)
+            asyncio.create_task(_drop_slow(conn))
+
+
+async def _drop_slow(conn: _Conn) -> None:
+    await unregister(conn.user_id, conn.ws)
+    try:
+        await conn.ws.close(code=1013)  # try again later: клиент переподключится
+    except Exception:
+        pass
+
+
+class LocalBackend:
+    """Только сокеты этого воркера."""
+
+    name = "local"
+
+    async def publish(self, user_id: str, raw: bytes) -> None:
+        _deliver(user_id, raw)
+
+    async def subscribe(self, user_id: str) -> None:
+        pass
+
+    async def unsubscribe(self, user_id: str) -> None:
+        pass
+
+    async def is_online(self, user_id: str) -> bool:
+        return False
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Каналы на юзера + одно subscriber-соединение на воркер."""
+
+    name = "redis"
+
+    def __init__(self) -> None:
+        self.worker_id = uuid.uuid4().hex
+        self._pubsub = None
+        self._reader: asyncio.Task | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._lock: asyncio.Lock | None = None
+        self._prefix = cache.channel_name(_CHANNEL_NS, "")
+
+    def _channel(self, user_id: str) -> str:
+        return cache.channel_name(_CHANNEL_NS, user_id)
+
+    async def _ensure(self) -> bool:
+        """Поднять subscriber + heartbeat, если ещё нет. False — Redis недоступен."""
+        if not cache.available:
+            return False
+        if self._reader is not None and not self._reader.done():
+            return True
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._reader is not None and not self._reader.done():
+                return True
+            pubsub = cache.open_pubsub()
+            if pubsub is None:
+                return False
+            try:
+                # Служебный канал воркера: соединение всегда на что-то
+                # подписано, даже когда локальных сокетов нет
+                await pubsub.subscribe(self._channel(f"~{self.worker_id}"))
+                # Переподписка после падения subscriber'а — на всех своих юзеров
+                if _hub:
+                    await pubsub.subscribe(*(self._channel(uid) for uid in _hub))
+            except Exception:
+                logger.warning("ws hub: Redis subscribe failed — local delivery only", exc_info=True)
+                await pubsub.aclose()
+                return False
+            self._pubsub = pubsub
+            self._reader = asyncio.create_task(self._read_loop(pubsub))
+            if _hub:
+                await cache.presence_touch(_PRESENCE_NS, list(_hub), self.worker_id, PRESENCE_TTL)
+            if self._heartbeat is None or self._heartbeat.done():
+                self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+            return True
+
+    async def _read_loop(self, pubsub) -> None:
+        try:
+            while True:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg is None or msg.get("type") != "message":
+                    continue
+                channel = msg["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                _deliver(channel[len(self._prefix):], msg["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("ws hub subscriber died", exc_info=True)
+            # События до наших юзеров больше не доходят — не держим их онлайн
+            # до переподписки (heartbeat / следующий publish поднимут reader)
+            if _hub:
+                await cache.presence_drop(_PRESENCE_NS, list(_hub), self.worker_id)
+        finally:
+            if self._pubsub is pubsub:
+                self._pubsub = None
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT)
+            # Упавший subscriber поднимаем здесь же: иначе воркер, чьи юзеры
+            # ничего не шлют, молча перестал бы получать fan-out. Без живого
+            # reader'а presence не продлеваем — пусть истечёт по TTL, а не
+            # показывает онлайн тех, до кого события не доходят.
+            if not await self._ensure():
+                continue
+            if _hub:
+                await cache.presence_touch(_PRESENCE_NS, list(_hub), self.worker_id, PRESENCE_TTL)
+
+    async def publish(self, user_id: str, raw: bytes) -> None:
+        if not await self._ensure() or not await cache.publish_raw(_CHANNEL_NS, user_id, raw):
+            _deliver(user_id, raw)
+
+    async def subscribe(self, user_id: str) -> None:
+        if not await self._ensure():
+            return
+        try:
+            await self._pubsub.subscribe(self._channel(user_id))
+        except Exception:
+            logger.warning("ws hub subscribe failed for %s", user_id, exc_info=True)
+            return
+        await cache.presence_touch(_PRESENCE_NS, [user_id], self.worker_id, PRESENCE_TTL)
+
+    async def unsubscribe(self, user_id: str) -> None:
+        if self._pubsub is None or not cache.available:
+            return
+        try:
+            await self._pubsub.unsubscribe(self._channel(user_id))
+        except Exception:
+            logger.warning("ws hub unsubscribe failed for %s", user_id, exc_info=True)
+        await cache.presence_drop(_PRESENCE_NS, [user_id], self.worker_id)
+
+    async def is_online(self, user_id: str) -> bool:
+        return await cache.presence_count(_PRESENCE_NS, user_id) > 0
+
+    async def close(self) -> None:
+        for task in (self._reader, self._heartbeat):
+            if task is not None and not task.done():
+                task.cancel()
+        if _hub:
+            await cache.presence_drop(_PRESENCE_NS, list(_hub), self.worker_id)
+        self._reader = self._heartbeat = None
+
+
+def _make_backend():
+    name = get_settings().ws_hub_backend
+    if name == "local":
+        return LocalBackend()
+    if name != "redis":
+        logger.warning("unknown WS_HUB_BACKEND=%r — using redis", name)
+    return RedisBackend()
+
+
+_backend = _make_backend()
 
 
 async def register(user_id: str, ws: WebSocket) -> None:
-    _hub.setdefault(user_id, set()).add(ws)
+    conns = _hub.setdefault(user_id, {})
+    first = not conns
+    conns[ws] = _Conn(user_id, ws)
+    if first:
+        await _backend.subscribe(user_id)
 
 
 async def unregister(user_id: str, ws: WebSocket) -> None:
     conns = _hub.get(user_id)
     if not conns:
         return
-    conns.discard(ws)
+    conn = conns.pop(ws, None)
+    if conn is not None:
+        conn.task.cancel()
     if not conns:
         _hub.pop(user_id, None)
+        await _backend.unsubscribe(user_id)
 
 
-def has_active(user_id: str) -> bool:
-    return bool(_hub.get(user_id))
+async def has_active(user_id: str) -> bool:
+    """Есть ли у юзера открытый DM-сокет на любом воркере."""
+    if _hub.get(user_id):
+        return True
+    return await _backend.is_online(user_id)
 
 
 async def push_event(user_id: Any, event: dict) -> None:
-    """Отправить JSON-событие всем активным сокетам пользователя."""
-    key = str(user_id)
-    conns = list(_hub.get(key, set()))
-    for ws in conns:
-        try:
-            await ws.send_json(event)
-        except Exception:
-            # Соединение оборвалось — выкидываем из hub
-            await unregister(key, ws)
+    """Отправить JSON-событие всем активным сокетам пользователя (на всех воркерах)."""
+    await _backend.publish(str(user_id), orjson.dumps(event))
+
+
+async def close() -> None:
+    """Остановить subscriber/heartbeat воркера и снять его presence (shutdown)."""
+    await _backend.close()
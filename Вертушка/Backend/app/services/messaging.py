@@ -7,9 +7,10 @@ from datetime import datetime
 from uuid import UUID
 
 from fastapi import HTTPException, status
-from sqlalchemy import select, and_, or_, func
+from sqlalchemy import case, select, and_, or_, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models.conversation import (
     Conversation,
@@ -42,6 +43,23 @@ async def is_user_blocked(db: AsyncSession, a_id: UUID, b_id: UUID) -> bool:
     return row.scalar_one_or_none() is not None
 
 
+async def blocked_partner_ids(
+    db: AsyncSession, user_id: UUID, partner_ids: list[UUID]
+) -> set[UUID]:
+    """Из partner_ids — те, с кем у user_id блок в любую сторону. Один запрос на страницу."""
+    if not partner_ids:
+        return set()
+    rows = await db.execute(
+        select(UserBlock.blocker_id, UserBlock.blocked_id).where(
+            or_(
+                and_(UserBlock.blocker_id == user_id, UserBlock.blocked_id.in_(partner_ids)),
+                and_(UserBlock.blocked_id == user_id, UserBlock.blocker_id.in_(partner_ids)),
+            )
+        )
+    )
+    return {blocked if blocker == user_id else blocker for blocker, blocked in rows}
+
+
 async def is_following(db: AsyncSession, follower_id: UUID, following_id: UUID) -> bool:
     """True если follower_id подписан на following_id."""
     row = await db.execute(
@@ -257,10 +275,47 @@ async def post_message(
     conversation.last_message_at = now
     conversation.last_message_preview = preview[:160]
     conversation.last_message_sender_id = sender_id
+    # Инбокс-счётчики участников: +1 непрочитанное всем, кроме отправителя
+    await db.execute(
+        update(ConversationParticipant)
+        .where(ConversationParticipant.conversation_id == conversation.id)
+        .values(
+            last_message_at=now,
+            unread_count=case(
+                (
+                    ConversationParticipant.user_id != sender_id,
+                    ConversationParticipant.unread_count + 1,
+                ),
+                else_=ConversationParticipant.unread_count,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
     await db.flush()
     return message
 
 
+async def on_message_deleted(db: AsyncSession, message: Message) -> None:
+    """Tombstone сообщения: −1 непрочитанное у тех, кто его ещё не прочитал.
+
+    Вызывать до commit и только при первом удалении (deleted_at был None).
+    """
+    await db.execute(
+        update(ConversationParticipant)
+        .where(
+            ConversationParticipant.conversation_id == message.conversation_id,
+            ConversationParticipant.user_id != message.sender_id,
+            ConversationParticipant.unread_count > 0,
+            or_(
+                ConversationParticipant.last_read_at.is_(None),
+                ConversationParticipant.last_read_at < message.created_at,
+            ),
+        )
+        .values(unread_count=ConversationParticipant.unread_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
 async def mark_read(
     db: AsyncSession,
     participant: ConversationParticipant,
@@ -274,8 +329,37 @@ async def mark_read(
         )
 
     if participant.last_read_at is None or message.created_at > participant.last_read_at:
-        participant.last_read_at = message.created_at
-        await db.flush()
+        # Пересчёт, а не обнуление: прочитали «до» сообщения, за ним могут быть
+        # новые. Одним UPDATE с подзапросом — счёт в Python и запись обратно
+        # затёрли бы +1 от post_message, закоммиченный между ними
+        unread = (
+            select(func.count(Message.id))
+            .where(
+                Message.conversation_id == ConversationParticipant.conversation_id,
+                Message.sender_id != ConversationParticipant.user_id,
+                Message.deleted_at.is_(None),
+                Message.created_at > message.created_at,
+            )
+            .correlate(ConversationParticipant)
+            .scalar_subquery()
+        )
+        res = await db.execute(
+            update(ConversationParticipant)
+            .where(
+                ConversationParticipant.id == participant.id,
+                or_(
+                    ConversationParticipant.last_read_at.is_(None),
+                    ConversationParticipant.last_read_at < message.created_at,
+                ),
+            )
+            .values(last_read_at=message.created_at, unread_count=unread)
+            .returning(ConversationParticipant.last_read_at, ConversationParticipant.unread_count)
+            .execution_options(synchronize_session=False)
+        )
+        row = res.one_or_none()
+        if row is not None:
+            set_committed_value(participant, "last_read_at", row.last_read_at)
+            set_committed_value(participant, "unread_count", row.unread_count)
 
 
 async def count_unread_in_conversation(
@@ -299,27 +383,23 @@ async def compute_total_unread(
     db: AsyncSession, user_id: UUID
 ) -> tuple[int, int]:
     """Возвращает (primary_unread, requests_unread) — для бейджа в табе."""
-    parts_q = await db.execute(
-        select(ConversationParticipant).where(
-            ConversationParticipant.user_id == user_id,
-            ConversationParticipant.archived_at.is_(None),
-        )
-    )
-    parts = parts_q.scalars().all()
-
-    primary = 0
-    requests = 0
-    for p in parts:
-        n = await count_unread_in_conversation(
-            db, p.conversation_id, user_id, p.last_read_at
+    is_pending = ConversationParticipant.request_status == "pending"
+    row = (
+        await db.execute(
+            select(
+                func.coalesce(
+                    func.sum(ConversationParticipant.unread_count).filter(~is_pending), 0
+                ),
+                func.coalesce(
+                    func.sum(ConversationParticipant.unread_count).filter(is_pending), 0
+                ),
+            ).where(
+                ConversationParticipant.user_id == user_id,
+                ConversationParticipant.archived_at.is_(None),
+            )
         )
-        if n <= 0:
-            continue
-        if p.request_status == "pending":
-            requests += n
-        else:
-            primary += n
-    return primary, requests
+    ).one()
+    return int(row[0]), int(row[1])
 
 
 def partner_id_of(conv: Conversation, my_user_id: UUID) -> UUID:
@@ -0,0 +1,190 @@
+"""
+record_offer_summary — готовые агрегаты офферов для Hot Stock pill.
+
+POST /records/offers/summary зовётся на каждую видимую сетку (20–60
+discogs_id) и раньше считал два GROUP BY по store_listings, причём alt-версии
+— через self-join records r2 по discogs_master_id, разворачивавшийся в
+листинги всех прессов мастера. Теперь строка на discogs_id уже лежит в
+таблице: exact-счётчики (in_stock / preorder / магазины / min-цена) и
+alt-счётчики по другим прессам того же мастера. Чтение — один lookup по PK.
+
+Строки есть только у записей, у которых что-то ненулевое: отсутствие строки
+= «офферов нет» (Mobile рендерит variant='none').
+
+Поддержка — по затронутым discogs_id + их мастерам целиком (alt-счётчики
+соседей по мастеру тоже двигаются), в транзакции записи:
+  - scrapers.runner / scrapers.stock_refresh — записи листингов магазина,
+    у которых updated_at сдвинулся (цена/статус реально поменялись);
+  - listing_matcher._match_chunk — записи новых матчей.
+Раз в час — полная пересборка (rebuild_offer_summary): правит дрейф и
+7-дневное окно свежести, которое само по себе без записи не двигается.
+
+Пересборки идут параллельно (обходы магазинов, матчер, reconcile), поэтому
+запись — upsert по PK discogs_id в порядке discogs_id, затем удаление строк
+скоупа, которых пересборка не коснулась (refreshed_at < NOW() транзакции).
+DELETE + INSERT ловил unique violation на PK: точечный refresh молча терял
+обновление в своём savepoint, часовой reconcile падал целиком.
+
+FILTER-условия 1:1 с прежним live-запросом api/offers.py.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+
+_REBUILD = """
+WITH live AS (
+    SELECT r.discogs_id, r.discogs_master_id, sl.store_id, sl.status, sl.price_rub
+    FROM store_listings sl
+    JOIN records r ON r.id = sl.matched_record_id
+    WHERE sl.status IN ('in_stock', 'preorder')
+      AND sl.last_seen_at >= NOW() - INTERVAL '7 days'
+      AND r.discogs_id IS NOT NULL
+      {scope}
+),
+per_rec AS (
+    SELECT
+        discogs_id, discogs_master_id,
+        COUNT(*) FILTER (WHERE status = 'in_stock') AS in_stock_count,
+        COUNT(*) FILTER (WHERE status = 'preorder') AS preorder_count,
+        MIN(price_rub) FILTER (WHERE status = 'in_stock') AS min_price_rub,
+        COUNT(DISTINCT store_id) FILTER (WHERE status = 'in_stock') AS stores_with_stock
+    FROM live
+    GROUP BY discogs_id, discogs_master_id
+),
+targets AS (
+    -- Свои офферы или in_stock у другого пресса того же мастера
+    SELECT r.discogs_id, r.discogs_master_id
+    FROM records r
+    WHERE r.discogs_id IN (SELECT discogs_id FROM per_rec)
+       OR r.discogs_master_id IN (
+            SELECT discogs_master_id FROM per_rec
+            WHERE discogs_master_id IS NOT NULL AND in_stock_count > 0
+       )
+),
+alt AS (
+    SELECT
+        t.discogs_id,
+        SUM(o.in_stock_count) AS alt_version_count,
+        MIN(o.min_price_rub) AS min_price_alt_rub
+    FROM targets t
+    JOIN per_rec o
+      ON o.discogs_master_id = t.discogs_master_id
+     AND o.discogs_id <> t.discogs_id
+    GROUP BY t.discogs_id
+)
+INSERT INTO record_offer_summary (
+    discogs_id, discogs_master_id, in_stock_count, preorder_count,
+    alt_version_count, min_price_rub, min_price_alt_rub, stores_with_stock, refreshed_at
+)
+SELECT
+    t.discogs_id, t.discogs_master_id,
+    COALESCE(p.in_stock_count, 0),
+    COALESCE(p.preorder_count, 0),
+    COALESCE(a.alt_version_count, 0),
+    p.min_price_rub,
+    a.min_price_alt_rub,
+    COALESCE(p.stores_with_stock, 0),
+    NOW()
+FROM targets t
+LEFT JOIN per_rec p ON p.discogs_id = t.discogs_id
+LEFT JOIN alt a ON a.discogs_id = t.discogs_id
+WHERE COALESCE(p.in_stock_count, 0) + COALESCE(p.preorder_count, 0)
+    + COALESCE(a.alt_version_count, 0) > 0
+ORDER BY t.discogs_id
+ON CONFLICT (discogs_id) DO UPDATE SET
+    discogs_master_id = excluded.discogs_master_id,
+    in_stock_count = excluded.in_stock_count,
+    preorder_count = excluded.preorder_count,
+    alt_version_count = excluded.alt_version_count,
+    min_price_rub = excluded.min_price_rub,
+    min_price_alt_rub = excluded.min_price_alt_rub,
+    stores_with_stock = excluded.stores_with_stock,
+    refreshed_at = excluded.refreshed_at
+"""
+
+_SCOPE = (
+    "AND (r.discogs_id = ANY(cast(:dids as text[])) "
+    "OR r.discogs_master_id = ANY(cast(:masters as text[])))"
+)
+
+
+async def _rebuild_keys(db: AsyncSession, dids: list[str], masters: list[str]) -> None:
+    """Пересобрать строки для discogs_id и всех прессов мастеров.
+
+    Одним запросом, без чанков: alt-счётчикам записи нужны все прессы её
+    мастера в одном скоупе.
+    """
+    params = {"dids": dids, "masters": masters}
+    await db.execute(text(_REBUILD.format(scope=_SCOPE)), params)
+    # Ключи скоупа, у которых офферов не осталось
+    await db.execute(
+        text(
+            "DELETE FROM record_offer_summary "
+            "WHERE (discogs_id = ANY(cast(:dids as text[])) "
+            "       OR discogs_master_id = ANY(cast(:masters as text[]))) "
+            "  AND refreshed_at < NOW()"
+        ),
+        params,
+    )
+
+
+async def refresh_offer_summary(
+    db: AsyncSession,
+    *,
+    store_ids: Iterable | None = None,
+    since: datetime | None = None,
+    record_ids: Iterable | None = None,
+) -> None:
+    """Пересобрать summary для записей, чьи листинги поменялись. Без commit.
+
+    store_ids + since — записи листингов этих магазинов с updated_at >= since
+    (без since — все листинги магазина). record_ids — записи целиком (матчер).
+    Ошибка откатывает только свой savepoint — дрейф поправит
+    rebuild_offer_summary.
+    """
+    sids = list({s for s in (store_ids or ()) if s is not None})
+    rids = list({r for r in (record_ids or ()) if r is not None})
+    if not sids and not rids:
+        return
+    since_clause = "AND sl.updated_at >= :since" if since is not None else ""
+    try:
+        async with db.begin_nested():
+            res = await db.execute(
+                text(
+                    f"""
+                    SELECT r.discogs_id, r.discogs_master_id
+                    FROM store_listings sl JOIN records r ON r.id = sl.matched_record_id
+                    WHERE sl.store_id = ANY(cast(:sids as uuid[]))
+                      {since_clause}
+                      AND r.discogs_id IS NOT NULL
+                    UNION
+                    SELECT r.discogs_id, r.discogs_master_id
+                    FROM records r
+                    WHERE r.id = ANY(cast(:rids as uuid[])) AND r.discogs_id IS NOT NULL
+                    """
+                ),
+                {"sids": sids, "since": since, "rids": rids},
+            )
+            rows = res.all()
+            dids = sorted({row.discogs_id for row in rows})
+            masters = sorted({row.discogs_master_id for row in rows if row.discogs_master_id})
+            if dids:
+                await _rebuild_keys(db, dids, masters)
+    except Exception:
+        logger.exception(
+            "record_offer_summary refresh failed (stores=%d, records=%d)", len(sids), len(rids),
+        )
+
+
+async def rebuild_offer_summary(db: AsyncSession) -> None:
+    """Полная пересборка summary. Без commit — читатели видят старые строки до него."""
+    await db.execute(text(_REBUILD.format(scope="")))
+    await db.execute(text("DELETE FROM record_offer_summary WHERE refreshed_at < NOW()"))
@@ -1,7 +1,12 @@
 """
 Генерация OG-изображений для публичных профилей.
 Размер: 1200x630px PNG.
+
+Обложки: load_cover_bytes (локальное зеркало cover_local_path, иначе
+параллельная загрузка одним клиентом). Сама отрисовка синхронная —
+render_profile_og_image зовётся в потоке через render_cache.
 """
+import asyncio
 import io
 import logging
 from pathlib import Path
@@ -9,8 +14,13 @@ from pathlib import Path
 import httpx
 from PIL import Image, ImageDraw, ImageFont
 
+from app.config import get_settings
+
 logger = logging.getLogger(__name__)
 
+# Поднять при изменении раскладки — сменит ключи в render_cache
+OG_RENDER_VERSION = 1
+
 # Цвета (из theme)
 BG_COLOR = (15, 15, 15)           # #0f0f0f
 CARD_COLOR = (37, 37, 37)         # #252525
@@ -52,20 +62,54 @@ def _get_font(size: int, bold: bool = False) -> ImageFont.FreeTypeFont:
     return ImageFont.load_default()
 
 
-async def _download_cover(url: str, size: int = COVER_SIZE) -> Image.Image | None:
-    """Скачивает обложку и ресайзит."""
+def _read_local_cover(rel_path: str) -> bytes | None:
+    """Обложка из локального зеркала (cover_local_path относительно uploads/)."""
+    path = Path(get_settings().covers_dir).parent / rel_path
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
+
+async def _fetch_cover(
+    client: httpx.AsyncClient, local_path: str | None, url: str | None
+) -> bytes | None:
+    if local_path:
+        data = await asyncio.to_thread(_read_local_cover, local_path)
+        if data:
+            return data
+    if not url:
+        return None
     try:
-        async with httpx.AsyncClient(timeout=10) as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            img = Image.open(io.BytesIO(resp.content)).convert("RGB")
-            img = img.resize((size, size), Image.LANCZOS)
-            return img
+        resp = await client.get(url)
+        resp.raise_for_status()
+        return resp.content
     except Exception as e:
         logger.warning(f"Failed to download cover {url}: {e}")
         return None
 
 
+async def load_cover_bytes(sources: list[tuple[str | None, str | None]]) -> list[bytes | None]:
+    """Байты обложек по (cover_local_path, cover_image_url), в том же порядке.
+    Сначала локальный файл, иначе URL; загрузки идут параллельно."""
+    async with httpx.AsyncClient(timeout=10) as client:
+        return list(await asyncio.gather(
+            *(_fetch_cover(client, local_path, url) for local_path, url in sources)
+        ))
+
+
+def _decode_cover(data: bytes | None, size: int = COVER_SIZE) -> Image.Image | None:
+    """Декодирует и ресайзит обложку."""
+    if not data:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data)).convert("RGB")
+        return img.resize((size, size), Image.LANCZOS)
+    except Exception as e:
+        logger.warning(f"Failed to decode cover: {e}")
+        return None
+
+
 def _draw_placeholder(draw: ImageDraw.ImageDraw, x: int, y: int, size: int) -> None:
     """Рисует плейсхолдер обложки."""
     draw.rectangle([x, y, x + size, y + size], fill=CARD_COLOR)
@@ -73,15 +117,16 @@ def _draw_placeholder(draw: ImageDraw.ImageDraw, x: int, y: int, size: int) -> N
     draw.text((x + size // 2, y + size // 2), "🎵", fill=TEXT_SECONDARY, font=font, anchor="mm")
 
 
-async def generate_profile_og_image(
+def render_profile_og_image(
     username: str,
     display_name: str | None,
     collection_count: int,
     collection_value: float | None,
-    cover_urls: list[str],
-) -> io.BytesIO:
+    covers: list[bytes | None],
+) -> bytes:
     """
-    Генерирует OG-изображение 1200x630.
+    Генерирует OG-изображение 1200x630 (PNG bytes). Синхронная — CPU-работа,
+    звать через asyncio.to_thread / render_cache.
 
     Layout:
     ┌────────────────────────────────────────────────┐
@@ -100,16 +145,13 @@ async def generate_profile_og_image(
     draw = ImageDraw.Draw(img)
 
     # === Коллаж обложек (2x2, левая часть) ===
-    covers: list[Image.Image | None] = []
-    for url in cover_urls[:4]:
-        cover = await _download_cover(url, COVER_SIZE)
-        covers.append(cover)
+    images = [_decode_cover(data, COVER_SIZE) for data in covers[:4]]
 
     # Добиваем до 4 плейсхолдерами
-    while len(covers) < 4:
-        covers.append(None)
+    while len(images) < 4:
+        images.append(None)
 
-    for i, cover in enumerate(covers[:4]):
+    for i, cover in enumerate(images):
         row, col = divmod(i, 2)
         x = COVER_GRID_X + col * (COVER_SIZE + COVER_GAP)
         y = COVER_GRID_Y + row * (COVER_SIZE + COVER_GAP)
@@ -162,5 +204,4 @@ async def generate_profile_og_image(
     # === Экспорт ===
     buffer = io.BytesIO()
     img.save(buffer, format="PNG", optimize=True)
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
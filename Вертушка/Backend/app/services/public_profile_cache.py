@@ -0,0 +1,155 @@
+"""
+Кэш публичной страницы профиля /@username и буфер её просмотров.
+
+HTML страницы лежит в Redis на (username, tab): {"user_id", "etag", "html"}.
+На промахе view model собирается один раз и рендерятся обе вкладки сразу —
+переключение вкладки не пересчитывает агрегаты. Горячий профиль стоит один
+GET из Redis на заход; браузер с If-None-Match получает 304 без тела.
+
+Инвалидация — invalidate_public_profile(username) после записей владельца
+(коллекция, вишлист, настройки профиля, сам профиль). Цены, офферы
+магазинов и курс меняются батчами/по расписанию — их подхватывает TTL.
+
+Просмотры (ProfileShare.view_count) не коммитятся на каждый заход: HINCRBY
+в хэш Redis, раз в минуту flush_profile_views сбрасывает его в БД одним
+UPDATE и эмитит PROFILE_VIEW (K5/K6) владельцам. Redis недоступен —
+инкремент в БД синхронно, как раньше.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.cache import TTL_PUBLIC_PROFILE, cache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TABS = ("collection", "wishlist")
+
+_HTML_NS = "profile_html"
+_VIEWS_NS = "profile_views"
+_VIEWS_KEY = "pending"
+
+_INCR_SCRIPT = """
+return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+"""
+
+# Забрать накопленное и обнулить — атомарно, чтобы заходы между HGETALL
+# и DEL не потерялись
+_DRAIN_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return pending
+"""
+
+_ADD_VIEWS = text(
+    """
+    UPDATE profile_shares ps
+    SET view_count = ps.view_count + v.n
+    FROM unnest(cast(:user_ids as uuid[]), cast(:counts as int[])) AS v(user_id, n)
+    WHERE ps.user_id = v.user_id
+    RETURNING ps.user_id, ps.view_count
+    """
+)
+
+
+def _html_key(username: str, tab: str) -> str:
+    return f"{username}:{tab}"
+
+
+async def get_cached_page(username: str, tab: str) -> dict | None:
+    """{"user_id", "etag", "html"} или None (промах / Redis недоступен)."""
+    return await cache.get(_HTML_NS, _html_key(username, tab))
+
+
+async def store_pages(username: str, user_id: UUID, pages: dict[str, str]) -> dict[str, dict]:
+    """Положить отрендеренные вкладки в кэш. Возвращает записи по вкладкам."""
+    entries = {
+        tab: {
+            "user_id": str(user_id),
+            "etag": '"' + hashlib.sha1(html.encode()).hexdigest() + '"',
+            "html": html,
+        }
+        for tab, html in pages.items()
+    }
+    await cache.set_many(
+        _HTML_NS,
+        {_html_key(username, tab): entry for tab, entry in entries.items()},
+        TTL_PUBLIC_PROFILE,
+    )
+    return entries
+
+
+async def invalidate_public_profile(username: str | None) -> None:
+    """Сбросить закэшированные вкладки профиля (после записи владельца)."""
+    if not username:
+        return
+    for tab in PROFILE_TABS:
+        await cache.delete(_HTML_NS, _html_key(username, tab))
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match: список ETag'ов через запятую, W/-префикс или '*'."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+async def record_profile_view(db: AsyncSession, user_id: UUID) -> None:
+    """Засчитать просмотр: в буфер Redis, без Redis — сразу в БД."""
+    if await cache.run_script(_INCR_SCRIPT, _VIEWS_NS, [_VIEWS_KEY], [str(user_id), 1]) is not None:
+        return
+    try:
+        res = await db.execute(_ADD_VIEWS, {"user_ids": [user_id], "counts": [1]})
+        rows = res.all()
+        await db.commit()
+    except Exception:
+        logger.warning("profile view increment failed for %s", user_id, exc_info=True)
+        await db.rollback()
+        return
+    await _emit_profile_views(db, rows)
+
+
+async def flush_profile_views(db: AsyncSession) -> int:
+    """Сбросить буфер просмотров в profile_shares одним UPDATE. Возвращает
+    число профилей. При ошибке БД счётчики возвращаются в буфер."""
+    raw = await cache.run_script(_DRAIN_SCRIPT, _VIEWS_NS, [_VIEWS_KEY], [])
+    if not raw:
+        return 0
+    pending: dict[UUID, int] = {}
+    for field, value in zip(raw[::2], raw[1::2]):
+        pending[UUID(field.decode() if isinstance(field, bytes) else field)] = int(value)
+
+    try:
+        res = await db.execute(
+            _ADD_VIEWS,
+            {"user_ids": list(pending), "counts": list(pending.values())},
+        )
+        rows = res.all()
+        await db.commit()
+    except Exception:
+        logger.exception("flush_profile_views failed — returning %d counters to buffer", len(pending))
+        await db.rollback()
+        for user_id, n in pending.items():
+            await cache.run_script(_INCR_SCRIPT, _VIEWS_NS, [_VIEWS_KEY], [str(user_id), n])
+        return 0
+
+    await _emit_profile_views(db, rows)
+    return len(rows)
+
+
+async def _emit_profile_views(db: AsyncSession, rows) -> None:
+    """PROFILE_VIEW (K5/K6) владельцам с новым view_count."""
+    from app.services.achievements import emit_event
+    from app.services.achievements.events import PROFILE_VIEW
+
+    for user_id, view_count in rows:
+        await emit_event(db, user_id, PROFILE_VIEW, {"view_count": view_count})
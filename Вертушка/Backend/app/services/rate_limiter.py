@@ -3,10 +3,28 @@ Token Bucket Rate Limiter с приоритетной очередью для Di
 
 Гарантирует, что мы никогда не превысим лимит Discogs (60 req/min).
 Высокоприоритетные запросы (поиск) обслуживаются раньше низкоприоритетных (обогащение данных).
+
+Distributed-режим: bucket живёт в Redis и общий для всех uvicorn-воркеров и
+scheduler'а — refill+take атомарно в Lua-скрипте. Приоритеты соблюдаются и
+между процессами: каждый процесс регистрирует «спрос» приоритета своей головы
+очереди, и скрипт не отдаёт токен, пока где-то ждёт запрос приоритетом выше.
+Redis недоступен — прозрачно работаем на локальном bucket'е.
+
+Адаптивность: после каждого ответа Discogs bucket подрезается до
+X-Discogs-Ratelimit-Remaining (sync_from_headers), а фоновые приоритеты
+(ENRICHMENT/BATCH) берут токен только сверх своего резерва — когда бюджет
+на исходе, они притормаживают первыми, а поиск юзера сохраняет запас.
 """
 import asyncio
 import logging
+import os
 import time
+import uuid
+import weakref
+from collections import Counter, deque
+
+from app.config import get_settings
+from app.services.cache import cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,29 +38,132 @@ class Priority:
     BATCH = 5            # Массовые операции (recalculate-prices, load_all)
 
 
+# Сколько токенов приоритет обязан оставить в bucket'е для более важных.
+# Фон начинает ждать раньше, чем bucket опустеет, и поиск не ловит 429.
+_PRIORITY_RESERVE = {
+    Priority.ENRICHMENT: 5,
+    Priority.BATCH: 10,
+}
+
+_PRIORITY_NAMES = {
+    Priority.SEARCH: "search",
+    Priority.DETAIL: "detail",
+    Priority.SCAN: "scan",
+    Priority.ENRICHMENT: "enrichment",
+    Priority.BATCH: "batch",
+}
+
+# KEYS[1] — hash {tokens, ts}; KEYS[2] — hash спроса {"<proc>:<priority>": expires_at}.
+# ARGV: capacity, refill_rate, priority, proc_id, demand_ttl, reserve.
+# Время — из Redis (TIME), чтобы часы разных хостов не расходились.
+# Возвращает {granted, wait_seconds, tokens}; wait=-1 — уступаем более
+# приоритетному спросу другого процесса.
+_TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local priority = tonumber(ARGV[3])
+local field = ARGV[4] .. ':' .. ARGV[3]
+local need = 1 + tonumber(ARGV[6])
+
+redis.call('HSET', KEYS[2], field, now + tonumber(ARGV[5]))
+local best = priority
+local demand = redis.call('HGETALL', KEYS[2])
+for i = 1, #demand, 2 do
+  if tonumber(demand[i + 1]) < now then
+    redis.call('HDEL', KEYS[2], demand[i])
+  else
+    local p = tonumber(string.match(demand[i], ':(%d+)$'))
+    if p and p < best then best = p end
+  end
+end
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local granted = 0
+local wait = 0
+if best < priority then
+  wait = -1
+elseif tokens >= need then
+  tokens = tokens - 1
+  granted = 1
+  redis.call('HDEL', KEYS[2], field)
+else
+  wait = (need - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+redis.call('EXPIRE', KEYS[2], 60)
+return {granted, tostring(wait), tostring(tokens)}
+"""
+
+# KEYS[1] — hash {tokens, ts}; ARGV: capacity, refill_rate, remaining.
+# Подрезает bucket до фактического остатка по данным Discogs.
+_SYNC_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate, tonumber(ARGV[3]))
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(tokens)
+"""
+
+
 class TokenBucketRateLimiter:
     """Token bucket с приоритетной очередью.
 
     - capacity: максимум токенов в bucket (= burst)
     - refill_rate: токенов в секунду (60 req/min = 1 token/sec)
     - Запросы ждут в PriorityQueue, обслуживаются по приоритету
+    - distributed: bucket общий для всех процессов через Redis
     """
 
+    # Сколько живёт запись о спросе приоритета, если процесс умер
+    _DEMAND_TTL = 2.0
+    # Пауза перед повтором, когда уступаем более приоритетному процессу
+    _YIELD_SLEEP = 0.05
+    # Максимальный сон головы очереди: за это время может прийти поиск
+    _MAX_SLEEP = 0.25
+    # Окно для перцентилей ожидания (по приоритету)
+    _WAIT_SAMPLES = 1000
+
     def __init__(
         self,
         capacity: int = 55,
         refill_rate: float = 0.95,
+        distributed: bool = False,
+        name: str = "discogs",
     ):
         self._capacity = capacity
         self._refill_rate = refill_rate
         self._tokens = float(capacity)
         self._last_refill = time.monotonic()
-        self._lock = asyncio.Lock()
         self._queue: asyncio.PriorityQueue[tuple[int, float, asyncio.Event]] = asyncio.PriorityQueue()
         self._processor_task: asyncio.Task | None = None
+        self._distributed = distributed
+        self._name = name
+        self._proc_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._mode = "redis" if distributed else "local"
         # Метрики
         self._total_requests = 0
         self._total_wait_time = 0.0
+        self._queued: Counter[int] = Counter()
+        self._waits: dict[int, deque[float]] = {}
+        self._deferred: Counter[int] = Counter()
+        # Запросы, уже посчитанные в _deferred: отложенный запрос крутится
+        # в очереди много раз, а считать его надо один
+        self._deferred_events: weakref.WeakSet[asyncio.Event] = weakref.WeakSet()
+        self._rate_limited: Counter[int] = Counter()
+        self._upstream: dict[str, int] = {}
 
     def start(self) -> None:
         """Запуск фонового процессора очереди."""
@@ -82,6 +203,7 @@ class TokenBucketRateLimiter:
             self.start()
 
         event = asyncio.Event()
+        self._queued[priority] += 1
         await self._queue.put((priority, time.monotonic(), event))
         try:
             await asyncio.wait_for(event.wait(), timeout=timeout)
@@ -92,39 +214,151 @@ class TokenBucketRateLimiter:
             )
             raise
 
+    def _try_take_local(self, priority: int) -> float:
+        """0.0 — токен взят, иначе сколько ждать до следующей попытки."""
+        self._refill()
+        need = 1.0 + _PRIORITY_RESERVE.get(priority, 0)
+        if self._tokens >= need:
+            self._tokens -= 1.0
+            return 0.0
+        return (need - self._tokens) / self._refill_rate
+
+    async def _try_take_remote(self, priority: int) -> float | None:
+        """Одна попытка взять токен из общего bucket'а.
+
+        0.0 — токен получен; >0 — сколько подождать до следующего токена;
+        <0 — уступаем более приоритетному процессу; None — Redis недоступен.
+        """
+        result = await cache.run_script(
+            _TAKE_SCRIPT,
+            "ratelimit",
+            [f"{self._name}:bucket", f"{self._name}:demand"],
+            [
+                self._capacity, self._refill_rate, priority, self._proc_id,
+                self._DEMAND_TTL, _PRIORITY_RESERVE.get(priority, 0),
+            ],
+        )
+        if result is None:
+            return None
+        granted, wait, tokens = result
+        self._tokens = float(tokens)
+        if int(granted):
+            return 0.0
+        return float(wait)
+
     async def _process_queue(self) -> None:
         """Фоновый цикл: выдаёт токены из bucket по приоритету."""
         try:
             while True:
                 priority, enqueue_time, event = await self._queue.get()
 
-                async with self._lock:
-                    self._refill()
-                    while self._tokens < 1.0:
-                        wait_time = (1.0 - self._tokens) / self._refill_rate
-                        await asyncio.sleep(wait_time)
-                        self._refill()
-                    self._tokens -= 1.0
+                wait = await self._try_take_remote(priority) if self._distributed else None
+                if wait is None:
+                    if self._distributed and self._mode != "local":
+                        logger.warning("Rate limiter %s: Redis unavailable — local bucket", self._name)
+                    self._mode = "local"
+                    wait = self._try_take_local(priority)
+                elif self._mode != "redis":
+                    logger.info("Rate limiter %s: shared Redis bucket", self._name)
+                    self._mode = "redis"
+
+                if wait != 0.0:
+                    if wait > 0 and self._tokens >= 1.0 and event not in self._deferred_events:
+                        # Токены есть, но это резерв более важных приоритетов
+                        self._deferred[priority] += 1
+                        self._deferred_events.add(event)
+                    # Возвращаем запрос в очередь: пока спим, могли прийти
+                    # более приоритетные запросы.
+                    self._queue.task_done()
+                    await self._queue.put((priority, enqueue_time, event))
+                    await asyncio.sleep(self._YIELD_SLEEP if wait < 0 else min(wait, self._MAX_SLEEP))
+                    continue
 
                 wait_duration = time.monotonic() - enqueue_time
                 self._total_requests += 1
                 self._total_wait_time += wait_duration
+                self._queued[priority] -= 1
+                self._waits.setdefault(
+                    priority, deque(maxlen=self._WAIT_SAMPLES),
+                ).append(wait_duration)
 
                 event.set()
                 self._queue.task_done()
         except asyncio.CancelledError:
             pass
 
+    async def sync_from_headers(self, headers) -> None:
+        """Подрезать bucket по X-Discogs-Ratelimit-* из ответа Discogs.
+
+        Только вниз: если Discogs видит меньше остатка, чем мы (другие
+        клиенты того же токена, сдвиг окна), — догоняем его. Вверх не
+        поднимаем, наш capacity специально ниже лимита Discogs.
+        """
+        try:
+            remaining = int(headers["X-Discogs-Ratelimit-Remaining"])
+        except (KeyError, TypeError, ValueError):
+            return
+        for header, field in (
+            ("X-Discogs-Ratelimit", "limit"),
+            ("X-Discogs-Ratelimit-Used", "used"),
+        ):
+            try:
+                self._upstream[field] = int(headers[header])
+            except (KeyError, TypeError, ValueError):
+                pass
+        self._upstream["remaining"] = remaining
+
+        if self._mode == "redis":
+            tokens = await cache.run_script(
+                _SYNC_SCRIPT,
+                "ratelimit",
+                [f"{self._name}:bucket"],
+                [self._capacity, self._refill_rate, remaining],
+            )
+            if tokens is not None:
+                self._tokens = float(tokens)
+                return
+        self._refill()
+        self._tokens = min(self._tokens, float(remaining))
+
+    async def on_rate_limited(self, priority: int) -> None:
+        """Discogs ответил 429 — bucket пуст, что бы мы ни думали."""
+        self._rate_limited[priority] += 1
+        await self.sync_from_headers({"X-Discogs-Ratelimit-Remaining": 0})
+
+    @staticmethod
+    def _percentile(ordered: list[float], q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
     def stats(self) -> dict:
         """Метрики для мониторинга."""
         avg_wait = (self._total_wait_time / self._total_requests) if self._total_requests else 0
+        per_priority = {}
+        for priority, name in _PRIORITY_NAMES.items():
+            samples = sorted(self._waits.get(priority, ()))
+            entry = {
+                "queued": max(0, self._queued.get(priority, 0)),
+                "reserve": _PRIORITY_RESERVE.get(priority, 0),
+                "reserve_deferrals": self._deferred.get(priority, 0),
+                "rate_limited_429": self._rate_limited.get(priority, 0),
+            }
+            if samples:
+                entry.update({
+                    "wait_p50": round(self._percentile(samples, 0.50), 3),
+                    "wait_p95": round(self._percentile(samples, 0.95), 3),
+                    "wait_p99": round(self._percentile(samples, 0.99), 3),
+                })
+            per_priority[name] = entry
         return {
+            "mode": self._mode,
             "queue_size": self._queue.qsize(),
             "tokens_available": round(self._tokens, 1),
             "total_requests": self._total_requests,
             "avg_wait_seconds": round(avg_wait, 3),
+            "priorities": per_priority,
+            "discogs_headers": dict(self._upstream),
         }
 
 
 # Singleton — один лимитер на приложение
-discogs_limiter = TokenBucketRateLimiter()
+discogs_limiter = TokenBucketRateLimiter(distributed=get_settings().discogs_limiter_distributed)
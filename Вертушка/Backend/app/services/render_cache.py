@@ -0,0 +1,146 @@
+"""
+Дисковый кэш отрендеренных PNG (OG-картинки профиля, share-card ачивок).
+
+Content-addressed: имя файла — sha256 от входов рендера (обложки, счётчики,
+стоимость, тир, дата, версия раскладки), так что инвалидировать нечего —
+поменялись входы, поменялся ключ. Он же — сильный ETag: повторный запрос
+краулера/клиента отдаётся файлом с диска или 304.
+
+Лежит рядом с covers_dir (uploads/renders/<kind>/<key>.png). Рендер
+вызывающий делает в потоке (asyncio.to_thread — PIL не держит event loop),
+одинаковые ключи в одном воркере рендерятся один раз. Рендер, который
+вызывающий пометил как несохраняемый (обложка впервые не скачалась — ключ
+посчитан без этого), на диск не кладётся; повторный запрос придёт уже с
+ключом, где обложка помечена «missing», и сохранит рендер. LRU по mtime
+(попадание его обновляет), предел — RENDER_CACHE_MAX_MB, чистка —
+cleanup_render_cache по расписанию.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse
+
+from app.config import get_settings
+from app.services.public_profile_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+# key → рендер в процессе (single-flight внутри воркера)
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def render_cache_dir() -> Path:
+    return Path(get_settings().covers_dir).parent / "renders"
+
+
+def render_key(kind: str, inputs: dict[str, Any]) -> str:
+    """sha256 от входов рендера (ключи сортируются — порядок не важен)."""
+    raw = orjson.dumps({"kind": kind, **inputs}, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / f".tmp_{path.stem}_{uuid.uuid4().hex}"
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _touch(path: Path) -> bool:
+    """Обновить mtime (LRU). False — файла нет (вычищен)."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+async def get_or_render(
+    kind: str, key: str, render: Callable[[], Awaitable[tuple[bytes, bool]]]
+) -> Path | bytes:
+    """PNG по ключу. render() → (png, можно_сохранить). Возвращает путь к
+    файлу кэша или, если рендер сохранять нельзя, сами байты."""
+    path = render_cache_dir() / kind / f"{key}.png"
+    if await asyncio.to_thread(_touch, path):
+        return path
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        data, persist = await render()
+        result: Path | bytes = data
+        if persist:
+            await asyncio.to_thread(_write_atomic, path, data)
+            result = path
+        future.set_result(result)
+        return result
+    except BaseException as exc:
+        future.set_exception(exc)
+        future.exception()  # ждущих может не быть — не логировать «never retrieved»
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+def png_response(request: Request, rendered: Path | bytes, key: str, cache_control: str) -> Response:
+    """FileResponse с сильным ETag = ключом рендера; If-None-Match → 304.
+    Несохранённый рендер — без ETag и без кэширования."""
+    if isinstance(rendered, bytes):
+        return Response(content=rendered, media_type="image/png", headers={"Cache-Control": "no-store"})
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(rendered, media_type="image/png", headers=headers)
+
+
+def cleanup_render_cache(max_mb: int) -> int:
+    """Удалить самые давно не читанные рендеры, пока кэш больше max_mb.
+    Синхронная (обход диска) — звать через asyncio.to_thread."""
+    root = render_cache_dir()
+    if not root.exists():
+        return 0
+    files = []
+    for f in root.rglob("*.png"):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, f))
+    total = sum(size for _, size, _ in files)
+    limit = max_mb * 1024 * 1024
+    if total <= limit:
+        return 0
+
+    deleted = 0
+    for _, size, f in sorted(files):
+        if total <= limit:
+            break
+        try:
+            f.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("render_cache: failed to delete %s: %s", f, e)
+            continue
+        total -= size
+        deleted += 1
+    logger.info("render_cache: LRU cleanup deleted %d renders", deleted)
+    return deleted
@@ -7,14 +7,17 @@ from __future__ import annotations
 
 import asyncio
 import logging
-import random
+import re
+from contextlib import aclosing
 from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
 from typing import AsyncIterator
 
-from app.services.scrapers.http_client import ScraperHttpClient
+from app.services.exchange import get_usd_rub_rate
+from app.services.scrapers.http_client import ParserError_404, ScraperHttpClient
 from app.services.scrapers.browser import BrowserPool
+from app.services.scrapers.validators import PageValidators, current_page
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +46,20 @@ class ListingDTO:
     variants: list["ListingDTO"] = field(default_factory=list)
 
 
+@dataclass
+class StockDTO:
+    """Цена и наличие листинга — всё, что нужно stock-refresh'у."""
+    price_rub: Decimal | None
+    status: str
+
+
+@dataclass
+class UnchangedListing:
+    """Страница листинга не изменилась (304 / тот же хэш тела) — не парсили."""
+    url: str
+    external_id: str
+
+
 # ---- Исключения --------------------------------------------------------- #
 
 class ParserError(Exception):
@@ -61,6 +78,10 @@ class TransientParserError(ParserError):
     """5xx/network/таймаут — стоит ретраить, и инкрементить circuit-breaker."""
 
 
+class ParserNotModified(ParserError):
+    """Страница листинга не изменилась с прошлого обхода (см. scrapers.validators)."""
+
+
 # ---- Базовый класс парсера ---------------------------------------------- #
 
 class BaseStoreParser:
@@ -73,6 +94,9 @@ class BaseStoreParser:
          (`sitemap.xml` + `yml.xml` + `feed.xml`).
       4. Опционально переопределить `crawl_incremental(since)` — например, для
          YML-фидов с lastmod.
+      5. Если YML-фид полный (цена, наличие, id) — выставить `yml_feed_path`:
+         crawl_full соберёт листинги прямо из `<offer>` без захода на страницы
+         (маппинг — `listing_from_offer`).
     """
 
     # Должны быть переопределены в подклассе:
@@ -82,9 +106,11 @@ class BaseStoreParser:
     # Параметры с дефолтами:
     rate_limit_per_sec: float = 0.5         # 1 req per 2s
     rate_burst: int = 2                      # token bucket capacity
+    crawl_concurrency: int = 4               # воркеров parse_listing в crawl_full
     requires_js: bool = False                # принудительно через Playwright
     sitemap_paths: list[str] = ["/sitemap.xml", "/yml.xml", "/feed.xml", "/sitemap_index.xml"]
     listing_url_pattern: str | None = None   # regex для фильтра sitemap-URL
+    yml_feed_path: str | None = None         # YML fast path, напр. "/yml.xml"
     respect_robots: bool = True
 
     def __init__(self, http: ScraperHttpClient, browser: BrowserPool | None = None) -> None:
@@ -92,6 +118,11 @@ class BaseStoreParser:
             raise RuntimeError(f"{type(self).__name__}: slug/base_url must be set")
         self.http = http
         self.browser = browser
+        # Глобальный лимит одновременных parse_listing на процесс — общий для
+        # всех магазинов ночного обхода, выставляет scrapers.scheduler.
+        self.fetch_slots: asyncio.Semaphore | None = None
+        # ETag/Last-Modified/хэш страниц магазина на время обхода (runner)
+        self.validators: PageValidators | None = None
 
     # ---- Discovery ------------------------------------------------------ #
 
@@ -103,9 +134,10 @@ class BaseStoreParser:
             url = self.base_url.rstrip("/") + path
             try:
                 count = 0
-                async for u in iter_sitemap_urls(self.http, url, self.listing_url_pattern):
-                    count += 1
-                    yield u
+                async with aclosing(iter_sitemap_urls(self.http, url, self.listing_url_pattern)) as found:
+                    async for u in found:
+                        count += 1
+                        yield u
                 if count:
                     logger.info("[%s] discover via %s: %d urls", self.slug, path, count)
                     return
@@ -121,28 +153,157 @@ class BaseStoreParser:
         """Загрузить страницу товара и извлечь поля. Подкласс ОБЯЗАН реализовать."""
         raise NotImplementedError
 
+    async def parse_stock(self, url: str) -> StockDTO:
+        """Только цена и наличие (scrapers.stock_refresh). Дефолт — полный
+        parse_listing; подкласс может переопределить облегчённым экстрактором.
+        """
+        dto = await self.parse_listing(url)
+        return StockDTO(price_rub=dto.price_rub, status=dto.status)
+
+    def listing_from_offer(self, offer) -> ListingDTO | None:
+        """`<offer>` YML-фида → ListingDTO. None — пропустить оффер."""
+        from app.services.scrapers.sitemap import offer_to_listing
+
+        return offer_to_listing(offer)
+
     # ---- Оркестрация ---------------------------------------------------- #
 
-    async def crawl_full(self, limit: int | None = None) -> AsyncIterator[ListingDTO]:
+    async def crawl_full(self, limit: int | None = None) -> AsyncIterator[ListingDTO | UnchangedListing]:
         """Полный обход: все URL из discover_urls() → parse_listing().
 
-        Между запросами — sleep(1/rate) ± jitter. ParserError-подклассы пропускаем.
+        parse_listing гоняет пул из crawl_concurrency воркеров. Темп задаёт
+        per-domain bucket + circuit breaker в ScraperHttpClient (configure_domain
+        в runner'е), а не sleep между запросами — воркеры лишь прячут латентность
+        страницы. ParserError-подклассы пропускаем, ParserBlocked останавливает
+        обход. Порядок листингов — по готовности, не по порядку discover.
+
+        С validators неизменившиеся страницы приходят как UnchangedListing.
+        С yml_feed_path листинги берутся прямо из фида (crawl_yml).
         """
-        delay = 1.0 / max(self.rate_limit_per_sec, 0.01)
-        seen = 0
-        async for url in self.discover_urls():
-            if limit is not None and seen >= limit:
-                return
+        if self.yml_feed_path:
+            async with aclosing(self.crawl_yml(limit)) as listings:
+                async for dto in listings:
+                    yield dto
+            return
+
+        workers = max(1, self.crawl_concurrency)
+        urls: asyncio.Queue[str | None] = asyncio.Queue(maxsize=workers * 4)
+        results: asyncio.Queue = asyncio.Queue()
+        stop = asyncio.Event()
+        failures: list[BaseException] = []
+        done = object()
+
+        async def produce() -> None:
+            try:
+                async with aclosing(self.discover_urls()) as discovered:
+                    async for url in discovered:
+                        if stop.is_set():
+                            break
+                        await urls.put(url)
+            except Exception as e:
+                failures.append(e)
+                stop.set()
+            # Сентинелы — только при обычном завершении: после cancel() воркеры
+            # уже не читают очередь, и put на полную очередь повис бы навсегда
+            for _ in range(workers):
+                await urls.put(None)
+
+        async def fetch(url: str) -> ListingDTO:
+            token = current_page.set((self.validators, url)) if self.validators else None
+            try:
+                if self.fetch_slots is None:
+                    dto = await self.parse_listing(url)
+                else:
+                    async with self.fetch_slots:
+                        dto = await self.parse_listing(url)
+            finally:
+                if token is not None:
+                    current_page.reset(token)
+            if self.validators:
+                self.validators.bind(url, dto.external_id)
+            return dto
+
+        async def work() -> None:
             try:
-                yield await self.parse_listing(url)
+                while True:
+                    url = await urls.get()
+                    if url is None:
+                        return
+                    if stop.is_set():
+                        continue  # дочитываем очередь, чтобы producer не повис на put
+                    try:
+                        await results.put(await fetch(url))
+                    except ParserNotModified:
+                        await results.put(UnchangedListing(url, self.validators.external_id(url)))
+                    except ParserError_404:
+                        continue  # товар удалён — weekly_cleanup_stale пометит removed
+                    except ParserBlocked:
+                        # http_client уже выставил Store.requires_browser=True если нужно
+                        logger.warning("[%s] blocked at %s — stopping crawl", self.slug, url)
+                        stop.set()
+                    except (TransientParserError, ParserError):
+                        continue
+                    except Exception as e:
+                        failures.append(e)
+                        stop.set()
+            finally:
+                await results.put(done)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(work()) for _ in range(workers)]
+        seen = 0
+        finished = 0
+        try:
+            while finished < workers:
+                item = await results.get()
+                if item is done:
+                    finished += 1
+                    continue
+                if limit is not None and seen >= limit:
+                    continue
                 seen += 1
-            except ParserBlocked:
-                # http_client уже выставил Store.requires_browser=True если нужно
-                logger.warning("[%s] blocked at %s — stopping crawl", self.slug, url)
-                return
-            except (TransientParserError, ParserError):
-                continue
-            await asyncio.sleep(delay + random.uniform(0.0, delay * 0.5))
+                yield item
+                if limit is not None and seen >= limit:
+                    stop.set()
+        finally:
+            stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if failures:
+            raise failures[0]
+
+    async def crawl_yml(self, limit: int | None = None) -> AsyncIterator[ListingDTO]:
+        """YML fast path: стримим `<offer>` из фида → ListingDTO, без parse_listing."""
+        from app.services.scrapers.sitemap import iter_yml_offers
+
+        pattern = re.compile(self.listing_url_pattern) if self.listing_url_pattern else None
+        url = self.base_url.rstrip("/") + self.yml_feed_path
+        count = 0
+        foreign = 0
+        usd_rub: float | None = None
+        async with aclosing(iter_yml_offers(self.http, url)) as offers:
+            async for offer in offers:
+                dto = self.listing_from_offer(offer)
+                if dto is None or (pattern and not pattern.search(dto.url)):
+                    continue
+                # price_rub — только рубли: USD пересчитываем по курсу ЦБ,
+                # прочие валюты пропускаем (курса для них нет)
+                if dto.price_currency != "RUB" and dto.price_rub is not None:
+                    if dto.price_currency != "USD":
+                        foreign += 1
+                        continue
+                    if usd_rub is None:
+                        usd_rub = await get_usd_rub_rate()
+                    dto.price_rub = (dto.price_rub * Decimal(str(usd_rub))).quantize(Decimal("0.01"))
+                    dto.price_currency = "RUB"
+                yield dto
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+        if foreign:
+            logger.warning("[%s] yml feed %s: skipped %d offers in non-RUB currency", self.slug, self.yml_feed_path, foreign)
+        logger.info("[%s] yml feed %s: %d listings", self.slug, self.yml_feed_path, count)
 
     async def crawl_incremental(self, since: datetime, limit: int | None = None) -> AsyncIterator[ListingDTO]:
         """Только новинки/изменённые с `since`. Дефолт — то же что full.
@@ -11,12 +11,14 @@ import logging
 import os
 import random
 import time
+from typing import AsyncIterator
 from urllib.parse import urlparse
 
 import httpx
 
 from app.services.scrapers.robots import is_allowed
 from app.services.scrapers.ua_pool import random_headers
+from app.services.scrapers.validators import current_page
 
 logger = logging.getLogger(__name__)
 
@@ -199,11 +201,16 @@ class ScraperHttpClient:
         respect_robots: bool = True,
         retries: int = 2,
     ) -> str:
-        """GET → текст. Бросает ParserBlocked / ParserNeedsBrowser / TransientParserError."""
+        """GET → текст. Бросает ParserBlocked / ParserNeedsBrowser / TransientParserError.
+
+        Для страницы листинга (current_page) шлёт условный запрос и бросает
+        ParserNotModified, если страница не изменилась (304 или тот же хэш тела).
+        """
         # Импорт внутри: избегаем циклической зависимости с base.py
         from app.services.scrapers.base import (
             ParserBlocked,
             ParserNeedsBrowser,
+            ParserNotModified,
             TransientParserError,
         )
 
@@ -217,6 +224,10 @@ class ScraperHttpClient:
         proxy = random.choice(self._proxies) if self._proxies else None
         client = self._get_client(proxy)
         headers = random_headers()
+        page = current_page.get()
+        validators = page[0] if page and page[1] == url else None
+        if validators is not None:
+            headers.update(validators.conditional_headers(url))
 
         if respect_robots and not await is_allowed(client, url, headers["User-Agent"]):
             logger.info("robots.txt disallow %s", url)
@@ -244,8 +255,19 @@ class ScraperHttpClient:
                 if _is_cf_challenge(resp):
                     raise ParserNeedsBrowser(f"Cloudflare/DDoS-Guard challenge at {url}")
                 await breaker.record_success(domain)
+                if validators is not None and validators.observe(
+                    url,
+                    etag=resp.headers.get("ETag"),
+                    last_modified=resp.headers.get("Last-Modified"),
+                    body=resp.text,
+                ):
+                    raise ParserNotModified(url)
                 return resp.text
 
+            if resp.status_code == 304 and validators is not None:
+                await breaker.record_success(domain)
+                raise ParserNotModified(url)
+
             if resp.status_code in (429, 503):
                 retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
                 wait = max(retry_after, 30 * (2 ** attempt))
@@ -296,6 +318,75 @@ class ScraperHttpClient:
             raise TransientParserError(f"HTTP {resp.status_code} at {url}")
         return resp.content
 
+    async def stream_bytes(
+        self,
+        url: str,
+        *,
+        respect_robots: bool = False,
+        chunk_size: int = 64 * 1024,
+        retries: int = 2,
+    ) -> AsyncIterator[bytes]:
+        """GET → поток чанков тела (Content-Encoding раскодирован httpx).
+
+        Для многосотмегабайтных sitemap/YML: тело не собирается в памяти.
+        Запрос проходит через per-domain bucket и circuit-breaker, как get_text.
+        429/503 (с учётом Retry-After), 5xx и сетевые ошибки ретраятся так же,
+        как в get_text, — но только до первого отданного чанка: после него
+        вызывающий уже разбирает тело, и повтор отдал бы начало фида дважды.
+        """
+        from app.services.scrapers.base import (
+            ParserBlocked,
+            TransientParserError,
+        )
+
+        domain = urlparse(url).netloc
+        bucket = self._buckets.setdefault(domain, _DomainBucket())
+        breaker = self._breakers.setdefault(domain, _CircuitBreaker())
+
+        proxy = random.choice(self._proxies) if self._proxies else None
+        client = self._get_client(proxy)
+        headers = random_headers()
+        if respect_robots and not await is_allowed(client, url, headers["User-Agent"]):
+            raise ParserBlocked(f"robots.txt disallow: {url}")
+        try:
+            await breaker.before_request(domain)
+        except CircuitOpenError as e:
+            raise TransientParserError(str(e))
+
+        for attempt in range(retries + 1):
+            started = False
+            wait = 0.0
+            await bucket.acquire()
+            try:
+                async with client.stream("GET", url, headers=headers) as resp:
+                    if resp.status_code in (429, 503):
+                        if attempt >= retries:
+                            await breaker.record_failure(domain)
+                            raise TransientParserError(f"rate-limited {resp.status_code} at {url}")
+                        retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+                        wait = min(max(retry_after, 30 * (2 ** attempt)), 300)
+                    elif 500 <= resp.status_code < 600:
+                        await breaker.record_failure(domain)
+                        if attempt >= retries:
+                            raise TransientParserError(f"HTTP {resp.status_code} at {url}")
+                        wait = 2 ** attempt
+                    elif resp.status_code != 200:
+                        raise TransientParserError(f"HTTP {resp.status_code} at {url}")
+                    else:
+                        await breaker.record_success(domain)
+                        started = True
+                        async for chunk in resp.aiter_bytes(chunk_size):
+                            yield chunk
+                        return
+            except (httpx.HTTPError, asyncio.TimeoutError) as e:
+                await breaker.record_failure(domain)
+                if started or attempt >= retries:
+                    raise TransientParserError(f"network error: {e}") from e
+                wait = 2 ** attempt
+            await asyncio.sleep(wait)
+
+        raise TransientParserError("unexpected loop exit")
+
 
 def _parse_retry_after(value: str | None) -> float:
     if not value:
@@ -1,13 +1,26 @@
 """
-robots.txt-чекер с Redis-кэшем (TTL 24ч).
+robots.txt-чекер: per-process кэш скомпилированных правил + Redis (TTL 24ч).
+
+is_allowed зовётся на каждый URL товара, поэтому горячий путь — без Redis
+и без разбора robots: правила домена компилируются один раз в RobotRules
+и живут в памяти процесса _ROBOTS_TTL (пустой/недоступный robots —
+«разрешено всё», с коротким TTL). Redis — общий backing store между
+процессами, в него ходим только на промах локального кэша. Одновременные
+первые запросы одного домена ждут одну загрузку.
+
+Сопоставление — по RFC 9309: группа по токену User-Agent (иначе `*`),
+побеждает самое длинное совпавшее правило, при равенстве — Allow;
+поддерживаются `*` и `$`.
 
 Использование:
     if not await is_allowed(http, "https://shop.ru/product/123", ua):
         skip
 """
+import asyncio
 import logging
-import urllib.robotparser
-from urllib.parse import urlparse
+import re
+import time
+from urllib.parse import quote, unquote, urlparse
 
 import httpx
 
@@ -17,9 +30,87 @@ logger = logging.getLogger(__name__)
 
 
 _ROBOTS_TTL = 24 * 3600
+_RETRY_TTL = 300  # robots.txt не скачался — повторим через 5 минут
 _CACHE_NS = "scraper:robots"
 
 
+def _norm_path(path: str) -> str:
+    return quote(unquote(path), safe="/?=&;:@+,$*%!~'()")
+
+
+class RobotRules:
+    """Скомпилированный robots.txt одного домена."""
+
+    def __init__(self, body: str) -> None:
+        # [(agents, [(длина, allow, prefix | regex)])] в порядке файла
+        self._groups: list[tuple[list[str], list[tuple[int, bool, object]]]] = []
+        self._by_ua: dict[str, list[tuple[int, bool, object]]] = {}
+        self._parse(body)
+
+    def _parse(self, body: str) -> None:
+        agents: list[str] = []
+        rules: list[tuple[int, bool, object]] = []
+        in_rules = False
+        for raw in body.splitlines():
+            line = raw.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            key, value = (part.strip() for part in line.split(":", 1))
+            key = key.lower()
+            if key == "user-agent":
+                if in_rules:
+                    self._groups.append((agents, rules))
+                    agents, rules, in_rules = [], [], False
+                agents.append(value.lower())
+            elif key in ("allow", "disallow") and agents:
+                in_rules = True
+                if not value:
+                    continue  # пустой Disallow — «разрешено всё», правила нет
+                path = _norm_path(value)
+                if "*" in path or path.endswith("$"):
+                    anchored = path.endswith("$")
+                    pattern = re.escape(path.rstrip("$")).replace(r"\*", ".*")
+                    matcher: object = re.compile(pattern + ("$" if anchored else ""))
+                else:
+                    matcher = path
+                rules.append((len(path), key == "allow", matcher))
+        if agents:
+            self._groups.append((agents, rules))
+
+    def _rules_for(self, user_agent: str) -> list[tuple[int, bool, object]]:
+        rules = self._by_ua.get(user_agent)
+        if rules is None:
+            token = user_agent.split("/", 1)[0].lower()
+            default: list | None = None
+            for agents, group in self._groups:
+                if "*" in agents:
+                    default = group if default is None else default
+                elif any(agent in token for agent in agents):
+                    rules = group
+                    break
+            if rules is None:
+                rules = default or []
+            self._by_ua[user_agent] = rules
+        return rules
+
+    def can_fetch(self, user_agent: str, url: str) -> bool:
+        parsed = urlparse(url)
+        path = _norm_path(parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        best_len, allowed = -1, True
+        for length, allow, matcher in self._rules_for(user_agent):
+            if length < best_len or (length == best_len and not allow):
+                continue
+            hit = path.startswith(matcher) if isinstance(matcher, str) else matcher.match(path)
+            if hit:
+                best_len, allowed = length, allow
+        return allowed
+
+
+# netloc → (monotonic-дедлайн, правила | None = разрешено всё)
+_local: dict[str, tuple[float, RobotRules | None]] = {}
+_inflight: dict[str, asyncio.Future] = {}
+
+
 async def _fetch_robots_txt(client: httpx.AsyncClient, domain_url: str) -> str | None:
     """Скачать /robots.txt. None если 404/network — трактуем как «всё разрешено»."""
     robots_url = f"{domain_url.rstrip('/')}/robots.txt"
@@ -33,25 +124,60 @@ async def _fetch_robots_txt(client: httpx.AsyncClient, domain_url: str) -> str |
         return None
 
 
-async def is_allowed(client: httpx.AsyncClient, url: str, user_agent: str) -> bool:
-    """True если URL разрешён robots.txt (или robots.txt недоступен)."""
-    parsed = urlparse(url)
-    if not parsed.netloc:
-        return True
-    domain_root = f"{parsed.scheme}://{parsed.netloc}"
-
-    cached = await cache.get(_CACHE_NS, parsed.netloc)
+async def _load_rules(client: httpx.AsyncClient, netloc: str, domain_root: str) -> tuple[float, RobotRules | None]:
+    cached = await cache.get(_CACHE_NS, netloc)
     if cached is None:
         body = await _fetch_robots_txt(client, domain_root)
         if body is None:
-            await cache.set(_CACHE_NS, parsed.netloc, "", ttl=300)  # короткий retry
-            return True
-        await cache.set(_CACHE_NS, parsed.netloc, body, ttl=_ROBOTS_TTL)
+            await cache.set(_CACHE_NS, netloc, "", ttl=_RETRY_TTL)  # короткий retry
+            return time.monotonic() + _RETRY_TTL, None
+        await cache.set(_CACHE_NS, netloc, body, ttl=_ROBOTS_TTL)
         cached = body
-
     if not cached:
-        return True
+        # Пустое значение в Redis — либо robots пуст, либо короткий retry:
+        # не знаем какой, поэтому локально держим недолго
+        return time.monotonic() + _RETRY_TTL, None
+    return time.monotonic() + _ROBOTS_TTL, RobotRules(cached)
 
-    rp = urllib.robotparser.RobotFileParser()
-    rp.parse(cached.splitlines())
-    return rp.can_fetch(user_agent, url)
+
+async def _get_rules(client: httpx.AsyncClient, netloc: str, domain_root: str) -> RobotRules | None:
+    entry = _local.get(netloc)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+
+    while (inflight := _inflight.get(netloc)) is not None:
+        try:
+            return await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            # Лидера отменили (crawl_full гасит воркеров) — сами не
+            # отменены, значит пробуем стать лидером.
+            if not inflight.cancelled():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[netloc] = future
+    try:
+        entry = await _load_rules(client, netloc, domain_root)
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            # Исключение уже отдаём сами — ждущих может не быть
+            future.exception()
+        raise
+    else:
+        _local[netloc] = entry
+        future.set_result(entry[1])
+        return entry[1]
+    finally:
+        _inflight.pop(netloc, None)
+
+
+async def is_allowed(client: httpx.AsyncClient, url: str, user_agent: str) -> bool:
+    """True если URL разрешён robots.txt (или robots.txt недоступен)."""
+    parsed = urlparse(url)
+    if not parsed.netloc:
+        return True
+    rules = await _get_rules(client, parsed.netloc, f"{parsed.scheme}://{parsed.netloc}")
+    return True if rules is None else rules.can_fetch(user_agent, url)
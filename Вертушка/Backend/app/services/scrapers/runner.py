@@ -2,44 +2,75 @@
 Оркестрация одного прохода парсера для одного магазина:
 discover_urls → parse_listing → upsert StoreListing.
 
+Запись — через ListingWriter: листинги копятся в буфер и уходят пачкой
+одним multi-row INSERT ... ON CONFLICT, с commit после каждой пачки. Падение
+обхода теряет не больше одной пачки, ошибка БД — изолируется до строки.
+
 Не запускает матчинг — это делает отдельная задача (listing_matcher.match_unmatched_batch).
 """
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import os
+from contextlib import aclosing
 from datetime import datetime
 from decimal import Decimal
 from typing import Literal
 
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.database import async_session_maker
 from app.models.store import Store
 from app.models.store_listing import StoreListing, ListingStatus
+from app.services.market_index import refresh_offer_index
+from app.services.market_stats import refresh_store_stats
+from app.services.offer_summary import refresh_offer_summary
 from app.services.scrapers.base import (
     BaseStoreParser,
     ListingDTO,
     ParserBlocked,
     ParserNeedsBrowser,
+    UnchangedListing,
 )
 from app.services.scrapers.browser import browser_pool
 from app.services.scrapers.http_client import http_client
 from app.services.scrapers.registry import get_parser
+from app.services.scrapers.validators import PageValidators, body_hash
 
 logger = logging.getLogger(__name__)
 
 
 CrawlMode = Literal["full", "incremental", "stock"]
 
+# Размер пачки ListingWriter. Потолок — лимит asyncpg в 32767 bind-параметров
+# на запрос (≈19 колонок на строку).
+UPSERT_BATCH = min(int(os.environ.get("SCRAPER_UPSERT_BATCH", "500")), 1500)
+
 
-async def crawl_store(slug: str, *, mode: CrawlMode = "full", limit: int | None = None) -> dict:
+async def crawl_store(
+    slug: str,
+    *,
+    mode: CrawlMode = "full",
+    limit: int | None = None,
+    fetch_slots: asyncio.Semaphore | None = None,
+    progress: dict | None = None,
+) -> dict:
     """Прогнать парсер для магазина в указанном режиме.
 
-    Возвращает счётчики: discovered/upserted/errors/skipped.
+    Возвращает счётчики: discovered/upserted/unchanged/errors/skipped.
+    unchanged — листинг не поменялся (304 / тот же хэш страницы / тот же
+    content_hash): только бамп last_seen_at.
+    fetch_slots — общий на процесс лимит одновременных запросов страниц
+    (см. scrapers.scheduler). progress — dict, куда счётчики пишутся по ходу
+    обхода (живые метрики для планировщика); он же и возвращается.
     """
-    counters = {"discovered": 0, "upserted": 0, "errors": 0, "skipped": 0}
+    counters = progress if progress is not None else {}
+    started_at = datetime.utcnow()
+    counters.update({"discovered": 0, "upserted": 0, "unchanged": 0, "errors": 0, "skipped": 0})
 
     async with async_session_maker() as db:
         store = await _get_active_store(db, slug)
@@ -48,6 +79,10 @@ async def crawl_store(slug: str, *, mode: CrawlMode = "full", limit: int | None
             return counters
 
         parser = _make_parser(store)
+        parser.fetch_slots = fetch_slots
+        parser.validators = PageValidators(store.id)
+        await parser.validators.load(db)
+        writer = ListingWriter(db, store.id, counters, validators=parser.validators)
         http_client.configure_domain(
             store.domain,
             rate_per_sec=parser.rate_limit_per_sec,
@@ -55,24 +90,23 @@ async def crawl_store(slug: str, *, mode: CrawlMode = "full", limit: int | None
         )
 
         try:
-            iterator = _select_iterator(parser, mode, store)
-            async for dto in iterator:
-                counters["discovered"] += 1
-                try:
-                    upserted = await _upsert_listing(db, store.id, dto)
-                    if upserted:
-                        counters["upserted"] += 1
+            # aclosing: break по limit должен сразу остановить пул воркеров
+            # crawl_full, а не оставлять его качать магазин до сборки мусора
+            async with aclosing(_select_iterator(parser, mode, store)) as iterator:
+                async for dto in iterator:
+                    counters["discovered"] += 1
+                    if isinstance(dto, UnchangedListing):
+                        await writer.seen(dto.external_id)
                     else:
-                        counters["skipped"] += 1
-                except SQLAlchemyError:
-                    counters["errors"] += 1
-                    logger.exception("[%s] upsert failed for %s", slug, dto.url)
-                    await db.rollback()
+                        await writer.add(dto)
 
-                if limit and counters["upserted"] >= limit:
-                    break
+                    if limit and writer.accepted >= limit:
+                        break
 
-            await db.commit()
+            await writer.flush()
+            await refresh_store_stats(db, [store.id])
+            await refresh_offer_index(db, store_ids=[store.id], since=started_at)
+            await refresh_offer_summary(db, store_ids=[store.id], since=started_at)
             await _mark_success(db, store)
         except ParserNeedsBrowser as e:
             await _mark_needs_browser(db, store, str(e))
@@ -85,6 +119,8 @@ async def crawl_store(slug: str, *, mode: CrawlMode = "full", limit: int | None
             counters["errors"] += 1
             logger.exception("[%s] crawl failed", slug)
         finally:
+            # Уже распарсенное не теряем и при падении обхода
+            await writer.flush()
             await db.commit()
 
     logger.info("[%s] crawl(%s) done: %s", slug, mode, counters)
@@ -113,12 +149,118 @@ def _select_iterator(parser: BaseStoreParser, mode: CrawlMode, store: Store):
     return parser.crawl_full()
 
 
-async def _upsert_listing(db, store_id, dto: ListingDTO) -> bool:
-    """INSERT ... ON CONFLICT(store_id, external_id) DO UPDATE SET ...
+class ListingWriter:
+    """Буферизованный upsert листингов одного магазина.
 
-    Возвращает True если запись была вставлена/обновлена.
+    add() / seen() копят строки; на UPSERT_BATCH (или явный flush()) пачка
+    уходит одним INSERT ... ON CONFLICT на все строки + одним UPDATE
+    last_seen_at для неизменившихся, затем commit. Если пачка падает —
+    повторяем её построчно в savepoint'ах: битая строка идёт в errors,
+    остальные записываются. Итоги пишутся в counters
+    (upserted/unchanged/errors).
     """
-    now = datetime.utcnow()
+
+    def __init__(
+        self,
+        db,
+        store_id,
+        counters: dict,
+        *,
+        validators: PageValidators | None = None,
+        batch_size: int = UPSERT_BATCH,
+    ) -> None:
+        self.db = db
+        self.store_id = store_id
+        self.counters = counters
+        self.validators = validators
+        self.batch_size = batch_size
+        # external_id → payload: дубль в пачке ломает ON CONFLICT
+        # («cannot affect row a second time»), побеждает последний
+        self._rows: dict[str, dict] = {}
+        self._seen: list[str] = []
+        self.accepted = 0
+
+    async def add(self, dto: ListingDTO) -> None:
+        self._rows[dto.external_id] = _listing_payload(self.store_id, dto)
+        self.accepted += 1
+        if len(self._rows) >= self.batch_size:
+            await self.flush()
+
+    async def seen(self, external_id: str) -> None:
+        """Листинг не изменился — только бамп last_seen_at."""
+        self._seen.append(external_id)
+        self.accepted += 1
+        if len(self._seen) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows, self._rows = list(self._rows.values()), {}
+        seen, self._seen = self._seen, []
+        if not rows and not seen and not (self.validators and self.validators.dirty):
+            return
+
+        now = datetime.utcnow()
+        for row in rows:
+            row.update(first_seen_at=now, last_seen_at=now, updated_at=now)
+
+        try:
+            async with self.db.begin_nested():
+                changed = await self._upsert(rows, now) if rows else 0
+            self.counters["upserted"] += changed
+            self.counters["unchanged"] += len(rows) - changed
+        except SQLAlchemyError:
+            logger.warning(
+                "batch upsert of %d listings failed — retrying row by row", len(rows), exc_info=True,
+            )
+            for row in rows:
+                try:
+                    async with self.db.begin_nested():
+                        changed = await self._upsert([row], now)
+                    self.counters["upserted" if changed else "unchanged"] += 1
+                except SQLAlchemyError:
+                    self.counters["errors"] += 1
+                    logger.exception("upsert failed for %s", row["url"])
+
+        try:
+            async with self.db.begin_nested():
+                if seen:
+                    await _bump_last_seen(self.db, self.store_id, seen, now)
+                if self.validators:
+                    await self.validators.flush(self.db)
+            self.counters["unchanged"] += len(seen)
+        except SQLAlchemyError:
+            self.counters["errors"] += len(seen)
+            logger.exception("last_seen_at bump failed for %d listings", len(seen))
+
+        await self.db.commit()
+
+    async def _upsert(self, rows: list[dict], now: datetime) -> int:
+        """Multi-row upsert. Возвращает сколько строк вставлено/изменено."""
+        res = await self.db.execute(_upsert_stmt(rows))
+        written = set(res.scalars())
+        unchanged = [r["external_id"] for r in rows if r["external_id"] not in written]
+        if unchanged:
+            await _bump_last_seen(self.db, self.store_id, unchanged, now)
+        return len(written)
+
+
+_HASHED_FIELDS = (
+    "url", "title_raw", "artist_raw", "year_raw", "format_raw", "vinyl_color_raw",
+    "condition", "price_rub", "price_currency", "status", "raw_payload",
+)
+
+
+def _content_hash(payload: dict) -> int:
+    """Хэш полей листинга, которые upsert переписывает (кроме служебных дат)."""
+    canonical = json.dumps(
+        {k: payload[k] for k in _HASHED_FIELDS},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return body_hash(canonical)
+
+
+def _listing_payload(store_id, dto: ListingDTO) -> dict:
+    """Строка store_listings из DTO — без служебных дат (их ставит upsert)."""
     payload = {
         "store_id": store_id,
         "external_id": dto.external_id,
@@ -132,32 +274,54 @@ async def _upsert_listing(db, store_id, dto: ListingDTO) -> bool:
         "price_rub": dto.price_rub,
         "price_currency": dto.price_currency,
         "status": dto.status,
-        "first_seen_at": now,
-        "last_seen_at": now,
         "raw_payload": _serialize_raw(dto),
     }
+    payload["content_hash"] = _content_hash(payload)
+    return payload
 
-    stmt = pg_insert(StoreListing).values(**payload)
-    stmt = stmt.on_conflict_do_update(
+
+def _upsert_stmt(rows: list[dict]):
+    """INSERT ... ON CONFLICT(store_id, external_id) DO UPDATE SET ... WHERE
+
+    Конфликтная строка переписывается только если content_hash отличается от
+    сохранённого, поэтому RETURNING external_id отдаёт ровно вставленные и
+    изменённые строки — без сравнения updated_at с now на стороне Python.
+    last_seen_at остальным бампает вызывающий (_bump_last_seen).
+    """
+    stmt = pg_insert(StoreListing).values(rows)
+    table = StoreListing.__table__
+    return stmt.on_conflict_do_update(
         index_elements=["store_id", "external_id"],
         set_={
-            "url": stmt.excluded.url,
-            "title_raw": stmt.excluded.title_raw,
-            "artist_raw": stmt.excluded.artist_raw,
-            "year_raw": stmt.excluded.year_raw,
-            "format_raw": stmt.excluded.format_raw,
-            "vinyl_color_raw": stmt.excluded.vinyl_color_raw,
-            "condition": stmt.excluded.condition,
-            "price_rub": stmt.excluded.price_rub,
-            "price_currency": stmt.excluded.price_currency,
-            "status": stmt.excluded.status,
-            "last_seen_at": stmt.excluded.last_seen_at,
-            "raw_payload": stmt.excluded.raw_payload,
-            "updated_at": now,
+            col: stmt.excluded[col]
+            for col in (*_HASHED_FIELDS, "content_hash", "updated_at", "last_seen_at")
         },
+        where=table.c.content_hash.is_distinct_from(stmt.excluded.content_hash),
+    ).returning(StoreListing.external_id)
+
+
+async def _bump_last_seen(db, store_id, external_ids: list[str], now: datetime) -> None:
+    await db.execute(
+        update(StoreListing)
+        .where(StoreListing.store_id == store_id)
+        .where(StoreListing.external_id.in_(external_ids))
+        .values(last_seen_at=now)
     )
-    await db.execute(stmt)
-    return True
+
+
+async def _upsert_listing(db, store_id, dto: ListingDTO) -> bool:
+    """Одиночный upsert (точечные перепарсы). Обход магазина — через ListingWriter.
+
+    Возвращает True если запись вставлена или содержимое изменилось.
+    """
+    now = datetime.utcnow()
+    row = _listing_payload(store_id, dto)
+    row.update(first_seen_at=now, last_seen_at=now, updated_at=now)
+    res = await db.execute(_upsert_stmt([row]))
+    if res.scalar_one_or_none() is not None:
+        return True
+    await _bump_last_seen(db, store_id, [row["external_id"]], now)
+    return False
 
 
 def _serialize_raw(dto: ListingDTO) -> dict:
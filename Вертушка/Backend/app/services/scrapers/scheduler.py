@@ -0,0 +1,114 @@
+"""
+Планировщик обхода нескольких магазинов за один прогон.
+
+Магазины идут параллельно, у каждого — свой пул воркеров в crawl_full, темп
+которого задаёт только per-domain bucket + circuit breaker ScraperHttpClient.
+Поэтому ночное окно ≈ время самого медленного магазина, а не сумма всех.
+
+Ограничения на процесс:
+  - SCRAPER_MAX_HTTP_STORES — сколько HTTP-магазинов обходятся одновременно
+    (каждый держит DB-сессию на всё время обхода);
+  - SCRAPER_MAX_BROWSER_STORES — отдельная полоса для requires_browser:
+    Playwright-магазины не вытесняют HTTP и наоборот;
+  - SCRAPER_MAX_INFLIGHT — общий потолок одновременных parse_listing
+    (FIFO-семафор, магазины делят его по очереди).
+
+Живые счётчики по магазинам — crawl_progress(), раз в _PROGRESS_LOG_SEC
+пишутся в лог.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Iterable
+
+from app.models.store import Store
+from app.services.scrapers.runner import CrawlMode, crawl_store
+
+logger = logging.getLogger(__name__)
+
+
+MAX_HTTP_STORES = int(os.environ.get("SCRAPER_MAX_HTTP_STORES", "6"))
+MAX_BROWSER_STORES = int(os.environ.get("SCRAPER_MAX_BROWSER_STORES", "1"))
+MAX_INFLIGHT = int(os.environ.get("SCRAPER_MAX_INFLIGHT", "16"))
+_PROGRESS_LOG_SEC = 60.0
+
+# slug → счётчики последнего/текущего прогона (их же наполняет crawl_store)
+_progress: dict[str, dict] = {}
+
+
+def crawl_progress() -> dict[str, dict]:
+    """Снимок per-store метрик текущего (или последнего) прогона."""
+    now = time.monotonic()
+    out = {}
+    for slug, p in _progress.items():
+        snap = {k: v for k, v in p.items() if k != "started_mono"}
+        if p.get("started_mono") is not None and p["state"] == "running":
+            elapsed = now - p["started_mono"]
+            snap["elapsed_sec"] = round(elapsed, 1)
+            snap["per_min"] = round(p.get("discovered", 0) / max(elapsed, 1e-3) * 60, 1)
+        out[slug] = snap
+    return out
+
+
+async def _log_progress(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=_PROGRESS_LOG_SEC)
+        except asyncio.TimeoutError:
+            running = {
+                slug: f"{p.get('discovered', 0)}/{p.get('upserted', 0)} ({p.get('per_min', 0)}/min)"
+                for slug, p in crawl_progress().items() if p["state"] == "running"
+            }
+            if running:
+                logger.info("crawl progress (discovered/upserted): %s", running)
+
+
+async def crawl_stores(
+    stores: Iterable[Store],
+    *,
+    mode: CrawlMode = "full",
+    limit: int | None = None,
+) -> dict[str, dict]:
+    """Обойти магазины параллельно. Возвращает {slug: счётчики + state/elapsed_sec}.
+
+    Ошибка одного магазина не валит остальные — state="failed".
+    """
+    http_slots = asyncio.Semaphore(MAX_HTTP_STORES)
+    browser_slots = asyncio.Semaphore(MAX_BROWSER_STORES)
+    fetch_slots = asyncio.Semaphore(MAX_INFLIGHT)
+
+    stores = list(stores)
+    _progress.clear()
+    for store in stores:
+        _progress[store.slug] = {"state": "queued", "browser": bool(store.requires_browser)}
+
+    async def run_one(store: Store) -> None:
+        progress = _progress[store.slug]
+        lane = browser_slots if store.requires_browser else http_slots
+        async with lane:
+            progress["state"] = "running"
+            progress["started_mono"] = time.monotonic()
+            try:
+                await crawl_store(
+                    store.slug, mode=mode, limit=limit,
+                    fetch_slots=fetch_slots, progress=progress,
+                )
+                progress["state"] = "done"
+            except Exception:
+                progress["state"] = "failed"
+                logger.exception("crawl_store failed for %s", store.slug)
+            finally:
+                progress["elapsed_sec"] = round(time.monotonic() - progress["started_mono"], 1)
+                progress.pop("started_mono", None)
+
+    stop = asyncio.Event()
+    reporter = asyncio.create_task(_log_progress(stop))
+    try:
+        await asyncio.gather(*(run_one(store) for store in stores))
+    finally:
+        stop.set()
+        await reporter
+    return crawl_progress()
@@ -19,7 +19,7 @@ from decimal import Decimal
 
 from bs4 import BeautifulSoup
 
-from app.services.scrapers.base import BaseStoreParser, ListingDTO, ParserError
+from app.services.scrapers.base import BaseStoreParser, ListingDTO, ParserError, StockDTO
 from app.services.scrapers.extractors import (
     parse_price,
     parse_year,
@@ -169,6 +169,33 @@ class KorobkaVinylaParser(BaseStoreParser):
             },
         )
 
+    async def parse_stock(self, url: str) -> StockDTO:
+        """Цена/наличие прямо из Tilda `var product` — без BeautifulSoup.
+
+        Логика статуса — та же, что в parse_listing (quantity → in_stock,
+        ключевые слова предзаказа/«нет в наличии» в title/descr).
+        """
+        html = await self.http.get_text(url)
+        product = _extract_tilda_product(html)
+        price = parse_price(str(product.get("price") or product.get("priceMin") or "")) if product else None
+        if price is None:
+            # Нет JSON-объекта или цены в нём — нужны DOM-фолбэки parse_listing
+            return await super().parse_stock(url)
+
+        text = f"{product.get('title') or ''}\n{product.get('descr') or ''}"
+        try:
+            qty = int(str(product.get("quantity") or 0).strip() or 0)
+        except (ValueError, TypeError):
+            qty = 0
+
+        if _PREORDER_KW_RE.search(text):
+            status = "preorder"
+        elif qty > 0:
+            status = "in_stock"
+        else:
+            status = "out_of_stock"
+        return StockDTO(price_rub=price, status=status)
+
 
 # ---- helpers ----------------------------------------------------------- #
 
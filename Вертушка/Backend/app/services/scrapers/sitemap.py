@@ -3,29 +3,105 @@
 
 Поддерживает:
 - обычный <urlset> с <loc>
-- sitemap-index с <sitemap><loc>...
-- gzip (httpx раскодит сам если Content-Encoding)
+- sitemap-index с <sitemap><loc>... (дочерние качаются параллельно)
+- gzip (httpx раскодит сам если Content-Encoding; .xml.gz — инкрементально тут)
 - YML-фиды (<offers><offer url="..."/>)
+
+Тело не собирается в памяти целиком: чанки из ScraperHttpClient.stream_bytes
+идут через zlib.decompressobj в lxml XMLPullParser, записи отдаются по мере
+прихода, а отработанные элементы вычищаются из дерева. Пиковая память не
+зависит от размера фида.
 """
 from __future__ import annotations
 
-import gzip
-import io
+import asyncio
 import logging
 import re
+import zlib
+from contextlib import aclosing
 from typing import AsyncIterator
 
 from lxml import etree
 
+from app.services.scrapers.base import ListingDTO
+from app.services.scrapers.extractors import (
+    infer_format,
+    infer_vinyl_color,
+    normalize_barcode,
+    parse_price,
+    parse_year,
+)
 from app.services.scrapers.http_client import ScraperHttpClient
 
 logger = logging.getLogger(__name__)
 
 
-_NS = {
-    "sm": "http://www.sitemaps.org/schemas/sitemap/0.9",
+# Корень документа → тег одной записи в нём
+_ENTRY_TAGS = {
+    "urlset": "url",
+    "sitemapindex": "sitemap",
+    "yml_catalog": "offer",
 }
 
+# Сколько дочерних sitemap из индекса качаем одновременно (темп всё равно
+# задаёт per-domain bucket http-клиента)
+SITEMAP_CONCURRENCY = 4
+
+
+async def _iter_entries(
+    http: ScraperHttpClient,
+    url: str,
+) -> AsyncIterator[tuple[str, etree._Element]]:
+    """Стримит записи документа: (localname корня, элемент записи).
+
+    Элемент валиден только до следующей итерации — потом он очищается и
+    удаляется из дерева. Незнакомый корень → warning и пустой поток.
+    """
+    parser = etree.XMLPullParser(events=("start", "end"), huge_tree=True, resolve_entities=False)
+    root_tag: str | None = None
+    entry_tag: str | None = None
+    gunzip = None
+    first = True
+
+    async with aclosing(http.stream_bytes(url, respect_robots=False)) as chunks:
+        async for chunk in chunks:
+            if first:
+                first = False
+                # gzip-распаковка если httpx не сделал (.xml.gz без Content-Encoding)
+                if chunk[:2] == b"\x1f\x8b":
+                    gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            if gunzip is not None:
+                chunk = gunzip.decompress(chunk)
+            parser.feed(chunk)
+
+            for event, el in parser.read_events():
+                if root_tag is None:
+                    root_tag = etree.QName(el).localname
+                    entry_tag = _ENTRY_TAGS.get(root_tag)
+                    if entry_tag is None:
+                        logger.warning("unknown sitemap root <%s> at %s", root_tag, url)
+                        return
+                if event != "end" or etree.QName(el).localname != entry_tag:
+                    continue
+                yield root_tag, el
+                el.clear(keep_tail=False)
+                parent = el.getparent()
+                if parent is not None:
+                    while el.getprevious() is not None:
+                        del parent[0]
+
+    if gunzip is not None:
+        parser.feed(gunzip.flush())
+    parser.close()
+
+
+def _child_text(el: etree._Element, name: str) -> str | None:
+    """Текст первого дочернего элемента по localname (с namespace или без)."""
+    for child in el:
+        if isinstance(child.tag, str) and etree.QName(child).localname == name:
+            return (child.text or "").strip() or None
+    return None
+
 
 async def iter_sitemap_urls(
     http: ScraperHttpClient,
@@ -35,71 +111,141 @@ async def iter_sitemap_urls(
 ) -> AsyncIterator[str]:
     """Итерируется по URL'ам товаров из sitemap или YML-фида.
 
-    - Если корень — sitemap-index, рекурсивно (до max_depth) подгружаем дочерние.
+    - Если корень — sitemap-index, рекурсивно (до max_depth) подгружаем
+      дочерние, до SITEMAP_CONCURRENCY одновременно; порядок URL — по готовности.
     - Если YML-фид (`<yml_catalog>`), берём `<offer url="...">`.
     - url_pattern: regex; если задан, отдаём только URL, матчащие его.
     """
-    raw = await http.get_bytes(sitemap_url, respect_robots=False)
-
-    # gzip-распаковка если httpx не сделал
-    if raw[:2] == b"\x1f\x8b":
-        raw = gzip.decompress(raw)
+    pattern = re.compile(url_pattern) if url_pattern else None
+    children: list[str] = []
 
     try:
-        root = etree.fromstring(raw)
+        async with aclosing(_iter_entries(http, sitemap_url)) as entries:
+            async for root_tag, el in entries:
+                if root_tag == "sitemapindex":
+                    loc = _child_text(el, "loc")
+                    if loc:
+                        children.append(loc)
+                    continue
+                if root_tag == "urlset":
+                    url = _child_text(el, "loc")
+                else:
+                    # YML-формат Яндекс.Маркета
+                    url = el.get("url") or _child_text(el, "url")
+                if url and (pattern is None or pattern.search(url)):
+                    yield url
     except etree.XMLSyntaxError as e:
         logger.warning("sitemap parse error %s: %s", sitemap_url, e)
         return
 
-    pattern = re.compile(url_pattern) if url_pattern else None
+    if not children or max_depth <= 0:
+        return
+    async with aclosing(_iter_children(http, children, url_pattern, max_depth - 1)) as urls:
+        async for url in urls:
+            yield url
 
-    tag = etree.QName(root).localname
 
-    if tag == "sitemapindex":
-        if max_depth <= 0:
-            return
-        child_urls = [el.text for el in root.findall("sm:sitemap/sm:loc", _NS)]
-        for child in child_urls:
-            if not child:
-                continue
+async def _iter_children(
+    http: ScraperHttpClient,
+    children: list[str],
+    url_pattern: str | None,
+    max_depth: int,
+) -> AsyncIterator[str]:
+    """URL'ы из дочерних sitemap, до SITEMAP_CONCURRENCY потоков сразу."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+    done = object()
+    pending = iter(children)
+    workers = min(SITEMAP_CONCURRENCY, len(children))
+
+    async def pump() -> None:
+        for child in pending:
             try:
-                async for u in iter_sitemap_urls(http, child, url_pattern, max_depth - 1):
-                    yield u
+                async with aclosing(iter_sitemap_urls(http, child, url_pattern, max_depth)) as urls:
+                    async for url in urls:
+                        await queue.put(url)
             except Exception:
                 logger.debug("nested sitemap failed: %s", child, exc_info=True)
-                continue
+        # Не в finally: после cancel() очередь никто не читает, и put на
+        # заполненную очередь повис бы навсегда
+        await queue.put(done)
 
-    elif tag == "urlset":
-        for loc in root.findall("sm:url/sm:loc", _NS):
-            if loc.text and (pattern is None or pattern.search(loc.text)):
-                yield loc.text
-
-    elif tag == "yml_catalog":
-        # YML-формат Яндекс.Маркета
-        for offer in root.iter("offer"):
-            url = offer.get("url") or (offer.find("url").text if offer.find("url") is not None else None)
-            if url and (pattern is None or pattern.search(url)):
-                yield url
-
-    else:
-        logger.warning("unknown sitemap root <%s> at %s", tag, sitemap_url)
+    tasks = [asyncio.create_task(pump()) for _ in range(workers)]
+    finished = 0
+    try:
+        while finished < workers:
+            item = await queue.get()
+            if item is done:
+                finished += 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 async def iter_yml_offers(http: ScraperHttpClient, yml_url: str):
-    """Стримит `<offer>` элементы из YML-фида целиком (для парсеров, которые
-    хотят вытащить данные сразу из фида без захода на товарную страницу).
+    """Стримит `<offer>` элементы из YML-фида (для парсеров, которые хотят
+    вытащить данные сразу из фида без захода на товарную страницу).
+
+    Элемент валиден только до следующей итерации — данные из него нужно
+    забрать сразу.
 
     Yields: lxml.etree._Element
     """
-    raw = await http.get_bytes(yml_url, respect_robots=False)
-    if raw[:2] == b"\x1f\x8b":
-        raw = gzip.decompress(raw)
-
     try:
-        root = etree.fromstring(raw)
+        async with aclosing(_iter_entries(http, yml_url)) as entries:
+            async for root_tag, offer in entries:
+                if root_tag == "yml_catalog":
+                    yield offer
     except etree.XMLSyntaxError as e:
         logger.warning("yml parse error %s: %s", yml_url, e)
-        return
 
-    for offer in root.iter("offer"):
-        yield offer
+
+# ---- YML offer → ListingDTO --------------------------------------------- #
+
+
+_YML_CURRENCIES = {"RUR": "RUB"}
+
+
+def offer_to_listing(offer: etree._Element) -> ListingDTO | None:
+    """`<offer>` YML-фида → ListingDTO без захода на страницу товара.
+
+    Понимает и vendor.model (`name`/`vendor`/`model`), и artist.title
+    (`artist`/`title`/`year`/`media`). None — если нет id, url или названия.
+    """
+    external_id = offer.get("id")
+    url = offer.get("url") or _child_text(offer, "url")
+    title = _child_text(offer, "title") or _child_text(offer, "name") or _child_text(offer, "model")
+    if not external_id or not url or not title:
+        return None
+
+    params: dict[str, str] = {}
+    for child in offer:
+        if isinstance(child.tag, str) and etree.QName(child).localname == "param" and child.get("name"):
+            params[child.get("name")] = (child.text or "").strip()
+
+    description = _child_text(offer, "description") or ""
+    media = _child_text(offer, "media") or params.get("Формат") or params.get("Носитель")
+    price = parse_price(_child_text(offer, "price"))
+    currency = (_child_text(offer, "currencyId") or "RUB").upper()
+
+    return ListingDTO(
+        external_id=external_id,
+        url=url,
+        title_raw=title,
+        artist_raw=_child_text(offer, "artist") or _child_text(offer, "vendor"),
+        year_raw=parse_year(_child_text(offer, "year") or params.get("Год")),
+        format_raw=infer_format(" ".join(filter(None, (media, title, description[:500])))),
+        vinyl_color_raw=infer_vinyl_color(params.get("Цвет") or title),
+        price_rub=price,
+        price_currency=_YML_CURRENCIES.get(currency, currency),
+        status="out_of_stock" if offer.get("available") == "false" else "in_stock",
+        barcode=normalize_barcode(_child_text(offer, "barcode")),
+        image_url=_child_text(offer, "picture"),
+        raw_payload={
+            "source": "yml",
+            "category_id": _child_text(offer, "categoryId"),
+            "params": params,
+        },
+    )
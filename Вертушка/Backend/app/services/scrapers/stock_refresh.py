@@ -0,0 +1,226 @@
+"""
+Точечный refresh цены и наличия для привязанных листингов (refresh by URL).
+
+Раньше stock_refresh_active гонял crawl_full с limit=100 по каждому магазину:
+sitemap с начала и первые 100 URL — обычно не те, что устарели. Теперь:
+
+  1. select_stale — matched in_stock листинги с last_seen_at старше
+     STALE_AFTER, по магазину не больше per_store_limit, первыми — самые
+     востребованные (в вишлистах + клики «Купить» за DEMAND_WINDOW);
+  2. refresh_store — только эти URL, пулом из crawl_concurrency воркеров,
+     через parser.parse_stock (облегчённый экстрактор) и с условными
+     запросами PageValidators: 304 / тот же хэш → только бамп last_seen_at.
+     Валидаторы здесь только читаются: parse_stock разбирает цену и
+     наличие, а не всю карточку, и зафиксированный хэш заставил бы полный
+     обход пропустить страницу с изменившимся названием/форматом/обложкой;
+  3. _write — одним UPDATE ... FROM unnest на магазин. updated_at двигается
+     только если цена/статус реально поменялись (его смотрит
+     invalidate_offers_for_recently_updated), content_hash при этом
+     сбрасывается — иначе upsert полного обхода (пишет только при
+     несовпадении хэша) не вернул бы статус/цену со страницы.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text, update
+
+from app.database import async_session_maker
+from app.models.store import Store
+from app.models.store_listing import ListingStatus, StoreListing
+from app.services.market_index import refresh_offer_index
+from app.services.market_stats import refresh_store_stats
+from app.services.offer_summary import refresh_offer_summary
+from app.services.scrapers.base import (
+    ParserBlocked,
+    ParserNotModified,
+    StockDTO,
+)
+from app.services.scrapers.http_client import ParserError_404, http_client
+from app.services.scrapers.runner import _make_parser
+from app.services.scrapers.validators import PageValidators, current_page
+
+logger = logging.getLogger(__name__)
+
+
+STALE_AFTER = timedelta(hours=4)
+DEMAND_WINDOW = timedelta(days=30)
+
+
+async def select_stale(db, per_store_limit: int) -> dict:
+    """{store_id: [(listing_id, external_id, url), ...]} — кандидаты на refresh."""
+    now = datetime.utcnow()
+    res = await db.execute(
+        text(
+            """
+            SELECT id, store_id, external_id, url FROM (
+                SELECT sl.id, sl.store_id, sl.external_id, sl.url,
+                       row_number() OVER (
+                           PARTITION BY sl.store_id
+                           ORDER BY coalesce(w.n, 0) + coalesce(c.n, 0) DESC, sl.last_seen_at
+                       ) AS rn
+                FROM store_listings sl
+                JOIN stores s ON s.id = sl.store_id
+                LEFT JOIN LATERAL (
+                    SELECT count(*) AS n FROM wishlist_items wi
+                    WHERE wi.record_id = sl.matched_record_id AND NOT wi.is_purchased
+                ) w ON true
+                LEFT JOIN LATERAL (
+                    SELECT count(*) AS n FROM offer_clicks oc
+                    WHERE oc.listing_id = sl.id AND oc.created_at >= :demand_since
+                ) c ON true
+                WHERE sl.matched_record_id IS NOT NULL
+                  AND sl.status = 'in_stock'
+                  AND sl.last_seen_at < :stale_before
+                  AND s.is_active AND NOT s.requires_browser
+            ) t
+            WHERE rn <= :lim
+            """
+        ),
+        {
+            "demand_since": now - DEMAND_WINDOW,
+            "stale_before": now - STALE_AFTER,
+            "lim": per_store_limit,
+        },
+    )
+    out: dict = {}
+    for row in res:
+        out.setdefault(row.store_id, []).append((row.id, row.external_id, row.url))
+    return out
+
+
+async def refresh_store(store: Store, rows: list[tuple]) -> dict:
+    """Перечитать цену/наличие для rows одного магазина и записать пачкой."""
+    counters = {"checked": 0, "changed": 0, "unchanged": 0, "removed": 0, "errors": 0}
+    parser = _make_parser(store)
+    http_client.configure_domain(
+        store.domain,
+        rate_per_sec=parser.rate_limit_per_sec,
+        burst=parser.rate_burst,
+    )
+    validators = PageValidators(store.id)
+    async with async_session_maker() as db:
+        await validators.load(db)
+
+    updates: list[tuple] = []   # (listing_id, price, status)
+    seen: list = []             # listing_id — страница не изменилась
+    pending = iter(rows)
+    blocked = asyncio.Event()
+
+    async def work() -> None:
+        for listing_id, _external_id, url in pending:
+            if blocked.is_set():
+                return
+            token = current_page.set((validators, url))
+            try:
+                stock: StockDTO = await parser.parse_stock(url)
+            except ParserNotModified:
+                seen.append(listing_id)
+                continue
+            except ParserError_404:
+                updates.append((listing_id, None, ListingStatus.REMOVED))
+                counters["removed"] += 1
+                continue
+            except ParserBlocked:
+                logger.warning("[%s] blocked at %s — stopping stock refresh", store.slug, url)
+                blocked.set()
+                return
+            except Exception:
+                counters["errors"] += 1
+                logger.debug("[%s] stock refresh failed for %s", store.slug, url, exc_info=True)
+                continue
+            finally:
+                current_page.reset(token)
+            updates.append((listing_id, stock.price_rub, stock.status))
+
+    await asyncio.gather(*(work() for _ in range(max(1, parser.crawl_concurrency))))
+
+    counters["checked"] = len(updates) + len(seen)
+    counters["unchanged"] = len(seen)
+    async with async_session_maker() as db:
+        written_at = datetime.utcnow()
+        counters["changed"] = await _write(db, updates, seen)
+        if counters["changed"]:
+            await refresh_store_stats(db, [store.id])
+            await refresh_offer_index(db, store_ids=[store.id], since=written_at)
+            await refresh_offer_summary(db, store_ids=[store.id], since=written_at)
+        await db.commit()
+    counters["unchanged"] += len(updates) - counters["changed"]
+    return counters
+
+
+async def _write(db, updates: list[tuple], seen: list) -> int:
+    """Bulk-апдейт цен/статусов + бамп last_seen_at. Возвращает число изменённых."""
+    now = datetime.utcnow()
+    changed = 0
+    if updates:
+        # u — снимок строк до UPDATE: по нему RETURNING решает, изменилось ли
+        res = await db.execute(
+            text(
+                """
+                UPDATE store_listings sl SET
+                    price_rub = CASE WHEN u.status = 'removed' THEN sl.price_rub ELSE u.price END,
+                    status = u.status,
+                    last_seen_at = CASE WHEN u.status = 'removed' THEN sl.last_seen_at ELSE :now END,
+                    updated_at = CASE WHEN u.changed THEN :now ELSE sl.updated_at END,
+                    content_hash = CASE WHEN u.changed THEN NULL ELSE sl.content_hash END
+                FROM (
+                    SELECT v.id, v.price, v.status,
+                           old.status IS DISTINCT FROM v.status
+                           OR (v.status <> 'removed' AND old.price_rub IS DISTINCT FROM v.price)
+                           AS changed
+                    FROM unnest(cast(:ids as uuid[]), cast(:prices as numeric[]), cast(:statuses as text[]))
+                         AS v(id, price, status)
+                    JOIN store_listings old ON old.id = v.id
+                ) u
+                WHERE sl.id = u.id
+                RETURNING u.changed
+                """
+            ),
+            {
+                "now": now,
+                "ids": [u[0] for u in updates],
+                "prices": [u[1] for u in updates],
+                "statuses": [u[2] for u in updates],
+            },
+        )
+        changed = sum(1 for is_changed in res.scalars() if is_changed)
+    if seen:
+        await db.execute(
+            update(StoreListing)
+            .where(StoreListing.id.in_(seen))
+            .values(last_seen_at=now)
+        )
+    return changed
+
+
+async def refresh_stale_listings(per_store_limit: int = 200) -> dict:
+    """Refresh по всем магазинам параллельно (темп — per-domain bucket)."""
+    async with async_session_maker() as db:
+        stale = await select_stale(db, per_store_limit)
+        if not stale:
+            return {"stores": 0, "checked": 0, "changed": 0}
+        res = await db.execute(select(Store).where(Store.id.in_(list(stale))))
+        stores = list(res.scalars().all())
+
+    async def run_one(store: Store) -> dict:
+        try:
+            return await refresh_store(store, stale[store.id])
+        except Exception:
+            logger.exception("stock refresh failed for %s", store.slug)
+            return {"errors": 1}
+
+    per_store = dict(zip(
+        (s.slug for s in stores),
+        await asyncio.gather(*(run_one(s) for s in stores)),
+    ))
+    counters = {
+        "stores": len(stores),
+        "checked": sum(r.get("checked", 0) for r in per_store.values()),
+        "changed": sum(r.get("changed", 0) for r in per_store.values()),
+        "per_store": per_store,
+    }
+    logger.info("stock refresh done: %s", {k: v for k, v in counters.items() if k != "per_store"})
+    return counters
@@ -0,0 +1,124 @@
+"""
+HTTP-валидаторы страниц товаров (ETag / Last-Modified / хэш тела) по URL.
+
+Полный обход раньше каждый раз скачивал и парсил каждую карточку. Теперь
+runner на время обхода магазина держит PageValidators (таблица
+store_page_validators), а ScraperHttpClient.get_text для страницы листинга:
+  - шлёт If-None-Match / If-Modified-Since, на 304 → ParserNotModified;
+  - на 200 сравнивает хэш тела с прошлым — совпал → ParserNotModified.
+crawl_full превращает ParserNotModified в UnchangedListing, runner лишь
+бампает last_seen_at — без парсинга и без перезаписи строки.
+
+Валидаторы применяются только к URL, для которого уже известен external_id
+(листинг однажды успешно распарсен) и листинг не в статусе removed, —
+иначе нечего бампать. Какая страница сейчас «страница листинга», http-клиент
+узнаёт из contextvar current_page (ставит воркер crawl_full).
+"""
+from __future__ import annotations
+
+import hashlib
+from contextvars import ContextVar
+
+from sqlalchemy import text
+
+# (PageValidators, url страницы листинга) — task-local для воркера crawl_full
+current_page: ContextVar[tuple["PageValidators", str] | None] = ContextVar(
+    "scraper_current_page", default=None,
+)
+
+
+def body_hash(body: str) -> int:
+    """64-битный signed хэш тела страницы (влезает в BIGINT)."""
+    digest = hashlib.blake2b(body.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class PageValidators:
+    """Валидаторы страниц одного магазина на время обхода."""
+
+    def __init__(self, store_id) -> None:
+        self.store_id = store_id
+        self._rows: dict[str, dict] = {}
+        # Валидаторы последнего 200-ответа — в _rows попадают только после
+        # bind(), т.е. когда страница реально распарсилась. Иначе упавший
+        # парсинг изменённой страницы «закрепил» бы её хэш и следующий обход
+        # её бы пропустил.
+        self._fresh: dict[str, dict] = {}
+        self._dirty: set[str] = set()
+
+    async def load(self, db) -> None:
+        res = await db.execute(
+            text(
+                "SELECT v.url, v.external_id, v.etag, v.last_modified, v.body_hash "
+                "FROM store_page_validators v "
+                "JOIN store_listings l "
+                "  ON l.store_id = v.store_id AND l.external_id = v.external_id "
+                "WHERE v.store_id = :s AND l.status <> 'removed'"
+            ),
+            {"s": self.store_id},
+        )
+        self._rows = {row.url: dict(row._mapping) for row in res}
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        row = self._rows.get(url)
+        if not row or not row.get("external_id"):
+            return {}
+        headers = {}
+        if row.get("etag"):
+            headers["If-None-Match"] = row["etag"]
+        if row.get("last_modified"):
+            headers["If-Modified-Since"] = row["last_modified"]
+        return headers
+
+    def observe(self, url: str, *, etag: str | None, last_modified: str | None, body: str) -> bool:
+        """Запомнить валидаторы ответа 200. True — тело не изменилось с прошлого раза."""
+        h = body_hash(body)
+        row = self._rows.get(url)
+        if row and row.get("external_id") and row.get("body_hash") == h:
+            return True
+        self._fresh[url] = {"etag": etag, "last_modified": last_modified, "body_hash": h}
+        return False
+
+    def bind(self, url: str, external_id: str) -> None:
+        """Листинг по url успешно распарсен — фиксируем валидаторы его страницы."""
+        row = self._rows.setdefault(url, {"url": url})
+        row["external_id"] = external_id
+        row.update(self._fresh.pop(url, {}))
+        self._dirty.add(url)
+
+    def external_id(self, url: str) -> str | None:
+        row = self._rows.get(url)
+        return row.get("external_id") if row else None
+
+    @property
+    def dirty(self) -> int:
+        return len(self._dirty)
+
+    async def flush(self, db) -> None:
+        """Upsert изменённых валидаторов одним запросом. Без commit."""
+        rows = [self._rows[u] for u in self._dirty if self._rows[u].get("external_id")]
+        self._dirty.clear()
+        if not rows:
+            return
+        await db.execute(
+            text(
+                "INSERT INTO store_page_validators "
+                "  (store_id, url, external_id, etag, last_modified, body_hash, updated_at) "
+                "SELECT cast(:s as uuid), u.url, u.external_id, u.etag, u.last_modified, u.body_hash, now() "
+                "FROM unnest(cast(:urls as text[]), cast(:ext as text[]), cast(:etags as text[]), "
+                "            cast(:lms as text[]), cast(:hashes as bigint[])) "
+                "     AS u(url, external_id, etag, last_modified, body_hash) "
+                "ON CONFLICT (store_id, url) DO UPDATE SET "
+                "  external_id = excluded.external_id, etag = excluded.etag, "
+                "  last_modified = excluded.last_modified, body_hash = excluded.body_hash, "
+                "  updated_at = excluded.updated_at"
+            ),
+            {
+                "s": self.store_id,
+                "urls": [r["url"] for r in rows],
+                "ext": [r["external_id"] for r in rows],
+                "etags": [r.get("etag") for r in rows],
+                "lms": [r.get("last_modified") for r in rows],
+                "hashes": [r.get("body_hash") for r in rows],
+            },
+        )
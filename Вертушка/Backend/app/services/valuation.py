@@ -32,16 +32,12 @@ async def get_monthly_delta(user_id: UUID, db: AsyncSession) -> Decimal | None:
     """
     Дельта стоимости коллекции за последние 30 дней (RUB).
     Возвращает None, если истории снапшотов < 30 дней.
-    """
-    today = date.today()
-    target_date = today - timedelta(days=30)
 
-    oldest_snap = await db.scalar(
-        select(func.min(CollectionValueSnapshot.snapshot_date))
-        .where(CollectionValueSnapshot.user_id == user_id)
-    )
-    if not oldest_snap or oldest_snap > target_date:
-        return None
+    Обе точки — из collection_value_snapshots (пишет record_daily_snapshots):
+    «сейчас» = последний снапшот, без пересчёта коллекции на каждый запрос.
+    Индекс ix_value_snapshot_user_date — оба запроса по нему.
+    """
+    target_date = date.today() - timedelta(days=30)
 
     past_value = await db.scalar(
         select(CollectionValueSnapshot.total_value_rub)
@@ -55,5 +51,10 @@ async def get_monthly_delta(user_id: UUID, db: AsyncSession) -> Decimal | None:
     if past_value is None:
         return None
 
-    today_value = await get_current_collection_value_rub(user_id, db)
-    return (Decimal(today_value) - Decimal(past_value)).quantize(Decimal("0.01"))
+    latest_value = await db.scalar(
+        select(CollectionValueSnapshot.total_value_rub)
+        .where(CollectionValueSnapshot.user_id == user_id)
+        .order_by(CollectionValueSnapshot.snapshot_date.desc())
+        .limit(1)
+    )
+    return (Decimal(latest_value) - Decimal(past_value)).quantize(Decimal("0.01"))
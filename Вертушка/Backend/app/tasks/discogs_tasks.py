@@ -96,6 +96,7 @@ async def update_prices_batch():
     Обрабатывает батч из 50 записей за запуск.
     """
     from app.services.discogs import DiscogsService
+    from app.services.rate_limiter import Priority
     from app.services.exchange import get_usd_rub_rate
     from app.services.pricing import PricingParams, estimate_rub
 
@@ -131,7 +132,7 @@ async def update_prices_batch():
 
             for record in records:
                 try:
-                    stats = await discogs._get_price_stats(record.discogs_id)
+                    stats = await discogs._get_price_stats(record.discogs_id, priority=Priority.BATCH)
                     if stats:
                         lowest = stats.get("lowest_price", {}).get("value") if isinstance(stats.get("lowest_price"), dict) else stats.get("lowest_price")
                         median = stats.get("median_price", {}).get("value") if isinstance(stats.get("median_price"), dict) else stats.get("median_price")
@@ -218,6 +219,7 @@ async def enrich_market_covers():
     не упереться в Discogs rate limit; добивается за несколько прогонов.
     """
     from app.services.discogs import DiscogsService
+    from app.services.rate_limiter import Priority
     from app.services.cover_storage import CoverStorageService
     from app.models.store_listing import StoreListing
 
@@ -256,7 +258,7 @@ async def enrich_market_covers():
                     cover_url = master_cover_cache[master_id]
                 else:
                     try:
-                        master = await discogs.get_master(master_id)
+                        master = await discogs.get_master(master_id, priority=Priority.BATCH)
                         cover_url = master.cover_image_url
                     except Exception:
                         logger.exception("enrich_market_covers: get_master %s failed", master_id)
@@ -286,20 +288,120 @@ async def enrich_market_covers():
         logger.exception("enrich_market_covers failed")
 
 
+COVER_EMBED_BATCH = 2000
+COVER_EMBED_CHUNK = 32
+
+
+async def build_cover_embedding_index(limit: int = COVER_EMBED_BATCH) -> dict[str, int]:
+    """Досчитать CLIP-векторы локальных обложек и пересобрать cover_index.
+
+    Берёт записи с cover_local_path, у которых ещё нет вектора (ни в
+    индексе, ни в pending), эмбеддит файл с диска — без HTTP. Затем
+    cover_index.compact вливает pending в новую ANN-версию. limit=0 — все.
+    """
+    from pathlib import Path
+
+    from app.services.cover_index import cover_index
+    from app.services.cover_matcher import CoverMatcher
+
+    uploads_root = Path(get_settings().covers_dir).parent
+    counters = {"embedded": 0, "failed": 0, "indexed": 0}
+    todo: list[tuple[str, str]] = []
+
+    try:
+        async with async_session_maker() as session:
+            stream = await session.stream(
+                select(Record.discogs_id, Record.cover_local_path)
+                .where(
+                    Record.cover_local_path.isnot(None),
+                    Record.discogs_id.isnot(None),
+                    Record.merged_into_id.is_(None),
+                )
+                .order_by(Record.cover_cached_at.desc())
+                .execution_options(yield_per=5000)
+            )
+            async for discogs_id, rel_path in stream:
+                if not cover_index.has(discogs_id):
+                    todo.append((discogs_id, rel_path))
+                    if limit and len(todo) >= limit:
+                        break
+
+        if todo:
+            matcher = await CoverMatcher.get()
+            for start in range(0, len(todo), COVER_EMBED_CHUNK):
+                chunk = todo[start:start + COVER_EMBED_CHUNK]
+                images = await asyncio.gather(*[
+                    asyncio.to_thread(_read_cover, uploads_root / rel_path)
+                    for _, rel_path in chunk
+                ])
+                vecs = await matcher.embed_many([img or b"" for img in images])
+                for (discogs_id, _), vec in zip(chunk, vecs):
+                    if vec is None:
+                        counters["failed"] += 1
+                        continue
+                    await asyncio.to_thread(cover_index.put, discogs_id, vec)
+                    counters["embedded"] += 1
+
+        counters["indexed"] = await asyncio.to_thread(cover_index.compact)
+        logger.info("build_cover_embedding_index: %s", counters)
+    except Exception:
+        logger.exception("build_cover_embedding_index failed")
+    return counters
+
+
+def _read_cover(path) -> bytes | None:
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
+
 async def refresh_market_store_stats():
-    """WS4.1 — REFRESH matview market_store_stats (витрина магазинов).
+    """WS4.1 — полный reconcile таблицы market_store_stats (витрина магазинов).
 
-    CONCURRENTLY: не блокирует читателей эндпоинта /market/stores. Требует
-    уникальный индекс (ix_market_store_stats_store_id, создан в миграции).
+    Между прогонами строки пересчитываются точечно при записи листингов
+    (см. app/services/market_stats.py); тут — правка дрейфа и окон 7d/24h.
     """
-    from sqlalchemy import text
+    from app.services.market_stats import reconcile_all_store_stats
 
     try:
         async with async_session_maker() as db:
-            await db.execute(
-                text("REFRESH MATERIALIZED VIEW CONCURRENTLY market_store_stats")
-            )
+            await reconcile_all_store_stats(db)
             await db.commit()
-        logger.info("refresh_market_store_stats: matview refreshed")
+        logger.info("refresh_market_store_stats: reconciled")
     except Exception:
         logger.exception("refresh_market_store_stats failed")
+
+
+async def reconcile_market_offer_index():
+    """Полная пересборка market_offer_index (поиск/карусели Маркета).
+
+    Между прогонами строки пересобираются точечно при записи листингов
+    (см. app/services/market_index.py); тут — правка дрейфа и окна 7d.
+    """
+    from app.services.market_index import rebuild_offer_index
+
+    try:
+        async with async_session_maker() as db:
+            await rebuild_offer_index(db)
+            await db.commit()
+        logger.info("reconcile_market_offer_index: rebuilt")
+    except Exception:
+        logger.exception("reconcile_market_offer_index failed")
+
+
+async def reconcile_record_offer_summary():
+    """Полная пересборка record_offer_summary (Hot Stock pill в сетках).
+
+    Между прогонами строки пересобираются точечно при записи листингов
+    (см. app/services/offer_summary.py); тут — правка дрейфа и окна 7d.
+    """
+    from app.services.offer_summary import rebuild_offer_summary
+
+    try:
+        async with async_session_maker() as db:
+            await rebuild_offer_summary(db)
+            await db.commit()
+        logger.info("reconcile_record_offer_summary: rebuilt")
+    except Exception:
+        logger.exception("reconcile_record_offer_summary failed")
@@ -13,6 +13,11 @@ emit_wishlist_in_stock_notifications:
 - если за окно сработало ≥DIGEST_THRESHOLD алертов одному юзеру → склеиваем в digest.
 
 См. docs/plans/PLAN_NOTIFICATIONS_V2.md.
+
+reconcile_feed_events:
+    Раз в час: догоняет feed_events (лента подписок) по источникам за последние
+    FEED_SYNC_WINDOW_HOURS и чистит мёртвые события того же окна (основное
+    удаление — discard_feed_events на путях удаления источников).
 """
 from __future__ import annotations
 
@@ -52,6 +57,9 @@ FIRST_MATCH_LOOKBACK_DAYS = 90
 # Если за один прогон одному user'у падает ≥N новых wishlist_in_stock — сворачиваем в digest.
 DIGEST_THRESHOLD = 5
 
+# Окно догоняющей записи feed_events — с запасом перед часовым интервалом запуска.
+FEED_SYNC_WINDOW_HOURS = 2
+
 
 async def emit_wishlist_in_stock_notifications() -> None:
     """Идемпотентная фоновая задача — вызывается из APScheduler каждые 15 минут."""
@@ -62,6 +70,21 @@ async def emit_wishlist_in_stock_notifications() -> None:
         logger.exception("emit_wishlist_in_stock_notifications failed")
 
 
+async def reconcile_feed_events() -> None:
+    """Догнать feed_events записями в обход хуков (импорт, скрипты) и вычистить мёртвые."""
+    from app.services.feed import sync_feed_events
+
+    try:
+        async with async_session_maker() as db:
+            added, removed = await sync_feed_events(
+                db, since=datetime.utcnow() - timedelta(hours=FEED_SYNC_WINDOW_HOURS)
+            )
+            await db.commit()
+        logger.info("reconcile_feed_events: +%d, -%d stale", added, removed)
+    except Exception:
+        logger.exception("reconcile_feed_events failed")
+
+
 async def _run(db: AsyncSession) -> None:
     now = datetime.utcnow()
     window_start = now - timedelta(minutes=RECENT_WINDOW_MINUTES)
@@ -0,0 +1,27 @@
+"""
+Фоновые задачи публичного профиля.
+
+flush_profile_views:
+    Раз в минуту: сбрасывает буфер просмотров /@username и
+    GET /profile/public/{username} из Redis в profile_shares.view_count
+    одним UPDATE (см. app/services/public_profile_cache.py).
+"""
+from __future__ import annotations
+
+import logging
+
+from app.database import async_session_maker
+from app.services.public_profile_cache import flush_profile_views as _flush
+
+logger = logging.getLogger(__name__)
+
+
+async def flush_profile_views() -> None:
+    """Идемпотентная фоновая задача — вызывается из APScheduler каждую минуту."""
+    try:
+        async with async_session_maker() as db:
+            flushed = await _flush(db)
+        if flushed:
+            logger.info("flush_profile_views: %d profiles", flushed)
+    except Exception:
+        logger.exception("flush_profile_views failed")
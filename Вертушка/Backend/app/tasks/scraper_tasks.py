@@ -16,7 +16,8 @@ from app.database import async_session_maker
 from app.models.record import Record
 from app.models.store import Store
 from app.models.store_listing import StoreListing, ListingStatus
-from app.services.scrapers.runner import crawl_store
+from app.services.scrapers.scheduler import crawl_stores
+from app.services.scrapers.stock_refresh import refresh_stale_listings
 from app.services.scrapers.shops import *  # noqa: F401,F403  — auto-register parsers
 from app.services.listing_matcher import match_unmatched_batch, rematch_store_native_batch
 from app.api.offers import invalidate_record_offers
@@ -29,7 +30,11 @@ logger = logging.getLogger(__name__)
 
 
 async def _crawl_active_stores(filter_browser: bool | None = None, mode: str = "full") -> dict:
-    """Прогнать все активные магазины. filter_browser: True/False/None — фильтр."""
+    """Прогнать все активные магазины параллельно (scrapers.scheduler).
+
+    filter_browser: True/False/None — фильтр. Окно прогона ≈ самый медленный
+    магазин; per-store метрики — в counters["per_store"].
+    """
     counters = {"stores": 0, "ok": 0, "failed": 0, "total_upserted": 0}
     async with async_session_maker() as db:
         stmt = select(Store).where(Store.is_active.is_(True))
@@ -38,16 +43,16 @@ async def _crawl_active_stores(filter_browser: bool | None = None, mode: str = "
         stores = list((await db.execute(stmt)).scalars().all())
 
     counters["stores"] = len(stores)
-    for store in stores:
-        try:
-            res = await crawl_store(store.slug, mode=mode)
+    per_store = await crawl_stores(stores, mode=mode)
+    for res in per_store.values():
+        if res["state"] == "done":
             counters["ok"] += 1
             counters["total_upserted"] += res.get("upserted", 0)
-        except Exception:
+        else:
             counters["failed"] += 1
-            logger.exception("crawl_store failed for %s", store.slug)
 
     logger.info("scraper batch done: %s", counters)
+    counters["per_store"] = per_store
     return counters
 
 
@@ -72,40 +77,13 @@ async def daily_incremental_crawl() -> dict:
 # ---- Stock-refresh для активных матчей --------------------------------- #
 
 
-async def stock_refresh_active(per_store_limit: int = 100) -> dict:
+async def stock_refresh_active(per_store_limit: int = 200) -> dict:
     """Обновить stock+цены листингов, привязанных к Record и показанных юзерам.
 
-    Берёт листинги с last_seen_at > 6h, проходит per-store через crawl_full
-    но с ограниченным лимитом — это упрощённо. Для production-grade лучше
-    отдельный «refresh by URL» режим — но пока MVP.
+    Refresh by URL (scrapers.stock_refresh): только устаревшие matched
+    листинги, востребованные — первыми, без обхода sitemap.
     """
-    cutoff = datetime.utcnow() - timedelta(hours=6)
-    counters = {"stores": 0, "stale_count": 0}
-    async with async_session_maker() as db:
-        # Считаем сколько устаревших матчей
-        stale_q = await db.execute(
-            select(StoreListing.id)
-            .where(StoreListing.matched_record_id.is_not(None))
-            .where(StoreListing.status == ListingStatus.IN_STOCK)
-            .where(StoreListing.last_seen_at < cutoff)
-            .limit(1)
-        )
-        if stale_q.first() is None:
-            return counters
-        counters["stale_count"] = 1
-
-        stores_q = await db.execute(
-            select(Store).where(Store.is_active.is_(True), Store.requires_browser.is_(False))
-        )
-        stores = list(stores_q.scalars().all())
-
-    counters["stores"] = len(stores)
-    for store in stores:
-        try:
-            await crawl_store(store.slug, mode="full", limit=per_store_limit)
-        except Exception:
-            logger.exception("stock_refresh failed for %s", store.slug)
-    return counters
+    return await refresh_stale_listings(per_store_limit=per_store_limit)
 
 
 # ---- Матчинг unmatched ------------------------------------------------- #
@@ -188,7 +166,12 @@ async def daily_rematch_store_native() -> dict:
 
 
 async def weekly_cleanup_stale(days: int = 30) -> dict:
-    """Помечаем как 'removed' листинги, которые не видели больше N дней."""
+    """Помечаем как 'removed' листинги, которые не видели больше N дней.
+
+    content_hash сбрасываем: upsert обхода пишет строку только при
+    несовпадении хэша, и вернувшийся с тем же содержимым листинг иначе
+    так и остался бы removed.
+    """
     cutoff = datetime.utcnow() - timedelta(days=days)
     async with async_session_maker() as db:
         try:
@@ -196,7 +179,7 @@ async def weekly_cleanup_stale(days: int = 30) -> dict:
                 update(StoreListing)
                 .where(StoreListing.last_seen_at < cutoff)
                 .where(StoreListing.status != ListingStatus.REMOVED)
-                .values(status=ListingStatus.REMOVED, updated_at=datetime.utcnow())
+                .values(status=ListingStatus.REMOVED, content_hash=None, updated_at=datetime.utcnow())
             )
             await db.commit()
             return {"updated": res.rowcount or 0}
@@ -212,6 +195,9 @@ async def weekly_cleanup_stale(days: int = 30) -> dict:
 async def invalidate_offers_for_recently_updated(window_minutes: int = 60) -> dict:
     """После обхода парсеров — сбросить offers-кэш для записей, чьи листинги
     обновились в последний час. Чтобы юзеры видели свежие цены, не дожидаясь TTL.
+
+    Смотрим на updated_at, а не last_seen_at: last_seen_at бампается у каждого
+    увиденного листинга, updated_at — только когда содержимое реально поменялось.
     """
     since = datetime.utcnow() - timedelta(minutes=window_minutes)
     async with async_session_maker() as db:
@@ -219,7 +205,7 @@ async def invalidate_offers_for_recently_updated(window_minutes: int = 60) -> di
         res = await db.execute(
             select(Record.discogs_id)
             .join(StoreListing, StoreListing.matched_record_id == Record.id)
-            .where(StoreListing.last_seen_at >= since)
+            .where(StoreListing.updated_at >= since)
             .where(Record.discogs_id.is_not(None))
             .distinct()
         )
@@ -2,75 +2,109 @@
 Фоновые задачи: ежедневный снапшот стоимости коллекций
 """
 import logging
+import uuid
 from datetime import date
 from decimal import Decimal
 
-from sqlalchemy import select, func
-from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import text
 
 from app.database import async_session_maker
-from app.models.collection import Collection, CollectionItem
-from app.models.collection_value_snapshot import CollectionValueSnapshot
-from app.models.record import Record
-from app.models.user import User
 from app.services.exchange import get_usd_rub_rate
 
 logger = logging.getLogger(__name__)
 
 
+# Пользователей на одну пачку: один INSERT ... SELECT и один commit на пачку
+SNAPSHOT_CHUNK = 2000
+
+# DISTINCT по record_id: пластинка может лежать в общей коллекции
+# и в папках одновременно — не дублируем её в снапшоте стоимости.
+# Курс — параметром, округление до копеек — в Postgres (NUMERIC, без float).
+# Вторая ветка — нулевой снапшот тем, у кого коллекция опустела, а последний
+# снапшот ещё ненулевой: иначе он остался бы «текущим» для get_monthly_delta.
+_UPSERT_SNAPSHOTS = text(
+    """
+    INSERT INTO collection_value_snapshots
+        (id, user_id, snapshot_date, total_value_rub, items_count, created_at)
+    SELECT
+        gen_random_uuid(), d.user_id, :today,
+        ROUND(COALESCE(SUM(d.price_usd), 0) * cast(:rate as numeric), 2),
+        COUNT(d.record_id),
+        NOW()
+    FROM (
+        SELECT c.user_id, ci.record_id, MAX(r.estimated_price_median) AS price_usd
+        FROM collections c
+        JOIN collection_items ci ON ci.collection_id = c.id
+        JOIN records r ON r.id = ci.record_id
+        WHERE c.user_id > :lo AND c.user_id <= :hi
+        GROUP BY c.user_id, ci.record_id
+    ) d
+    GROUP BY d.user_id
+    UNION ALL
+    SELECT gen_random_uuid(), s.user_id, :today, 0, 0, NOW()
+    FROM (
+        SELECT DISTINCT ON (user_id) user_id, total_value_rub, items_count
+        FROM collection_value_snapshots
+        WHERE user_id > :lo AND user_id <= :hi
+        ORDER BY user_id, snapshot_date DESC
+    ) s
+    WHERE (s.total_value_rub <> 0 OR s.items_count <> 0)
+      AND NOT EXISTS (
+          SELECT 1 FROM collections c
+          JOIN collection_items ci ON ci.collection_id = c.id
+          WHERE c.user_id = s.user_id
+      )
+    ON CONFLICT (user_id, snapshot_date) DO UPDATE SET
+        total_value_rub = excluded.total_value_rub,
+        items_count = excluded.items_count
+    """
+)
+
+
 async def record_daily_snapshots():
     """
     Записывает дневной снапшот стоимости коллекции для каждого пользователя.
     UPSERT на (user_id, snapshot_date) — повторный запуск перетирает значение.
+
+    Пачками по диапазонам user_id (keyset по users.id): на пачку — один
+    INSERT ... SELECT ... ON CONFLICT и свой commit. Упавшая пачка не
+    откатывает уже записанные.
     """
     today = date.today()
     rate = await get_usd_rub_rate()
 
+    users = written = failed = 0
+    lo = uuid.UUID(int=0)
     async with async_session_maker() as db:
-        try:
-            # DISTINCT по record_id: пластинка может лежать в общей коллекции
-            # и в папках одновременно — не дублируем её в снапшоте стоимости.
-            dedup = (
-                select(
-                    Collection.user_id.label("user_id"),
-                    CollectionItem.record_id.label("record_id"),
-                    func.max(Record.estimated_price_median).label("price_usd"),
-                )
-                .select_from(Collection)
-                .join(CollectionItem, CollectionItem.collection_id == Collection.id)
-                .join(Record, Record.id == CollectionItem.record_id)
-                .group_by(Collection.user_id, CollectionItem.record_id)
-                .subquery()
+        while True:
+            res = await db.execute(
+                text("SELECT id FROM users WHERE id > :after ORDER BY id LIMIT :n"),
+                {"after": lo, "n": SNAPSHOT_CHUNK},
             )
-            stmt = (
-                select(
-                    dedup.c.user_id.label("user_id"),
-                    func.coalesce(func.sum(dedup.c.price_usd), 0).label("value_usd"),
-                    func.count(dedup.c.record_id).label("items_count"),
-                )
-                .group_by(dedup.c.user_id)
-            )
-            result = await db.execute(stmt)
-            rows = result.all()
-
-            for row in rows:
-                value_rub = Decimal(str(float(row.value_usd or 0) * rate)).quantize(Decimal("0.01"))
-                stmt_upsert = pg_insert(CollectionValueSnapshot).values(
-                    user_id=row.user_id,
-                    snapshot_date=today,
-                    total_value_rub=value_rub,
-                    items_count=row.items_count or 0,
-                ).on_conflict_do_update(
-                    index_elements=["user_id", "snapshot_date"],
-                    set_={
-                        "total_value_rub": value_rub,
-                        "items_count": row.items_count or 0,
+            ids = res.scalars().all()
+            if not ids:
+                break
+            hi = ids[-1]
+            try:
+                result = await db.execute(
+                    _UPSERT_SNAPSHOTS,
+                    {
+                        "today": today,
+                        "rate": Decimal(str(rate)),
+                        "lo": lo,
+                        "hi": hi,
                     },
                 )
-                await db.execute(stmt_upsert)
+                await db.commit()
+                written += result.rowcount or 0
+            except Exception as e:
+                await db.rollback()
+                failed += len(ids)
+                logger.error(f"Ошибка в record_daily_snapshots (users {lo}..{hi}): {e}")
+            users += len(ids)
+            lo = hi
 
-            await db.commit()
-            logger.info(f"Снапшоты стоимости записаны: {len(rows)} пользователей, дата={today}")
-        except Exception as e:
-            await db.rollback()
-            logger.error(f"Ошибка в record_daily_snapshots: {e}")
+    logger.info(
+        f"Снапшоты стоимости записаны: {written} из {users} пользователей"
+        f"{f', ошибок: {failed}' if failed else ''}, дата={today}"
+    )
@@ -1,13 +1,14 @@
 """
 Web-маршруты для публичных страниц (HTML, не API)
 """
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import select, func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -27,6 +28,13 @@ from app.models.store_listing import StoreListing, ListingStatus
 from app.api.profile import get_public_profile_payload, _get_top_expensive, _get_new_releases
 from app.services.exchange import get_usd_rub_rate
 from app.services.pricing import PricingParams, estimate_rub
+from app.services.public_profile_cache import (
+    PROFILE_TABS,
+    etag_matches,
+    get_cached_page,
+    record_profile_view,
+    store_pages,
+)
 from app.services.valuation import get_monthly_delta
 
 logger = logging.getLogger(__name__)
@@ -175,39 +183,49 @@ async def public_profile_page(
     tab: str = "collection",
     db: AsyncSession = Depends(get_db)
 ):
-    """Публичная страница профиля с OG-тегами"""
-    # Получаем пользователя с ProfileShare
-    result = await db.execute(
-        select(User)
-        .where(User.username == username, User.is_active == True)
-        .options(selectinload(User.profile_share))
-    )
-    user = result.scalar_one_or_none()
+    """Публичная страница профиля с OG-тегами.
 
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
+    HTML кэшируется на (username, tab), см. app/services/public_profile_cache.py:
+    горячий профиль — один GET из Redis, повторный заход браузера — 304 по ETag.
+    Просмотры копятся в буфере и сбрасываются в БД пачкой.
+    """
+    active_tab = tab if tab in PROFILE_TABS else "collection"
+    page = await get_cached_page(username, active_tab)
+    if page is None:
+        # Получаем пользователя с ProfileShare
+        result = await db.execute(
+            select(User)
+            .where(User.username == username, User.is_active == True)
+            .options(selectinload(User.profile_share))
+        )
+        user = result.scalar_one_or_none()
 
-    profile = user.profile_share
-    if not profile or not profile.is_active:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Профиль не активирован")
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Пользователь не найден")
 
-    # Инкремент просмотров
-    profile.view_count += 1
-    await db.commit()
+        profile = user.profile_share
+        if not profile or not profile.is_active:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Профиль не активирован")
+
+        # View model считается один раз — рендерим сразу обе вкладки
+        context = await _build_profile_context(user, profile, db)
+        template = templates.get_template("public_profile.html")
+        pages = {
+            t: template.render({**context, "request": request, "active_tab": t})
+            for t in PROFILE_TABS
+        }
+        page = (await store_pages(username, user.id, pages))[active_tab]
+
+    await record_profile_view(db, UUID(page["user_id"]))
+
+    headers = {"ETag": page["etag"], "Cache-Control": "public, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), page["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return HTMLResponse(page["html"], headers=headers)
 
-    # Эмиссия события ачивок (K5/K6)
-    try:
-        from app.services.achievements import emit_event
-        from app.services.achievements.events import PROFILE_VIEW
-        await emit_event(
-            db,
-            user.id,
-            PROFILE_VIEW,
-            {"view_count": profile.view_count},
-        )
-    except Exception:  # noqa: BLE001
-        pass  # web-страница не должна падать из-за ачивок
 
+async def _build_profile_context(user: User, profile: ProfileShare, db: AsyncSession) -> dict:
+    """View model публичной страницы — всё, кроме request и active_tab."""
     # === Статистика ===
     # Считаем уникальные пластинки (distinct record_id), чтобы не дублировать
     # одну и ту же пластинку из разных папок — мобила показывает дефолт-папку,
@@ -650,8 +668,7 @@ async def public_profile_page(
             return []
         return offers_by_record.get(record.id, [])
 
-    return templates.TemplateResponse("public_profile.html", {
-        "request": request,
+    return {
         "user": user,
         "profile": profile,
         "collection_count": collection_count,
@@ -666,21 +683,24 @@ async def public_profile_page(
         "highlights": highlights,
         "collection_items": collection_items,
         "wishlist_items": wishlist_items,
-        "active_tab": tab if tab in ("collection", "wishlist") else "collection",
         "og_description": og_description,
         "base_url": BASE_URL,
         "usd_rub_rate": float(usd_rub_rate),
         "compute_rub": compute_rub,
         "offers_for": offers_for,
-    })
+    }
+
+
+_OG_COVER_MISSING_NS = "og_cover_missing"
 
 
 @router.get("/@{username}/og-image.png")
 async def profile_og_image(
     username: str,
+    request: Request,
     db: AsyncSession = Depends(get_db)
 ):
-    """Динамическое OG-изображение профиля"""
+    """Динамическое OG-изображение профиля (дисковый кэш по хэшу входов)"""
     result = await db.execute(
         select(User)
         .where(User.username == username, User.is_active == True)
@@ -709,50 +729,78 @@ async def profile_og_image(
         )
         collection_value = round(float(value_result), 2) if value_result else None
 
-    # Обложки избранных пластинок
-    cover_urls = []
+    # Обложки избранных пластинок — одним запросом, в порядке highlights
+    covers: list[tuple[str | None, str | None]] = []
     if profile.highlight_record_ids:
-        for record_id in profile.highlight_record_ids[:4]:
-            rec_result = await db.execute(
-                select(Record.cover_image_url).where(Record.id == record_id)
-            )
-            url = rec_result.scalar_one_or_none()
-            if url:
-                cover_urls.append(url)
+        highlight_ids = profile.highlight_record_ids[:4]
+        result = await db.execute(
+            select(Record.id, Record.cover_local_path, Record.cover_image_url)
+            .where(Record.id.in_(highlight_ids), Record.cover_image_url.isnot(None))
+        )
+        by_id = {row.id: (row.cover_local_path, row.cover_image_url) for row in result.all()}
+        covers = [by_id[rid] for rid in highlight_ids if rid in by_id]
 
     # Если нет highlights — берём последние из коллекции
-    if len(cover_urls) < 4:
+    if len(covers) < 4:
         result = await db.execute(
-            select(Record.cover_image_url)
+            select(Record.cover_local_path, Record.cover_image_url)
             .join(CollectionItem, CollectionItem.record_id == Record.id)
             .join(Collection)
             .where(Collection.user_id == user.id, Record.cover_image_url.isnot(None))
             .order_by(CollectionItem.added_at.desc())
-            .limit(4 - len(cover_urls))
+            .limit(4 - len(covers))
         )
-        for row in result.scalars().all():
-            cover_urls.append(row)
-
-    try:
-        from app.services.og_image import generate_profile_og_image
+        covers.extend((row.cover_local_path, row.cover_image_url) for row in result.all())
+
+    from app.services.cache import TTL_OG_COVER_MISSING, cache
+    from app.services.og_image import OG_RENDER_VERSION, load_cover_bytes, render_profile_og_image
+    from app.services.render_cache import get_or_render, png_response, render_key
+
+    # Обложки, которые недавно не скачались (404 и т.п.), входят в ключ как
+    # «missing» и не качаются: рендер с плейсхолдером сохраняется под этим
+    # ключом, пока отметка не истечёт — потом ещё одна попытка
+    missing = await cache.get_many(_OG_COVER_MISSING_NS, [url for _, url in covers])
+    key = render_key("og_profile", {
+        "v": OG_RENDER_VERSION,
+        "username": user.username,
+        "display_name": user.display_name,
+        "count": collection_count,
+        "value": collection_value,
+        "covers": [f"missing:{url}" if url in missing else url for _, url in covers],
+    })
 
-        image_bytes = await generate_profile_og_image(
+    async def render() -> tuple[bytes, bool]:
+        to_load = [
+            (local_path, None if url in missing else url) for local_path, url in covers
+        ]
+        cover_bytes = await load_cover_bytes(to_load)
+        failed = {
+            url: True
+            for (_, url), data in zip(covers, cover_bytes)
+            if data is None and url not in missing
+        }
+        if failed:
+            await cache.set_many(_OG_COVER_MISSING_NS, failed, TTL_OG_COVER_MISSING)
+        png = await asyncio.to_thread(
+            render_profile_og_image,
             username=user.username,
             display_name=user.display_name,
             collection_count=collection_count,
             collection_value=collection_value,
-            cover_urls=cover_urls,
+            covers=cover_bytes,
         )
+        # Новый сбой — ключ посчитан без него; следующий запрос уже придёт
+        # с «missing» в ключе и сохранит рендер
+        return png, not failed
 
-        return StreamingResponse(
-            image_bytes,
-            media_type="image/png",
-            headers={"Cache-Control": "public, max-age=3600"}
-        )
+    try:
+        rendered = await get_or_render("og_profile", key, render)
     except Exception as e:
         logger.error(f"OG image generation failed: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    return png_response(request, rendered, key, "public, max-age=3600")
+
 
 @router.get("/cancel/{booking_id}", response_class=HTMLResponse)
 async def cancel_booking_page(